@@ -0,0 +1,181 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import logging
+import time
+import weakref
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib
+
+log = logging.getLogger(__name__)
+
+
+class TabActivityMonitor:
+    """Highlight the background tabs of a notebook whose terminals produce output.
+
+    Only the terminals of the background tabs not highlighted yet listen to
+    `contents-changed`: as soon as a tab is highlighted its terminals stop
+    listening, and they listen again when the tab loses the focus.
+
+    While a tab is highlighted, its terminals listen again once per
+    SAMPLE_INTERVAL, just long enough to know whether they are still
+    producing output. This gives the activity rate of the tab
+    (`get_activity_rate`), between 0 (idle) and 1 (output all the time).
+
+    The labels are updated once per frame, whatever the number of tabs
+    becoming active during that frame.
+    """
+
+    SAMPLE_INTERVAL = 1.0
+    # Weight of the last sample in the activity rate
+    SMOOTHING = 0.5
+
+    def __init__(self, notebook, enabled=False):
+        self.notebook = notebook
+        self.enabled = enabled
+        self._handlers = weakref.WeakKeyDictionary()  # GuakeTerminal -> handler id
+        # RootTerminalBox -> {"rate": float, "hit": bool}
+        self._active = weakref.WeakKeyDictionary()
+        self._pending_labels = weakref.WeakSet()
+        self._sample_id = None
+        self._tick_id = None
+
+    def _get_page(self, terminal):
+        return self.notebook.guake.notebook_manager.get_root_box_by_terminal(terminal)
+
+    def _is_current(self, page):
+        return self.notebook.get_nth_page(self.notebook.get_current_page()) is page
+
+    def watch(self, terminal):
+        if terminal not in self._handlers:
+            self._handlers[terminal] = terminal.connect(
+                "contents-changed", self.on_contents_changed
+            )
+
+    def unwatch(self, terminal):
+        handler_id = self._handlers.pop(terminal, None)
+        if handler_id is not None:
+            terminal.disconnect(handler_id)
+
+    def watch_page(self, page):
+        for terminal in page.iter_terminals():
+            self.watch(terminal)
+
+    def unwatch_page(self, page):
+        for terminal in page.iter_terminals():
+            self.unwatch(terminal)
+
+    def terminal_attached(self, terminal):
+        page = self._get_page(terminal)
+        if self.enabled and page is not None and page not in self._active:
+            if not self._is_current(page):
+                self.watch(terminal)
+
+    def on_contents_changed(self, terminal):
+        page = self._get_page(terminal)
+        if page is None:
+            self.unwatch(terminal)
+            return
+        if self._is_current(page):
+            self.unwatch_page(page)
+            return
+        if time.monotonic() < getattr(page, "activity_ignore_until", 0):
+            return
+        state = self._active.get(page)
+        if state is None:
+            self._active[page] = {"rate": self.SMOOTHING, "hit": True}
+            self._queue_label_update(page)
+            self.notebook.emit_event("activity-detected", self.notebook.page_num(page))
+        else:
+            state["hit"] = True
+        self.unwatch_page(page)
+        if self._sample_id is None:
+            self._sample_id = GLib.timeout_add(int(self.SAMPLE_INTERVAL * 1000), self._on_sample)
+
+    def _on_sample(self):
+        for page, state in list(self._active.items()):
+            sample = 1.0 if state["hit"] else 0.0
+            state["rate"] += self.SMOOTHING * (sample - state["rate"])
+            state["hit"] = False
+            # Listen again, until the next output of the tab
+            self.watch_page(page)
+        if self._active:
+            return True
+        self._sample_id = None
+        return False
+
+    def _queue_label_update(self, page):
+        self._pending_labels.add(page)
+        if self._tick_id is None:
+            self._tick_id = self.notebook.add_tick_callback(self._on_tick)
+
+    def _on_tick(self, widget, frame_clock):
+        self._tick_id = None
+        pages, self._pending_labels = list(self._pending_labels), weakref.WeakSet()
+        for page in pages:
+            self._set_label_activity(page, page in self._active)
+        return False
+
+    def _set_label_activity(self, page, active):
+        label = self.notebook.get_tab_label(page)
+        if hasattr(label, "set_activity"):
+            label.set_activity(active)
+
+    def on_switch_page(self, previous_page, page):
+        """`page` becomes the current page, `previous_page` a background one"""
+        self._active.pop(page, None)
+        self._pending_labels.discard(page)
+        self._set_label_activity(page, False)
+        self.unwatch_page(page)
+        if (
+            self.enabled
+            and previous_page is not None
+            and previous_page is not page
+            and previous_page.get_parent() is self.notebook
+            and previous_page not in self._active
+        ):
+            self.watch_page(previous_page)
+
+    def get_activity_rate(self, page):
+        """Returns how much `page` produced output recently, between 0 and 1"""
+        state = self._active.get(page)
+        return state["rate"] if state is not None else 0.0
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        if enabled:
+            for page in self.notebook.iter_pages():
+                if not self._is_current(page):
+                    self.watch_page(page)
+            return
+        for terminal in list(self._handlers):
+            self.unwatch(terminal)
+        self._active.clear()
+        self._pending_labels = weakref.WeakSet()
+        self.clear_all()
+
+    def clear_all(self):
+        """Remove the highlight from all the tabs"""
+        for page in self.notebook.iter_pages():
+            self._set_label_activity(page, False)
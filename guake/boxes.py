@@ -1,5 +1,5 @@
 import logging
-import time
+import os
 
 import gi
 
@@ -196,9 +196,12 @@ class RootTerminalBox(Gtk.Overlay, TerminalHolder):
     def get_root_box(self):
         return self
 
-    def save_box_layout(self, box, panes: list):
+    def save_box_layout(self, box, panes: list, terminal_pane=None):
         """Save box layout with pre-order traversal, it should result `panes` with
         a full binary tree in list.
+
+        `terminal_pane` may be given to provide the pane of a terminal (e.g. from
+        a cache), otherwise it is built from the terminal itself.
         """
         if not box:
             panes.append({"type": None, "directory": None})
@@ -206,9 +209,12 @@ class RootTerminalBox(Gtk.Overlay, TerminalHolder):
         if isinstance(box, DualTerminalBox):
             btype = "dual" + ("_h" if box.orient is DualTerminalBox.ORIENT_V else "_v")
             panes.append({"type": btype, "directory": None})
-            self.save_box_layout(box.get_child1(), panes)
-            self.save_box_layout(box.get_child2(), panes)
+            self.save_box_layout(box.get_child1(), panes, terminal_pane)
+            self.save_box_layout(box.get_child2(), panes, terminal_pane)
         elif isinstance(box, TerminalBox):
+            if terminal_pane is not None:
+                panes.append(terminal_pane(box.terminal))
+                return
             btype = "term"
             directory = box.terminal.get_current_directory()
             panes.append(
@@ -220,39 +226,16 @@ class RootTerminalBox(Gtk.Overlay, TerminalHolder):
             )
 
     def restore_box_layout(self, box, panes: list):
-        """Restore box layout by `panes`"""
+        """Restore box layout by `panes`
+
+        This never waits for the boxes to be allocated: the position of the
+        splits is applied by the DualTerminalBox when it gets its size.
+        """
         if not panes or not isinstance(panes, list) or not box or not isinstance(box, TerminalBox):
             return
 
         cur = panes.pop(0)
         if cur["type"].startswith("dual"):
-            while True:
-                if self.guake:
-                    # If Guake is not visible, we should pending the restore, then do the
-                    # restore when Guake is visible again.
-                    #
-                    # Otherwise we will stuck in the infinite loop, since new DualTerminalBox
-                    # cannot get any allocation when Guake is invisible
-                    if (
-                        not self.guake.window.get_property("visible")
-                        or self.get_notebook()
-                        is not self.guake.notebook_manager.get_current_notebook()
-                    ):
-                        panes.insert(0, cur)
-                        self.guake._failed_restore_page_split.append((self, box, panes))
-                        return
-
-                # UI didn't update, wait for it
-                alloc = box.get_allocation()
-                if alloc.width == 1 and alloc.height == 1:
-                    time.sleep(0.01)
-                else:
-                    break
-
-                # Waiting for UI update..
-                while Gtk.events_pending():
-                    Gtk.main_iteration()
-
             if cur["type"].endswith("v"):
                 box = box.split_v_no_save()
             else:
@@ -262,6 +245,7 @@ class RootTerminalBox(Gtk.Overlay, TerminalHolder):
         else:
             if box.terminal:
                 term = box.terminal
+                self.guake.notebook_manager.unregister_terminal(term)
                 # Remove signal handler from terminal
                 for i in term.handler_ids:
                     term.disconnect(i)
@@ -276,6 +260,35 @@ class RootTerminalBox(Gtk.Overlay, TerminalHolder):
             box.set_terminal(term)
             self.get_notebook().terminal_attached(term)
 
+    def build_layout(self, box, pane, terminals: list):
+        """Build the `pane` of a layout (see guake.layout) into the empty `box`,
+        the terminals created are appended to `terminals`, in pre-order"""
+        if "split" in pane:
+            if pane["split"] == "vertical":
+                dual_box = box.split_v_no_save(pane["percentage"], spawn=False)
+            else:
+                dual_box = box.split_h_no_save(pane["percentage"], spawn=False)
+            self.build_layout(dual_box.get_child1(), pane["panes"][0], terminals)
+            self.build_layout(dual_box.get_child2(), pane["panes"][1], terminals)
+            return
+
+        directory = pane["directory"]
+        if directory:
+            directory = os.path.expanduser(directory)
+        notebook = self.get_notebook()
+        term = notebook.terminal_spawn(directory)
+        box.set_terminal(term)
+        # The colors are Gdk.RGBA here, see Guake.apply_layout
+        if pane["fgcolor"] is not None:
+            term.set_color_foreground_custom(pane["fgcolor"])
+        if pane["bgcolor"] is not None:
+            term.set_color_background_custom(pane["bgcolor"])
+        notebook.terminal_attached(term)
+        command = pane["command"]
+        if command:
+            term.when_spawned(lambda terminal: terminal.execute_command(command))
+        terminals.append(term)
+
     def set_last_terminal_focused(self, terminal):
         self.last_terminal_focused = terminal
         self.get_notebook().set_last_terminal_focused(terminal)
@@ -409,7 +422,9 @@ class TerminalBox(Gtk.Box, TerminalHolder):
         """Packs the scrollbar."""
         adj = self.terminal.get_vadjustment()
         self.scroll = Gtk.Scrollbar.new(Gtk.Orientation.VERTICAL, adj)
-        self.scroll.show()
+        # Only shown according to use-scrollbar, never by a show_all of its parents
+        self.scroll.set_no_show_all(True)
+        self.scroll.set_visible(self.terminal.guake.settings.general.cached.use_scrollbar)
         self.pack_start(self.scroll, False, False, 0)
 
         self.terminal.handler_ids.append(
@@ -458,35 +473,36 @@ class TerminalBox(Gtk.Box, TerminalHolder):
     def split_v(self, split_percentage: int = 50):
         return self.split(DualTerminalBox.ORIENT_H, split_percentage)
 
-    def split_h_no_save(self, split_percentage: int = 50):
-        return self.split_no_save(DualTerminalBox.ORIENT_V, split_percentage)
+    def split_h_no_save(self, split_percentage: int = 50, spawn=True):
+        return self.split_no_save(DualTerminalBox.ORIENT_V, split_percentage, spawn)
 
-    def split_v_no_save(self, split_percentage: int = 50):
-        return self.split_no_save(DualTerminalBox.ORIENT_H, split_percentage)
+    def split_v_no_save(self, split_percentage: int = 50, spawn=True):
+        return self.split_no_save(DualTerminalBox.ORIENT_H, split_percentage, spawn)
 
     @save_tabs_when_changed
     def split(self, orientation, split_percentage: int = 50):
         self.split_no_save(orientation, split_percentage)
 
-    def split_no_save(self, orientation, split_percentage: int = 50):
+    def split_no_save(self, orientation, split_percentage: int = 50, spawn=True):
+        """Split this box in two, the second half gets a new terminal unless
+        `spawn` is False, in which case it must be set by the caller."""
         notebook = self.get_notebook()
         parent = self.get_parent()  # RootTerminalBox
 
-        if orientation == DualTerminalBox.ORIENT_H:
-            position = self.get_allocation().width * ((100 - split_percentage) / 100)
-        else:
-            position = self.get_allocation().height * ((100 - split_percentage) / 100)
-
         terminal_box = TerminalBox()
-        terminal = notebook.terminal_spawn()
-        terminal_box.set_terminal(terminal)
+        terminal = None
+        if spawn:
+            terminal = notebook.terminal_spawn()
+            terminal_box.set_terminal(terminal)
         dual_terminal_box = DualTerminalBox(orientation)
-        dual_terminal_box.set_position(position)
+        dual_terminal_box.set_position_percentage(100 - split_percentage, self.get_allocation())
         parent.replace_child(self, dual_terminal_box)
         dual_terminal_box.set_child_first(self)
         dual_terminal_box.set_child_second(terminal_box)
         terminal_box.show()
         dual_terminal_box.show()
+        if terminal is None:
+            return dual_terminal_box
         if self.terminal is not None:
             # preserve font and font_scale in the new terminal
             terminal.set_font(self.terminal.font)
@@ -519,6 +535,7 @@ class TerminalBox(Gtk.Box, TerminalHolder):
     def on_terminal_exited(self, terminal, status):
         if not self.get_parent():
             return
+        self.get_guake().notebook_manager.unregister_terminal(terminal)
         self.get_parent().remove_dead_child(self)
 
     def on_button_press(self, target, event, user_data):
@@ -567,6 +584,39 @@ class DualTerminalBox(Gtk.Paned, TerminalHolder):
             self.set_orientation(orientation=Gtk.Orientation.HORIZONTAL)
         else:
             self.set_orientation(orientation=Gtk.Orientation.VERTICAL)
+        self._pending_position_percentage = None
+        self._size_allocate_id = None
+
+    def set_position_percentage(self, percentage, allocation):
+        """Set the position of the separator to `percentage` of `allocation`.
+
+        When the split happens before the box got any size (e.g. while
+        restoring tabs of an hidden window or workspace), the position is
+        applied on the first real allocation instead of waiting for it.
+        """
+        if allocation.width > 1 and allocation.height > 1:
+            size = (
+                allocation.width if self.orient == DualTerminalBox.ORIENT_H else allocation.height
+            )
+            self.set_position(size * percentage / 100)
+            return
+        self._pending_position_percentage = percentage
+        if self._size_allocate_id is None:
+            self._size_allocate_id = self.connect("size-allocate", self.on_first_size_allocate)
+
+    def on_first_size_allocate(self, widget, allocation):
+        if allocation.width <= 1 or allocation.height <= 1:
+            return
+        self.disconnect(self._size_allocate_id)
+        self._size_allocate_id = None
+        percentage = self._pending_position_percentage
+        self._pending_position_percentage = None
+        # Changing the position while being allocated would be ignored by Gtk
+        GLib.idle_add(self._apply_pending_position, percentage, allocation)
+
+    def _apply_pending_position(self, percentage, allocation):
+        self.set_position_percentage(percentage, allocation)
+        return False
 
     def set_child_first(self, terminal_holder):
         if isinstance(terminal_holder, TerminalHolder):
@@ -623,6 +673,7 @@ class DualTerminalBox(Gtk.Paned, TerminalHolder):
 
     @save_tabs_when_changed
     def remove_dead_child(self, child):
+        self.get_guake().session_model.page_changed(self.get_root_box())
         if self.get_child1() is child:
             living_child = self.get_child2()
             self.remove(living_child)
@@ -662,6 +713,7 @@ class TabLabelEventBox(Gtk.EventBox):
         self.box.pack_end(self.close_button, False, False, 0)
         self.add(self.box)
         self.connect("button-press-event", self.on_button_press, self.label)
+        self.show()
 
     def set_text(self, text):
         self._text = text
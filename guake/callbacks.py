@@ -6,7 +6,6 @@ from gi.repository import Gtk
 from guake.about import AboutDialog
 from guake.dialogs import SaveTerminalDialog
 from guake.globals import ENGINES
-from guake.prefs import PrefsDialog
 from guake.utils import FullscreenManager
 from guake.utils import HidePrevention
 from guake.utils import get_server_time
@@ -38,6 +37,12 @@ class TerminalContextMenuCallbacks:
     def on_save_to_file(self, *args):
         SaveTerminalDialog(self.terminal, self.window).run()
 
+    def on_toggle_logging(self, menu_item):
+        if menu_item.get_active():
+            self.terminal.start_logging()
+        else:
+            self.terminal.stop_logging()
+
     def on_reset_terminal(self, *args):
         self.terminal.reset(True, True)
 
@@ -78,6 +83,8 @@ class TerminalContextMenuCallbacks:
 
     def on_show_preferences(self, *args):
         self.notebook.guake.hide()
+        from guake.prefs import PrefsDialog  # pylint: disable=import-outside-toplevel
+
         PrefsDialog(self.settings).show()
 
     def on_show_about(self, *args):
@@ -0,0 +1,121 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import sys
+
+from gi.repository import GLib
+from gi.repository import Gio
+
+# Minimal D-Bus client of a running Guake, for the most common command lines
+# (`guake`, `guake -t`, bound to a key by many users). Only Gio is imported
+# here: neither GTK, Vte, dbus-python nor argparse.
+
+# Same as in guake.dbusiface, which cannot be imported without dbus-python
+DBUS_NAME = "org.guake3.RemoteControl"
+DBUS_PATH = "/org/guake3/RemoteControl"
+DBUS_INTERFACE = DBUS_NAME
+
+# Command line -> methods to call, the same ones guake.main would call when
+# Guake is already running
+FAST_COMMANDS = {
+    (): ("show_hide",),
+    ("-t",): ("show_hide",),
+    ("--toggle-visibility",): ("show_hide",),
+    ("-f",): ("fullscreen", "show_hide"),
+    ("--fullscreen",): ("fullscreen", "show_hide"),
+    ("--unfullscreen",): ("unfullscreen", "show_hide"),
+    ("--show",): ("show_from_remote", "show_hide"),
+    ("--hide",): ("hide_from_remote", "show_hide"),
+    ("--is-visible",): ("get_visibility",),
+    ("-p",): ("show_prefs",),
+    ("--preferences",): ("show_prefs",),
+    ("-a",): ("show_about",),
+    ("--about",): ("show_about",),
+    ("-q",): ("quit",),
+    ("--quit",): ("quit",),
+}
+
+TIMEOUT = 5000  # ms
+
+
+class GuakeNotRunning(Exception):
+    pass
+
+
+def call_remote(method, connection=None):
+    """Call `method` of the running Guake, returns its result (or None).
+
+    Raises GuakeNotRunning if there is no Guake on the session bus. Guake
+    is not started by D-Bus activation.
+    """
+    if connection is None:
+        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+    try:
+        reply = connection.call_sync(
+            DBUS_NAME,
+            DBUS_PATH,
+            DBUS_INTERFACE,
+            method,
+            None,
+            None,
+            Gio.DBusCallFlags.NO_AUTO_START,
+            TIMEOUT,
+            None,
+        )
+    except GLib.Error as e:  # pylint: disable=catching-non-exception
+        if e.matches(Gio.DBusError.quark(), Gio.DBusError.SERVICE_UNKNOWN):
+            raise GuakeNotRunning() from e
+        if method == "quit":
+            # Guake may exit before it replies
+            return None
+        raise
+    result = reply.unpack()
+    return result[0] if result else None
+
+
+def run_fast_command(args):
+    """Run the command line `args` with call_remote if it can be, returns
+    False if it must be run by guake.main (unknown command line, Guake not
+    running or no session bus)."""
+    methods = FAST_COMMANDS.get(tuple(args))
+    if methods is None:
+        return False
+    try:
+        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        for method in methods:
+            result = call_remote(method, connection)
+            if method == "get_visibility":
+                sys.stdout.write(f"{result}\n")
+    except (GuakeNotRunning, GLib.Error):  # pylint: disable=catching-non-exception
+        return False
+    return True
+
+
+def main():
+    """Entry point of the `guake` command: only this module is imported when
+    the command line is run by call_remote, guake.main otherwise"""
+    if run_fast_command(sys.argv[1:]):
+        return
+    from guake.main import run_main  # pylint: disable=import-outside-toplevel
+
+    run_main()
+
+
+if __name__ == "__main__":
+    main()
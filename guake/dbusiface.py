@@ -24,6 +24,8 @@ import dbus
 import dbus.glib
 import dbus.service
 
+from guake.events import SIGNALS
+
 log = logging.getLogger(__name__)
 
 dbus.glib.threads_init()
@@ -33,11 +35,56 @@ DBUS_NAME = "org.guake3.RemoteControl"
 
 
 class DbusManager(dbus.service.Object):
-    def __init__(self, guakeinstance):
+    def __init__(self, guakeinstance, bus=None):
         self.guake = guakeinstance
-        self.bus = dbus.SessionBus()
+        self.bus = bus if bus is not None else dbus.SessionBus()
         bus_name = dbus.service.BusName(DBUS_NAME, bus=self.bus)
         super().__init__(bus_name, DBUS_PATH)
+        # The events of Guake are sent as the D-Bus signals of the same name,
+        # so the status bars and scripts can follow them instead of polling
+        for name in SIGNALS:
+            signal = getattr(self, name.replace("-", "_"))
+            self.guake.events.connect(name, lambda events, *args, signal=signal: signal(*args))
+
+    # Signals
+
+    @dbus.service.signal(DBUS_NAME, signature="ii")
+    def tab_added(self, workspace, tab_index):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="ii")
+    def tab_closed(self, workspace, tab_index):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="iis")
+    def tab_renamed(self, workspace, tab_index, label):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="si")
+    def terminal_spawned(self, terminal_uuid, pid):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="si")
+    def terminal_exited(self, terminal_uuid, status):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="b")
+    def visibility_changed(self, visible):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="ss")
+    def cwd_changed(self, terminal_uuid, directory):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="ii")
+    def activity_detected(self, workspace, tab_index):
+        pass
+
+    @dbus.service.signal(DBUS_NAME, signature="i")
+    def workspace_switched(self, workspace):
+        pass
+
+    # Methods
 
     @dbus.service.method(DBUS_NAME)
     def show_hide(self):
@@ -215,3 +262,19 @@ class DbusManager(dbus.service.Object):
     @dbus.service.method(DBUS_NAME, in_signature="s", out_signature="i")
     def get_index_from_uuid(self, tab_uuid):
         return self.guake.get_index_from_uuid(tab_uuid)
+
+    @dbus.service.method(DBUS_NAME, in_signature="ss", out_signature="s")
+    def start_logging(self, terminal_uuid, path):
+        """Log the output of a terminal (the current one if `terminal_uuid` is empty)
+        to `path` (a new file in the log directory if empty), returns the path"""
+        return self.guake.start_terminal_logging(terminal_uuid, path)
+
+    @dbus.service.method(DBUS_NAME, in_signature="s")
+    def stop_logging(self, terminal_uuid):
+        self.guake.stop_terminal_logging(terminal_uuid)
+
+    @dbus.service.method(DBUS_NAME, in_signature="s", out_signature="as")
+    def apply_layout(self, layout_json):
+        """Create the tabs described by `layout_json` in one call, returns the
+        UUIDs of their terminals (see guake.layout for the format)"""
+        return [str(terminal.get_uuid()) for terminal in self.guake.apply_layout(layout_json)]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import logging
+
+from gi.repository import GObject
+
+log = logging.getLogger(__name__)
+
+# Signal name -> types of its arguments. Only simple types, so they can be
+# sent as they are over D-Bus (see DbusManager). Tabs are identified by the
+# index of their workspace and their index in it, terminals by their UUID.
+SIGNALS = {
+    "tab-added": (int, int),  # workspace, tab index
+    "tab-closed": (int, int),  # workspace, tab index
+    "tab-renamed": (int, int, str),  # workspace, tab index, label
+    "terminal-spawned": (str, int),  # terminal uuid, pid
+    "terminal-exited": (str, int),  # terminal uuid, exit status
+    "visibility-changed": (bool,),
+    "cwd-changed": (str, str),  # terminal uuid, directory
+    "activity-detected": (int, int),  # workspace, tab index
+    "workspace-switched": (int,),  # workspace
+}
+
+
+class GuakeEvents(GObject.Object):
+    """The changes of the state of Guake, in one place, for whoever wants to
+    follow them (the D-Bus interface)."""
+
+    def __init__(self):
+        GObject.Object.__init__(self)
+        for name, arg_types in SIGNALS.items():
+            if not GObject.signal_lookup(name, self):
+                GObject.signal_new(
+                    name,
+                    self,
+                    GObject.SignalFlags.RUN_LAST,
+                    GObject.TYPE_NONE,
+                    arg_types,
+                )
@@ -20,12 +20,7 @@ Boston, MA 02110-1301 USA
 import logging
 import os
 
-import gi
-
-gi.require_version("Vte", "2.91")  # vte-0.38
-from gi.repository import Gio
-from gi.repository import Pango
-from gi.repository import Vte
+from guake.terminal import MATCHERS
 from guake.utils import RectCalculator
 
 log = logging.getLogger(__name__)
@@ -90,6 +85,36 @@ class GSettingHandler:
         settings.general.onChangedValue("display-tab-names", self.display_tab_names_changed)
         settings.general.onChangedValue("hide-tabs-if-one-tab", self.hide_tabs_if_one_tab_changed)
         settings.general.onChangedValue("display-tab-activity", self.display_tab_activity_changed)
+        settings.general.onChangedValue(
+            "quick-open-user-matchers", self.quick_open_user_matchers_changed
+        )
+        settings.general.onChangedValue("monitor-guake-yml", self.monitor_guake_yml_toggled)
+
+    def apply_terminal_profile(self, user_data):
+        """Apply the terminal settings to the terminal given in `user_data`,
+        or to all the terminals. Only what changed is applied, see
+        TerminalProfileManager.
+        """
+        terminal = (
+            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
+            if user_data
+            else None
+        )
+        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
+        self.guake.terminal_profiles.apply_all(terminals)
+
+    def quick_open_user_matchers_changed(self, settings, key, user_data):
+        """Apply the user quick open matchers to all the terminals"""
+        if not MATCHERS.load_user_matchers(settings) or not settings.get_boolean(
+            "quick-open-enable"
+        ):
+            return
+        for term in self.guake.notebook_manager.iter_terminals():
+            term.match_remove_all()
+            term.add_matches()
+
+    def monitor_guake_yml_toggled(self, settings, key, user_data):
+        self.guake.fm.set_monitor(settings.get_boolean(key))
 
     def custom_command_file_changed(self, settings, key, user_data):
         self.guake.load_custom_commands()
@@ -98,6 +123,9 @@ class GSettingHandler:
         """If the gconf var use_trayicon be changed, this method will
         be called and will show/hide the trayicon.
         """
+        if self.guake.tray_icon is None:
+            # Not created yet, it will apply the setting itself
+            return
         if hasattr(self.guake.tray_icon, "set_status"):
             self.guake.tray_icon.set_status(settings.get_boolean(key))
         else:
@@ -158,25 +186,11 @@ class GSettingHandler:
 
     def cursor_blink_mode_changed(self, settings, key, user_data):
         """Called when cursor blink mode settings has been changed"""
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for term in terminals:
-            term.set_property("cursor-blink-mode", settings.get_int(key))
+        self.apply_terminal_profile(user_data)
 
     def cursor_shape_changed(self, settings, key, user_data):
         """Called when the cursor shape settings has been changed"""
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for term in terminals:
-            term.set_property("cursor-shape", settings.get_int(key))
+        self.apply_terminal_profile(user_data)
 
     def background_image_file_changed(self, settings, key, user_data):
         """Called when the background image file settings has been changed"""
@@ -192,54 +206,17 @@ class GSettingHandler:
         """If the gconf var use_scrollbar be changed, this method will
         be called and will show/hide scrollbars of all terminals open.
         """
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for term in terminals:
-            # There is an hbox in each tab of the main notebook and it
-            # contains a Terminal and a Scrollbar. Since only have the
-            # Terminal here, we're going to use this to get the
-            # scrollbar and hide/show it.
-            hbox = term.get_parent()
-            if hbox is None:
-                continue
-            terminal, scrollbar = hbox.get_children()
-            if settings.get_boolean(key):
-                scrollbar.show()
-            else:
-                scrollbar.hide()
+        self.apply_terminal_profile(user_data)
 
     def history_size_changed(self, settings, key, user_data):
         """If the gconf var history_size be changed, this method will
         be called and will set the scrollback_lines property of all
         terminals open.
         """
-        lines = settings.get_int(key)
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for i in terminals:
-            i.set_scrollback_lines(lines)
+        self.apply_terminal_profile(user_data)
 
     def infinite_history_changed(self, settings, key, user_data):
-        if settings.get_boolean(key):
-            lines = -1
-        else:
-            lines = self.settings.general.get_int("history-size")
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for i in terminals:
-            i.set_scrollback_lines(lines)
+        self.apply_terminal_profile(user_data)
 
     def keystroke_output(self, settings, key, user_data):
         """If the gconf var scroll_output be changed, this method will
@@ -275,87 +252,34 @@ class GSettingHandler:
         default or to the chosen font in style/font/style in all
         terminals open.
         """
-        font_name = None
-        if settings.get_boolean(key):
-            gio_settings = Gio.Settings(schema="org.gnome.desktop.interface")
-            font_name = gio_settings.get_string("monospace-font-name")
-        else:
-            font_name = self.settings.styleFont.get_string("style")
-        if not font_name:
-            log.error("Error: unable to find font name (%s)", font_name)
-            return
-        font = Pango.FontDescription(font_name)
-        if not font:
-            log.error("Error: unable to load font (%s)", font_name)
-            return
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for i in terminals:
-            i.set_font(font)
+        self.apply_terminal_profile(user_data)
 
     def allow_bold_toggled(self, settings, key, user_data):
         """If the gconf var allow_bold is changed, this method will be called
         and will change the VTE terminal o.
         displaying characters in bold font.
         """
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for term in terminals:
-            term.set_allow_bold(settings.get_boolean(key))
+        self.apply_terminal_profile(user_data)
 
     def bold_is_bright_toggled(self, settings, key, user_data):
         """If the dconf var bold_is_bright is changed, this method will be called
         and will change the VTE terminal to toggle auto-brightened bold text.
         """
-        try:
-            terminal = self.guake.notebook_manager.get_terminal_by_uuid(
-                user_data.get("terminal_uuid") if user_data else None
-            )
-            terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-            for term in terminals:
-                term.set_bold_is_bright(settings.get_boolean(key))
-        except:  # pylint: disable=bare-except
-            log.error("set_bold_is_bright not supported by your version of VTE")
+        self.apply_terminal_profile(user_data)
 
     def cell_height_scale_value_changed(self, settings, key, user_data):
         """If the gconf var style/font/cell-height-scale be changed, this
         method will be called and will set terminal height scale properties
         in all terminals.
         """
-        height_scale = settings.get_double(key)
-        try:
-            terminal = self.guake.notebook_manager.get_terminal_by_uuid(
-                user_data.get("terminal_uuid") if user_data else None
-            )
-            terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-            for term in terminals:
-                term.set_cell_height_scale(height_scale)
-        except:  # pylint: disable=bare-except
-            log.error("set_cell_height_scale not supported by your version of VTE")
+        self.apply_terminal_profile(user_data)
 
     def cell_width_scale_value_changed(self, settings, key, user_data):
         """If the gconf var style/font/cell-width-scale be changed, this
         method will be called and will set terminal width scale properties
         in all terminals.
         """
-        width_scale = settings.get_double(key)
-        try:
-            terminal = self.guake.notebook_manager.get_terminal_by_uuid(
-                user_data.get("terminal_uuid") if user_data else None
-            )
-            terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-            for term in terminals:
-                term.set_cell_width_scale(width_scale)
-        except:  # pylint: disable=bare-except
-            log.error("set_cell_width_scale not supported by your version of VTE")
+        self.apply_terminal_profile(user_data)
 
     def palette_font_and_background_color_toggled(self, settings, key, user_data):
         """If the gconf var use_palette_font_and_background_color be changed, this method
@@ -369,81 +293,35 @@ class GSettingHandler:
         will be called and will change the font style in all terminals
         open.
         """
-        terminal_uuid = user_data.get("terminal_uuid") if user_data else None
-
-        if terminal_uuid:
-            terminal = self.guake.notebook_manager.get_terminal_by_uuid(terminal_uuid)
-            terminals = (terminal,) if terminal else ()
-        else:
-            terminals = self.guake.notebook_manager.iter_terminals()
-
-        if self.settings.general.get_boolean("use-default-font"):
-            gio_settings = Gio.Settings(schema="org.gnome.desktop.interface")
-            font_name = gio_settings.get_string("monospace-font-name")
-        else:
-            font_name = settings.get_string(key)
-
-        font = Pango.FontDescription(font_name)
-        for i in terminals:
-            i.set_font(font)
+        self.apply_terminal_profile(user_data)
 
     def fpalette_changed(self, settings, key, user_data):
         """If the gconf var style/font/palette be changed, this method
         will be called and will change the color scheme in all terminals
         open.
         """
-        self.guake.set_colors_from_settings(
-            terminal_uuid=user_data.get("terminal_uuid") if user_data else None
-        )
+        self.apply_terminal_profile(user_data)
 
     def bgtransparency_changed(self, settings, key, user_data):
         """If the gconf var style/background/transparency be changed, this
         method will be called and will set the saturation and transparency
         properties in all terminals open.
         """
-        self.guake.set_background_color_from_settings(
-            terminal_uuid=user_data.get("terminal_uuid") if user_data else None
-        )
-
-    def getEraseBinding(self, str):
-        if str == "auto":
-            return Vte.EraseBinding(0)
-        if str == "ascii-backspace":
-            return Vte.EraseBinding(1)
-        if str == "ascii-delete":
-            return Vte.EraseBinding(2)
-        if str == "delete-sequence":
-            return Vte.EraseBinding(3)
-        if str == "tty":
-            return Vte.EraseBinding(4)
+        self.apply_terminal_profile(user_data)
 
     def backspace_changed(self, settings, key, user_data):
         """If the gconf var compat_backspace be changed, this method
         will be called and will change the binding configuration in
         all terminals open.
         """
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for i in terminals:
-            i.set_backspace_binding(self.getEraseBinding(settings.get_string(key)))
+        self.apply_terminal_profile(user_data)
 
     def delete_changed(self, settings, key, user_data):
         """If the gconf var compat_delete be changed, this method
         will be called and will change the binding configuration in
         all terminals open.
         """
-        terminal = (
-            self.guake.notebook_manager.get_terminal_by_uuid(user_data.get("terminal_uuid"))
-            if user_data
-            else None
-        )
-        terminals = (terminal,) if terminal else self.guake.notebook_manager.iter_terminals()
-        for i in terminals:
-            i.set_delete_binding(self.getEraseBinding(settings.get_string(key)))
+        self.apply_terminal_profile(user_data)
 
     def max_tab_name_length_changed(self, settings, key, user_data):
         """If the gconf var max_tab_name_length be changed, this method will
@@ -478,9 +356,9 @@ class GSettingHandler:
         self.guake.get_notebook().hide_tabbar_if_one_tab()
 
     def display_tab_activity_changed(self, settings, key, user_data):
-        """If the gconf var display-tab-activity was disabled, clear any
-        activity highlights that are currently shown on tabs.
+        """If the gconf var display-tab-activity changed, start or stop
+        watching the terminals; when disabled, clear any activity highlights
+        that are currently shown on tabs.
         """
-        if not settings.get_boolean(key):
-            for notebook in self.guake.notebook_manager.iter_notebooks():
-                notebook.clear_all_tab_activity()
+        for notebook in self.guake.notebook_manager.iter_notebooks():
+            notebook.activity_monitor.set_enabled(settings.get_boolean(key))
@@ -52,6 +52,7 @@ from guake.about import AboutDialog
 from guake.common import gladefile
 from guake.common import pixmapfile
 from guake.dialogs import PromptQuitDialog
+from guake.events import GuakeEvents
 from guake.globals import MAX_TRANSPARENCY
 from guake.globals import NAME
 from guake.globals import PROMPT_ALWAYS
@@ -59,15 +60,25 @@ from guake.globals import PROMPT_PROCESSES
 from guake.globals import TABS_SESSION_SCHEMA_VERSION
 from guake.gsettings import GSettingHandler
 from guake.keybindings import Keybindings
+from guake.layout import LayoutError
+from guake.layout import iter_terminal_panes
+from guake.layout import parse_layout
 from guake.notebook import NotebookManager
 from guake.palettes import PALETTES
+from guake.palettes import get_palette_colors
 from guake.paths import LOCALE_DIR
 from guake.paths import SCHEMA_DIR
 from guake.paths import try_to_compile_glib_schemas
-from guake.prefs import PrefsDialog
-from guake.prefs import refresh_user_start
+from guake.session import SessionModel
+from guake.session import SessionWriter
+from guake.session import TabRestoreQueue
+from guake.session import write_session_file
 from guake.settings import Settings
 from guake.simplegladeapp import SimpleGladeApp
+from guake.startup import PROFILER
+from guake.terminal import MATCHERS
+from guake.terminal_pool import TerminalPool
+from guake.terminal_profile import TerminalProfileManager
 from guake.theme import patch_gtk_theme
 from guake.theme import select_gtk_theme
 from guake.utils import BackgroundImageManager
@@ -108,35 +119,39 @@ class Guake(SimpleGladeApp):
                 SCHEMA_DIR, Gio.SettingsSchemaSource.get_default(), False
             )
 
-        try:
-            schema_source = load_schema()
-        except GLib.Error:  # pylint: disable=catching-non-exception
-            log.exception("Unable to load the GLib schema, try to compile it")
-            try_to_compile_glib_schemas()
-            schema_source = load_schema()
-        self.settings = Settings(schema_source)
-        self.accel_group = None
-
-        if (
-            "schema-version" not in self.settings.general.keys()
-            or self.settings.general.get_string("schema-version") != guake_version()
-        ):
-            log.exception("Schema from old guake version detected, regenerating schema")
+        with PROFILER.phase("settings"):
             try:
+                schema_source = load_schema()
+            except GLib.Error:  # pylint: disable=catching-non-exception
+                log.exception("Unable to load the GLib schema, try to compile it")
                 try_to_compile_glib_schemas()
-            except subprocess.CalledProcessError:
-                log.exception("Schema in non user-editable location, attempting to continue")
-            schema_source = load_schema()
+                schema_source = load_schema()
             self.settings = Settings(schema_source)
-            self.settings.general.set_string("schema-version", guake_version())
+            self.accel_group = None
+
+            if (
+                "schema-version" not in self.settings.general.keys()
+                or self.settings.general.get_string("schema-version") != guake_version()
+            ):
+                log.exception("Schema from old guake version detected, regenerating schema")
+                try:
+                    try_to_compile_glib_schemas()
+                except subprocess.CalledProcessError:
+                    log.exception("Schema in non user-editable location, attempting to continue")
+                schema_source = load_schema()
+                self.settings = Settings(schema_source)
+                self.settings.general.set_string("schema-version", guake_version())
+            # Before any key is written, the migration of the old settings needs it
+            self.settings.check_user_settings()
 
         log.info("Language previously loaded from: %s", LOCALE_DIR)
 
-        super().__init__(gladefile("guake.glade"))
+        with PROFILER.phase("glade and theme"):
+            super().__init__(gladefile("guake.glade"))
 
-        select_gtk_theme(self.settings)
-        patch_gtk_theme(self.get_widget("window-root").get_style_context(), self.settings)
-        self.add_callbacks(self)
+            select_gtk_theme(self.settings)
+            patch_gtk_theme(self.get_widget("window-root").get_style_context(), self.settings)
+            self.add_callbacks(self)
 
         log.info("Guake Terminal %s", guake_version())
         log.info("VTE %s", vte_version())
@@ -145,41 +160,11 @@ class Guake(SimpleGladeApp):
         self.hidden = True
         self.forceHide = False
 
-        # trayicon! Using SVG handles better different OS trays
-        # img = pixmapfile('guake-tray.svg')
-        # trayicon!
-        img = pixmapfile("guake-tray.png")
-        try:
-            try:
-                gi.require_version("AyatanaAppIndicator3", "0.1")
-                from gi.repository import (  # pylint: disable=import-outside-toplevel
-                    AyatanaAppIndicator3 as appindicator,
-                )
-            except (ValueError, ImportError):
-                gi.require_version("AppIndicator3", "0.1")
-                from gi.repository import (  # pylint: disable=import-outside-toplevel
-                    AppIndicator3 as appindicator,
-                )
-        except (ValueError, ImportError):
-            self.tray_icon = Gtk.StatusIcon()
-            self.tray_icon.set_from_file(img)
-            self.tray_icon.set_tooltip_text(_("Guake Terminal"))
-            self.tray_icon.connect("popup-menu", self.show_menu)
-            self.tray_icon.connect("activate", self.show_hide)
-        else:
-            # TODO PORT test this on a system with app indicator
-            self.tray_icon = appindicator.Indicator.new(
-                "guake-indicator", "guake-tray", appindicator.IndicatorCategory.APPLICATION_STATUS
-            )
-            self.tray_icon.set_icon_full("guake-tray", _("Guake Terminal"))
-            self.tray_icon.set_status(appindicator.IndicatorStatus.ACTIVE)
-            menu = self.get_widget("tray-menu")
-            show = Gtk.MenuItem(_("Show"))
-            show.set_sensitive(True)
-            show.connect("activate", self.show_hide)
-            show.show()
-            menu.prepend(show)
-            self.tray_icon.set_menu(menu)
+        # Changes of the state of Guake, followed by the D-Bus interface
+        self.events = GuakeEvents()
+
+        # Created once the window is ready, see run_deferred_startup
+        self.tray_icon = None
 
         self.display_tab_names = 0
 
@@ -190,10 +175,11 @@ class Guake(SimpleGladeApp):
         self.mainframe = self.get_widget("mainframe")
         self.mainframe.remove(self.get_widget("notebook-teminals"))
 
-        # Pending restore for terminal split after show-up
-        #     [(RootTerminalBox, TerminaBox, panes), ...]
-        self.pending_restore_page_split = []
-        self._failed_restore_page_split = []
+        # Layout of the restored tabs, replayed from the main loop
+        self.restore_queue = TabRestoreQueue()
+
+        # Number of tab titles actually recomputed, see on_terminal_title_changed
+        self.title_updates = 0
 
         # BackgroundImageManager
         self.background_image_manager = BackgroundImageManager(self.window)
@@ -202,19 +188,27 @@ class Guake(SimpleGladeApp):
         self.fullscreen_manager = FullscreenManager(self.settings, self.window, self)
 
         # Start the file manager (only used by guake.yml so far).
-        self.fm = FileManager()
+        self.fm = FileManager(monitor=self.settings.general.get_boolean("monitor-guake-yml"))
+
+        # Deferred writer for save-tabs-when-changed
+        self.session_model = SessionModel(self)
+        self.session_writer = SessionWriter(self)
+        self.terminal_profiles = TerminalProfileManager(self)
+        self.terminal_pool = TerminalPool(self)
+        MATCHERS.load_user_matchers(self.settings.general)
 
         # Workspace tracking
-        self.notebook_manager = NotebookManager(
-            self.window,
-            self.mainframe,
-            self.settings.general.get_boolean("workspace-specific-tab-sets"),
-            self.terminal_spawned,
-            self.page_deleted,
-        )
-        self.notebook_manager.connect("notebook-created", self.notebook_created)
-        self.notebook_manager.set_workspace(0)
-        self.set_tab_position()
+        with PROFILER.phase("first tab"):
+            self.notebook_manager = NotebookManager(
+                self.window,
+                self.mainframe,
+                self.settings.general.get_boolean("workspace-specific-tab-sets"),
+                self.terminal_spawned,
+                self.page_deleted,
+            )
+            self.notebook_manager.connect("notebook-created", self.notebook_created)
+            self.notebook_manager.set_workspace(0)
+            self.set_tab_position()
 
         # check and set ARGB for real transparency
         self.update_visual()
@@ -263,21 +257,92 @@ class Guake(SimpleGladeApp):
         self.window.set_type_hint(Gdk.WindowTypeHint.NORMAL)
 
         # loading and setting up configuration stuff
-        GSettingHandler(self)
-        Keybinder.init()
-        self.hotkeys = Keybinder
-        Keybindings(self)
-        self.load_config()
+        with PROFILER.phase("configuration and keybindings"):
+            GSettingHandler(self)
+            Keybinder.init()
+            self.hotkeys = Keybinder
+            Keybindings(self)
+            self.load_config()
 
         if self.settings.general.get_boolean("start-fullscreen"):
             self.fullscreen()
 
-        refresh_user_start(self.settings)
-
         # Restore tabs when startup
         if self.settings.general.get_boolean("restore-tabs-startup"):
-            self.restore_tabs(suppress_notify=True)
+            with PROFILER.phase("restore tabs"):
+                self.restore_tabs(suppress_notify=True)
+
+        PROFILER.mark("window ready")
+        self._deferred_startup = [
+            ("tray icon", self.setup_tray_icon),
+            ("autostart", self.refresh_user_start),
+            ("dconf migration", self.settings.compat),
+            ("startup notification", self.show_startup_popup),
+        ]
+        GLib.idle_add(self.run_deferred_startup, priority=GLib.PRIORITY_LOW)
+        log.info("Guake initialized")
+
+    def run_deferred_startup(self):
+        """Setup what is not needed to show the window, one step per call once
+        the main loop runs, so the first show and the first keys are not delayed."""
+        name, step = self._deferred_startup.pop(0)
+        with PROFILER.phase(name):
+            try:
+                step()
+            except Exception:  # pylint: disable=broad-except
+                # The next steps do not depend on this one
+                log.exception("Startup step %s failed", name)
+        if self._deferred_startup:
+            return True
+        PROFILER.mark("deferred startup done")
+        PROFILER.report()
+        return False
 
+    def setup_tray_icon(self):
+        # trayicon! Using SVG handles better different OS trays
+        # img = pixmapfile('guake-tray.svg')
+        # trayicon!
+        img = pixmapfile("guake-tray.png")
+        try:
+            try:
+                gi.require_version("AyatanaAppIndicator3", "0.1")
+                from gi.repository import (  # pylint: disable=import-outside-toplevel
+                    AyatanaAppIndicator3 as appindicator,
+                )
+            except (ValueError, ImportError):
+                gi.require_version("AppIndicator3", "0.1")
+                from gi.repository import (  # pylint: disable=import-outside-toplevel
+                    AppIndicator3 as appindicator,
+                )
+        except (ValueError, ImportError):
+            self.tray_icon = Gtk.StatusIcon()
+            self.tray_icon.set_from_file(img)
+            self.tray_icon.set_tooltip_text(_("Guake Terminal"))
+            self.tray_icon.connect("popup-menu", self.show_menu)
+            self.tray_icon.connect("activate", self.show_hide)
+        else:
+            # TODO PORT test this on a system with app indicator
+            self.tray_icon = appindicator.Indicator.new(
+                "guake-indicator", "guake-tray", appindicator.IndicatorCategory.APPLICATION_STATUS
+            )
+            self.tray_icon.set_icon_full("guake-tray", _("Guake Terminal"))
+            self.tray_icon.set_status(appindicator.IndicatorStatus.ACTIVE)
+            menu = self.get_widget("tray-menu")
+            show = Gtk.MenuItem(_("Show"))
+            show.set_sensitive(True)
+            show.connect("activate", self.show_hide)
+            show.show()
+            menu.prepend(show)
+            self.tray_icon.set_menu(menu)
+
+        self.settings.general.triggerOnChangedValue(self.settings.general, "use-trayicon")
+
+    def refresh_user_start(self):
+        from guake.prefs import refresh_user_start  # pylint: disable=import-outside-toplevel
+
+        refresh_user_start(self.settings)
+
+    def show_startup_popup(self):
         # Pop-up that shows that guake is working properly (if not
         # unset in the preferences windows)
         if self.settings.general.get_boolean("use-popup"):
@@ -291,8 +356,6 @@ class Guake(SimpleGladeApp):
                 filename,
             )
 
-        log.info("Guake initialized")
-
     def get_notebook(self):
         return self.notebook_manager.get_current_notebook()
 
@@ -323,77 +386,60 @@ class Guake(SimpleGladeApp):
 
     # new color methods should be moved to the GuakeTerminal class
 
-    def _load_palette(self):
-        colorRGBA = Gdk.RGBA(0, 0, 0, 0)
-        paletteList = []
-        for color in self.settings.styleFont.get_string("palette").split(":"):
-            colorRGBA.parse(color)
-            paletteList.append(colorRGBA.copy())
-        return paletteList
-
-    def _get_background_color(self, palette_list):
-        if len(palette_list) > 16:
-            bg_color = palette_list[17]
-        else:
-            bg_color = Gdk.RGBA(0, 0, 0, 0.9)
+    def _get_background_alpha(self):
+        if self.transparency_toggled:
+            return 1
+        return 1 / 100 * self.settings.styleBackground.cached.transparency
 
-        return self._apply_transparency_to_color(bg_color)
+    def get_palette_colors(self):
+        """Returns the PaletteColors of the palette setting, with the
+        transparency applied. They are cached, and must not be modified."""
+        return get_palette_colors(
+            self.settings.styleFont.cached.palette, self._get_background_alpha()
+        )
 
     def _apply_transparency_to_color(self, bg_color):
-        transparency = self.settings.styleBackground.get_int("transparency")
-        if not self.transparency_toggled:
-            bg_color.alpha = 1 / 100 * transparency
-        else:
-            bg_color.alpha = 1
+        bg_color.alpha = self._get_background_alpha()
         return bg_color
 
     def set_background_color_from_settings(self, terminal_uuid=None):
         self.set_colors_from_settings(terminal_uuid)
 
     def get_bgcolor(self):
-        palette_list = self._load_palette()
-        return self._get_background_color(palette_list)
+        return self.get_palette_colors().background.copy()
 
     def get_fgcolor(self):
-        palette_list = self._load_palette()
-        if len(palette_list) > 16:
-            font_color = palette_list[16]
-        else:
-            font_color = Gdk.RGBA(0, 0, 0, 0)
-        return font_color
+        return self.get_palette_colors().foreground.copy()
+
+    @staticmethod
+    def _set_terminal_colors(terminal, colors):
+        terminal.forget_applied_colors()
+        terminal.set_color_foreground(colors.foreground)
+        terminal.set_color_bold(colors.foreground)
+        terminal.set_colors(colors.foreground, colors.background, list(colors.palette))
 
     def set_colors_from_settings(self, terminal_uuid=None):
-        bg_color = self.get_bgcolor()
-        font_color = self.get_fgcolor()
-        palette_list = self._load_palette()
+        colors = self.get_palette_colors()
 
         terminals = self.get_notebook().iter_terminals()
         if terminal_uuid:
-            terminals = [t for t in terminals if t.uuid == terminal_uuid]
+            terminal = self.notebook_manager.get_terminal_by_uuid(terminal_uuid)
+            terminals = [terminal] if terminal is not None else []
 
         for i in terminals:
-            i.set_color_foreground(font_color)
-            i.set_color_bold(font_color)
-            i.set_colors(font_color, bg_color, palette_list[:16])
+            self._set_terminal_colors(i, colors)
 
     def set_colors_from_settings_on_page(self, current_terminal_only=False, page_num=None):
         """If page_num is None, sets colors on the current page."""
-        bg_color = self.get_bgcolor()
-        font_color = self.get_fgcolor()
-        palette_list = self._load_palette()
+        colors = self.get_palette_colors()
 
         if current_terminal_only:
-            terminal = self.get_notebook().get_current_terminal()
-            terminal.set_color_foreground(font_color)
-            terminal.set_color_bold(font_color)
-            terminal.set_colors(font_color, bg_color, palette_list[:16])
+            self._set_terminal_colors(self.get_notebook().get_current_terminal(), colors)
         else:
             if page_num is None:
                 page_num = self.get_notebook().get_current_page()
             for terminal in self.get_notebook().get_nth_page(page_num).iter_terminals():
-                terminal.set_color_foreground(font_color)
-                terminal.set_color_bold(font_color)
-                terminal.set_colors(font_color, bg_color, palette_list[:16])
+                self._set_terminal_colors(terminal, colors)
 
     def reset_terminal_custom_colors(
         self, current_terminal=False, current_page=False, terminal_uuid=None
@@ -411,9 +457,9 @@ class Guake(SimpleGladeApp):
             for t in self.get_notebook().get_nth_page(page_num).iter_terminals():
                 terminals.append(t)
         if terminal_uuid:
-            for t in self.get_notebook().iter_terminals():
-                if t.uuid == terminal_uuid:
-                    terminals.append(t)
+            terminal = self.notebook_manager.get_terminal_by_uuid(terminal_uuid)
+            if terminal is not None:
+                terminals.append(terminal)
         if not current_terminal and not current_page and not terminal_uuid:
             terminals = list(self.get_notebook().iter_terminals())
 
@@ -486,17 +532,13 @@ class Guake(SimpleGladeApp):
             command += "\n"
         try:
             tab_uuid = uuid.UUID(tab_uuid)
-            (page_index,) = (
-                index
-                for index, t in enumerate(self.get_notebook().iter_terminals())
-                if t.get_uuid() == tab_uuid
-            )
         except ValueError:
-            pass
-        else:
-            terminals = self.get_notebook().get_terminals_for_page(page_index)
-            for current_vte in terminals:
-                current_vte.feed_child(command)
+            return
+        page_index = self.find_current_page_index_by_uuid(tab_uuid)
+        if page_index == -1:
+            return
+        for current_vte in self.get_notebook().get_terminals_for_page(page_index):
+            current_vte.feed_child(command)
 
     def on_window_losefocus(self, window, event):
         """Hides terminal main window when it loses the focus and if
@@ -559,6 +601,8 @@ class Guake(SimpleGladeApp):
         Preferences window.
         """
         self.hide()
+        from guake.prefs import PrefsDialog  # pylint: disable=import-outside-toplevel
+
         PrefsDialog(self.settings).show()
 
     def is_iconified(self):
@@ -594,7 +638,7 @@ class Guake(SimpleGladeApp):
             self.set_terminal_focus()
             return
 
-        should_refocus = self.settings.general.get_boolean("window-refocus")
+        should_refocus = self.settings.general.cached.window_refocus
         has_focus = self.window.get_window().get_state() & Gdk.WindowState.FOCUSED
         if should_refocus and not has_focus:
             log.debug("Refocussing the terminal")
@@ -618,7 +662,7 @@ class Guake(SimpleGladeApp):
     def win_prepare(self, *args):
         event_time = self.hotkeys.get_current_event_time()
         if (
-            not self.settings.general.get_boolean("window-refocus")
+            not self.settings.general.cached.window_refocus
             and self.window.get_window()
             and self.window.get_property("visible")
         ):
@@ -669,23 +713,9 @@ class Guake(SimpleGladeApp):
             return True
         return False
 
-    def restore_pending_terminal_split(self):
-        # Restore pending terminal split
-        # XXX: Consider refactor how to handle failed restore page split
-        self.pending_restore_page_split = self._failed_restore_page_split
-        self._failed_restore_page_split = []
-        for root, box, panes in self.pending_restore_page_split:
-            if (
-                self.window.get_property("visible")
-                and root.get_notebook() == self.notebook_manager.get_current_notebook()
-            ):
-                root.restore_box_layout(box, panes)
-            else:
-                # Consider failed if the window is not visible
-                self._failed_restore_page_split.append((root, box, panes))
-
     def show(self):
         """Shows the main window and grabs the focus on it."""
+        was_hidden = self.hidden
         self.hidden = False
 
         # setting window in all desktops
@@ -748,8 +778,9 @@ class Guake(SimpleGladeApp):
         self.settings.styleBackground.triggerOnChangedValue(self.settings.styleBackground, "color")
 
         log.debug("Current window position: %r", self.window.get_position())
-        self.restore_pending_terminal_split()
         self.execute_hook("show")
+        if was_hidden:
+            self.events.emit("visibility-changed", True)
 
     def hide_from_remote(self):
         """
@@ -774,9 +805,12 @@ class Guake(SimpleGladeApp):
         """
         if not HidePrevention(self.window).may_hide():
             return
+        was_hidden = self.hidden
         self.hidden = True
         self.get_widget("window-root").unstick()
         self.window.hide()  # Don't use hide_all here!
+        if not was_hidden:
+            self.events.emit("visibility-changed", False)
 
         # Hide popover
         self.notebook_manager.get_current_notebook().popover.hide()
@@ -793,105 +827,47 @@ class Guake(SimpleGladeApp):
     # -- configuration --
 
     def load_config(self, terminal_uuid=None):
-        """ "Just a proxy for all the configuration stuff."""
-        user_data = {}
+        """Just a proxy for all the configuration stuff.
+
+        With `terminal_uuid` (a new terminal), only the terminal settings are
+        applied, to this terminal.
+        """
         if terminal_uuid:
-            user_data["terminal_uuid"] = terminal_uuid
+            terminal = self.notebook_manager.get_terminal_by_uuid(terminal_uuid)
+            if terminal is not None:
+                self.terminal_profiles.apply(terminal)
+            return
 
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "use-trayicon", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "prompt-on-quit", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "prompt-on-close-tab", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "window-tabbar", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "fullscreen-hide-tabbar", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "mouse-display", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "display-n", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "window-ontop", user_data=user_data
-        )
+        start = pytime.monotonic()
+        general = self.settings.general
+        window_keys = [
+            "use-trayicon",
+            "prompt-on-quit",
+            "prompt-on-close-tab",
+            "window-tabbar",
+            "fullscreen-hide-tabbar",
+            "mouse-display",
+            "display-n",
+            "window-ontop",
+        ]
         if not self.fullscreen_manager.is_fullscreen():
-            self.settings.general.triggerOnChangedValue(
-                self.settings.general, "window-height", user_data=user_data
-            )
-            self.settings.general.triggerOnChangedValue(
-                self.settings.general, "window-width", user_data=user_data
-            )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "use-scrollbar", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "history-size", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "infinite-history", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "use-vte-titles", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "set-window-title", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "display-tab-names", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "max-tab-name-length", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "quick-open-enable", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "quick-open-command-line", user_data=user_data
-        )
-        self.settings.style.triggerOnChangedValue(
-            self.settings.style, "cursor-shape", user_data=user_data
-        )
-        self.settings.styleFont.triggerOnChangedValue(
-            self.settings.styleFont, "style", user_data=user_data
-        )
-        self.settings.styleFont.triggerOnChangedValue(
-            self.settings.styleFont, "palette", user_data=user_data
-        )
-        self.settings.styleFont.triggerOnChangedValue(
-            self.settings.styleFont, "palette-name", user_data=user_data
-        )
-        self.settings.styleFont.triggerOnChangedValue(
-            self.settings.styleFont, "allow-bold", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(self.settings.general, "background-image-file")
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "background-image-layout-mode"
-        )
-        self.settings.style.triggerOnChangedValue(self.settings.style, "cursor-shape")
-        self.settings.styleFont.triggerOnChangedValue(self.settings.styleFont, "style")
-        self.settings.styleFont.triggerOnChangedValue(self.settings.styleFont, "palette")
-        self.settings.styleFont.triggerOnChangedValue(self.settings.styleFont, "palette-name")
-        self.settings.styleFont.triggerOnChangedValue(self.settings.styleFont, "allow-bold")
-        self.settings.styleBackground.triggerOnChangedValue(
-            self.settings.styleBackground, "transparency", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "use-default-font", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "compat-backspace", user_data=user_data
-        )
-        self.settings.general.triggerOnChangedValue(
-            self.settings.general, "compat-delete", user_data=user_data
-        )
+            window_keys += ["window-height", "window-width"]
+        window_keys += [
+            "use-vte-titles",
+            "set-window-title",
+            "display-tab-names",
+            "max-tab-name-length",
+            "quick-open-enable",
+            "quick-open-command-line",
+            "background-image-file",
+            "background-image-layout-mode",
+        ]
+        for key in window_keys:
+            general.triggerOnChangedValue(general, key)
+
+        # All the terminal settings at once, see TerminalProfileManager
+        self.terminal_profiles.apply_all(self.notebook_manager.iter_terminals())
+        log.debug("Configuration loaded in %.1f ms", (pytime.monotonic() - start) * 1000)
 
     def accel_search_terminal(self, *args):
         nb = self.get_notebook()
@@ -930,9 +906,11 @@ class Guake(SimpleGladeApp):
             log.debug("Remaining procs=%r", procs)
             if PromptQuitDialog(self.window, procs, tabs, notebooks).quit():
                 log.info("Quitting Guake")
+                self.session_writer.flush()
                 Gtk.main_quit()
         else:
             log.info("Quitting Guake")
+            self.session_writer.flush()
             Gtk.main_quit()
 
     def accel_reset_terminal(self, *args):
@@ -1131,14 +1109,17 @@ class Guake(SimpleGladeApp):
 
     def load_cwd_guake_yaml(self, vte) -> dict:
         # Read the content of .guake.yml in cwd
-        if not self.settings.general.get_boolean("load-guake-yml"):
+        if not self.settings.general.cached.load_guake_yml:
             return {}
 
         cwd = Path(vte.get_current_directory())
         filename = str(cwd.joinpath(".guake.yml"))
 
         try:
-            content = self.fm.read_yaml(filename)
+            if self.settings.general.cached.load_guake_yml_from_parents:
+                content = self.fm.read_yaml_upwards(str(cwd), ".guake.yml")
+            else:
+                content = self.fm.read_yaml(filename)
         except Exception:
             log.debug("Unexpected error reading %s.", filename, exc_info=True)
             content = {}
@@ -1180,33 +1161,71 @@ class Guake(SimpleGladeApp):
         current_directory = term.get_current_directory()
         if current_directory != term.directory:
             term.directory = current_directory
+            self.session_model.terminal_changed(term)
             terminal_directory_changed(self)
+            self.events.emit("cwd-changed", str(term.uuid), current_directory)
+
+    def schedule_terminal_directory_recheck(self, term):
+        """The directory of a terminal without OSC 7 support is cached for a
+        while, check it again once the cache expired so a `cd` done just after
+        the last title change is not missed."""
+        if term.has_osc7_directory() or getattr(term, "directory_recheck_id", None):
+            return
+
+        def recheck():
+            term.directory_recheck_id = None
+            if term.get_parent() is not None:
+                term.invalidate_current_directory()
+                self.check_if_terminal_directory_changed(term)
+            return False
+
+        term.directory_recheck_id = GLib.timeout_add(int(term.CWD_CACHE_TTL * 1000), recheck)
 
     def on_terminal_title_changed(self, vte, term):
+        """Throttle the title updates of `term` to one per
+        `tab-title-update-interval` milliseconds: the first change is applied
+        right away, the following ones are coalesced into a single update at
+        the end of the interval."""
         # box must be a page
         if not term.get_parent():
             return
+        if getattr(term, "title_update_id", None):
+            # An update is already scheduled, it will use the latest title
+            return
+        interval = max(0, self.settings.general.cached.tab_title_update_interval) / 1000
+        elapsed = pytime.monotonic() - getattr(term, "title_updated_at", 0)
+        if elapsed >= interval:
+            self.update_terminal_title(term)
+            return
+
+        def delayed_update():
+            term.title_update_id = None
+            if term.get_parent():
+                self.update_terminal_title(term)
+            return False
+
+        term.title_update_id = GLib.timeout_add(int((interval - elapsed) * 1000), delayed_update)
+
+    def update_terminal_title(self, term):
+        term.title_updated_at = pytime.monotonic()
+        self.title_updates += 1
 
         # Check if terminal directory has changed
         self.check_if_terminal_directory_changed(term)
+        self.schedule_terminal_directory_recheck(term)
 
         box = term.get_parent().get_root_box()
-        use_vte_titles = self.settings.general.get_boolean("use-vte-titles")
-        if not use_vte_titles:
+        if not self.settings.general.cached.use_vte_titles:
             return
 
-        # NOTE: Try our best to find the page_num inside all notebooks
-        # this may return -1, should be checked ;)
-        nb = self.get_notebook()
+        nb = box.get_notebook()
         page_num = nb.page_num(box)
-        for nb in self.notebook_manager.iter_notebooks():
-            page_num = nb.page_num(box)
-            if page_num != -1:
-                break
+        if page_num == -1:
+            return
 
         # if tab has been renamed by user, don't override.
         if not getattr(box, "custom_label_set", False):
-            title = self.compute_tab_title(vte)
+            title = self.compute_tab_title(term)
             nb.rename_page(page_num, title, False)
             self.update_window_title(title)
         else:
@@ -1215,10 +1234,10 @@ class Guake(SimpleGladeApp):
                 self.update_window_title(text)
 
     def update_window_title(self, title):
-        if self.settings.general.get_boolean("set-window-title") is True:
+        if not self.settings.general.cached.set_window_title:
+            title = self.default_window_title
+        if self.window.get_title() != title:
             self.window.set_title(title)
-        else:
-            self.window.set_title(self.default_window_title)
 
     # TODO PORT reimplement drag and drop text on terminal
 
@@ -1232,19 +1251,41 @@ class Guake(SimpleGladeApp):
     def rename_tab_uuid(self, term_uuid, new_text, user_set=True):
         """Rename an already added tab by its UUID"""
         term_uuid = uuid.UUID(term_uuid)
-        (page_index,) = (
-            index
-            for index, t in enumerate(self.get_notebook().iter_terminals())
-            if t.get_uuid() == term_uuid
-        )
-        self.get_notebook().rename_page(page_index, new_text, user_set)
+        page_index = self.find_current_page_index_by_uuid(term_uuid)
+        if page_index != -1:
+            self.get_notebook().rename_page(page_index, new_text, user_set)
 
     def get_index_from_uuid(self, term_uuid):
         term_uuid = uuid.UUID(term_uuid)
-        for index, t in enumerate(self.get_notebook().iter_terminals()):
-            if t.get_uuid() == term_uuid:
-                return index
-        return -1
+        return self.find_current_page_index_by_uuid(term_uuid)
+
+    def find_current_page_index_by_uuid(self, term_uuid):
+        """Returns the index of the tab holding the terminal `term_uuid` in the
+        current notebook, -1 if it is not there (even if in another workspace)"""
+        nb, page_index, _ = self.notebook_manager.find_terminal_by_uuid(term_uuid)
+        if nb is not self.get_notebook():
+            return -1
+        return page_index
+
+    def get_terminal_by_uuid_or_current(self, term_uuid=""):
+        """Returns the terminal with the UUID `term_uuid`, the current one if it is
+        empty, None if there is no such terminal"""
+        if not term_uuid:
+            return self.get_notebook().get_current_terminal()
+        return self.notebook_manager.get_terminal_by_uuid(uuid.UUID(term_uuid))
+
+    def start_terminal_logging(self, term_uuid="", path=""):
+        """Log the output of a terminal (the current one by default) to `path`
+        (a new file in terminal-log-directory by default), returns the path"""
+        terminal = self.get_terminal_by_uuid_or_current(term_uuid)
+        if terminal is None:
+            return ""
+        return str(terminal.start_logging(path or None))
+
+    def stop_terminal_logging(self, term_uuid=""):
+        terminal = self.get_terminal_by_uuid_or_current(term_uuid)
+        if terminal is not None:
+            terminal.stop_logging()
 
     def rename_current_tab(self, new_text, user_set=False):
         page_num = self.get_notebook().get_current_page()
@@ -1255,6 +1296,11 @@ class Guake(SimpleGladeApp):
         terminal.handler_ids.append(
             terminal.connect("window-title-changed", self.on_terminal_title_changed, terminal)
         )
+        terminal.handler_ids.append(
+            terminal.connect(
+                "current-directory-uri-changed", self.check_if_terminal_directory_changed
+            )
+        )
 
         # Use to detect if directory has changed
         terminal.directory = terminal.get_current_directory()
@@ -1269,6 +1315,58 @@ class Guake(SimpleGladeApp):
             directory, position=position, open_tab_cwd=open_tab_cwd
         )
 
+    @staticmethod
+    def parse_color(color):
+        """Returns the Gdk.RGBA of `color` ("#rrggbb", "rrggbb" or a name), None if invalid"""
+        rgba = Gdk.RGBA()
+        if rgba.parse(color) or rgba.parse("#" + color):
+            return rgba
+        return None
+
+    @save_tabs_when_changed
+    def apply_layout(self, layout):
+        """Create all the tabs of `layout` (see guake.layout), returns their terminals.
+
+        The whole layout is validated before anything is created, then all the
+        tabs are built during this main loop iteration: the window is redrawn
+        once, with every tab, and the session is saved once.
+        """
+        layout = parse_layout(layout)
+        for tab in layout["tabs"]:
+            for pane in iter_terminal_panes(tab):
+                for key in ("fgcolor", "bgcolor"):
+                    if pane[key] is not None:
+                        color = self.parse_color(pane[key])
+                        if color is None:
+                            raise LayoutError(f"invalid color {pane[key]!r}")
+                        pane[key] = color
+                if pane["bgcolor"] is not None:
+                    pane["bgcolor"] = self._apply_transparency_to_color(pane["bgcolor"])
+
+        if layout["workspace"] is None:
+            nb = self.get_notebook()
+        else:
+            nb = self.notebook_manager.get_notebook(layout["workspace"])
+        terminals = []
+        pages = []
+        with nb.bulk_creation():
+            for tab in layout["tabs"]:
+                root, page_num, _ = nb.new_page(empty=True)
+                tab_terminals = []
+                root.build_layout(root.child, tab, tab_terminals)
+                if tab["label"]:
+                    nb.rename_page(page_num, tab["label"], True)
+                else:
+                    nb.rename_page(page_num, self.compute_tab_title(tab_terminals[0]), False)
+                pages.append((root, tab_terminals[0]))
+                terminals.extend(tab_terminals)
+
+        root, terminal = pages[layout["select"]]
+        nb.set_current_page(nb.page_num(root))
+        terminal.grab_focus()
+        log.info("Created %d tabs, %d terminals", len(pages), len(terminals))
+        return terminals
+
     def find_tab(self, directory=None):
         log.debug("find")
         # TODO SEARCH
@@ -1395,48 +1493,44 @@ class Guake(SimpleGladeApp):
 
     @save_tabs_when_changed
     def on_page_reorder(self, notebook, child, page_num):
-        # Yep, just used for save tabs when changed
-        pass
+        self.session_model.notebook_changed(notebook)
 
     def get_xdg_config_directory(self):
         xdg_config_home = os.environ.get("XDG_CONFIG_HOME", "~/.config")
         return Path(xdg_config_home, "guake").expanduser()
 
-    def save_tabs(self, filename="session.json"):
-        config = {
-            "schema_version": TABS_SESSION_SCHEMA_VERSION,
-            "timestamp": int(pytime.time()),
-            "workspace": {},
-        }
-
-        for key, nb in self.notebook_manager.get_notebooks().items():
-            tabs = []
-            for index in range(nb.get_n_pages()):
-                try:
-                    page = nb.get_nth_page(index)
-                    panes = []
-                    page.save_box_layout(page.child, panes)
-                    tabs.append(
-                        {
-                            "panes": panes,
-                            "label": nb.get_tab_text_index(index),
-                            "custom_label_set": getattr(page, "custom_label_set", False),
-                        }
-                    )
-                except FileNotFoundError:
-                    # discard same broken tabs
-                    pass
-            # NOTE: Maybe we will have frame inside the workspace in future
-            #       So lets use list to store the tabs (as for each frame)
-            config["workspace"][key] = [tabs]
+    def build_session(self):
+        """Returns the tabs session of all workspaces, as saved in session.json"""
+        # The tabs still waiting for their layout are saved with it, see SessionModel
+        return self.session_model.build()
 
-        if not self.get_xdg_config_directory().exists():
-            self.get_xdg_config_directory().mkdir(parents=True)
+    def save_tabs(self, filename="session.json"):
+        if filename == self.session_writer.filename:
+            self.session_writer.write_now()
+            return
         session_file = self.get_xdg_config_directory() / filename
-        with session_file.open("w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        write_session_file(session_file, self.build_session())
         log.info("Guake tabs saved to %s", session_file)
 
+    def _restore_frame_tabs(self, nb, tabs, lazy, lazy_roots):
+        for tab in tabs:
+            if tab.get("panes", False):
+                box, page_num, term = nb.new_page_with_focus(
+                    label=tab["label"], user_set=tab["custom_label_set"], empty=True
+                )
+                if tab.get("last_used") is not None:
+                    box.last_used = tab["last_used"]
+                self.restore_queue.push(box, box.child, tab["panes"], lazy=lazy)
+                if lazy:
+                    lazy_roots.append(box)
+            else:
+                directory = (
+                    tab["panes"][0]["directory"]
+                    if len(tab.get("panes", [])) == 1
+                    else tab.get("directory", None)
+                )
+                nb.new_page_with_focus(directory, tab["label"], tab["custom_label_set"])
+
     def restore_tabs(self, filename="session.json", suppress_notify=False):
         session_file = self.get_xdg_config_directory() / filename
         if not session_file.exists():
@@ -1495,9 +1589,11 @@ class Guake(SimpleGladeApp):
         v = self.settings.general.get_boolean("save-tabs-when-changed")
         self.settings.general.set_boolean("save-tabs-when-changed", False)
 
-        # Restore all tabs for all workspaces
-        self.pending_restore_page_split = []
-        self._failed_restore_page_split = []
+        # Restore all tabs for all workspaces, the splits are replayed by the
+        # restore queue except for the current page of each workspace. Lazy
+        # tabs are only restored once needed, but the most recently used ones.
+        lazy = self.settings.general.get_boolean("lazy-tab-restore")
+        lazy_roots = []
         try:
             for key, frames in config["workspace"].items():
                 nb = self.notebook_manager.get_notebook(int(key))
@@ -1506,23 +1602,22 @@ class Guake(SimpleGladeApp):
                 # Restore each frames' tabs from config
                 # NOTE: If frame implement in future, we will need to update this code
                 for tabs in frames:
-                    for index, tab in enumerate(tabs):
-                        if tab.get("panes", False):
-                            box, page_num, term = nb.new_page_with_focus(
-                                label=tab["label"], user_set=tab["custom_label_set"], empty=True
-                            )
-                            box.restore_box_layout(box.child, tab["panes"])
-                        else:
-                            directory = (
-                                tab["panes"][0]["directory"]
-                                if len(tab.get("panes", [])) == 1
-                                else tab.get("directory", None)
-                            )
-                            nb.new_page_with_focus(directory, tab["label"], tab["custom_label_set"])
+                    with nb.bulk_creation():
+                        self._restore_frame_tabs(nb, tabs, lazy, lazy_roots)
 
                     # Remove original pages in notebook
                     for i in range(current_pages):
                         nb.delete_page(0)
+
+                current_page = nb.get_nth_page(nb.get_current_page())
+                if current_page is not None:
+                    self.restore_queue.restore_page(current_page)
+
+            warm_count = self.settings.general.get_int("lazy-tab-warm-count")
+            lazy_roots = [root for root in lazy_roots if self.restore_queue.is_pending(root)]
+            lazy_roots.sort(key=lambda root: getattr(root, "last_used", 0), reverse=True)
+            for root in lazy_roots[:warm_count]:
+                self.restore_queue.warm(root)
         except KeyError:
             log.warning("%s schema is broken", session_file)
             shutil.copy(
@@ -1,10 +1,12 @@
 def toggle_guake_by_dbus():
-    import dbus  # pylint: disable=import-outside-toplevel
+    # pylint: disable=import-outside-toplevel
+    from gi.repository import GLib
+
+    from guake.client import GuakeNotRunning
+    from guake.client import call_remote
 
     try:
-        bus = dbus.SessionBus()
-        remote_object = bus.get_object("org.guake3.RemoteControl", "/org/guake3/RemoteControl")
         print("Sending 'toggle' message to Guake3")
-        remote_object.show_hide()
-    except dbus.DBusException:
+        call_remote("show_hide")
+    except (GuakeNotRunning, GLib.Error):  # pylint: disable=catching-non-exception
         pass
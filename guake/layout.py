@@ -0,0 +1,118 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+# Layouts of tabs to create in a single call, e.g.:
+#
+#   {
+#       "workspace": 0,
+#       "select": 1,
+#       "tabs": [
+#           {"label": "logs", "directory": "/var/log", "command": "tail -f syslog"},
+#           {
+#               "label": "dev",
+#               "split": "vertical",
+#               "percentage": 30,
+#               "panes": [
+#                   {"directory": "~/src", "fgcolor": "#00ff00"},
+#                   {"directory": "~/src", "command": "make watch", "bgcolor": "#202020"},
+#               ],
+#           },
+#       ],
+#   }
+#
+# A tab is a pane with an optional label. A pane is either a terminal, with
+# optional "directory", "command", "fgcolor" and "bgcolor", or a split of two
+# panes ("vertical" places them side by side, like --split-vertical).
+
+SPLITS = ("vertical", "horizontal")
+TERMINAL_KEYS = ("directory", "command", "fgcolor", "bgcolor")
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def _check_string(value, what):
+    if value is not None and not isinstance(value, str):
+        raise LayoutError(f"{what} should be a string, not {value!r}")
+    return value
+
+
+def parse_pane(pane, path="tab"):
+    """Returns the validated `pane`, with all its keys"""
+    if not isinstance(pane, dict):
+        raise LayoutError(f"{path} should be an object, not {pane!r}")
+    split = pane.get("split")
+    if split is None:
+        return {key: _check_string(pane.get(key), f"{path}.{key}") for key in TERMINAL_KEYS}
+    if split not in SPLITS:
+        raise LayoutError(f"{path}.split should be one of {', '.join(SPLITS)}, not {split!r}")
+    percentage = pane.get("percentage", 50)
+    if not isinstance(percentage, int) or isinstance(percentage, bool) or not 0 < percentage < 100:
+        raise LayoutError(f"{path}.percentage should be between 1 and 99, not {percentage!r}")
+    panes = pane.get("panes")
+    if not isinstance(panes, list) or len(panes) != 2:
+        raise LayoutError(f"{path}.panes should be a list of two panes")
+    return {
+        "split": split,
+        "percentage": percentage,
+        "panes": [parse_pane(p, f"{path}.panes[{i}]") for i, p in enumerate(panes)],
+    }
+
+
+def parse_layout(layout):
+    """Validate `layout`, a dict or its JSON, and returns it normalized.
+
+    Raises LayoutError before anything is created if any part of it is wrong.
+    """
+    if isinstance(layout, str):
+        try:
+            layout = json.loads(layout)
+        except ValueError as e:
+            raise LayoutError(f"invalid JSON: {e}") from e
+    if not isinstance(layout, dict):
+        raise LayoutError("the layout should be an object")
+    tabs = layout.get("tabs")
+    if not isinstance(tabs, list) or not tabs:
+        raise LayoutError("the layout should have a non empty list of tabs")
+    parsed_tabs = []
+    for index, tab in enumerate(tabs):
+        parsed = parse_pane(tab, f"tabs[{index}]")
+        parsed["label"] = _check_string(tab.get("label"), f"tabs[{index}].label")
+        parsed_tabs.append(parsed)
+    workspace = layout.get("workspace")
+    if workspace is not None and (not isinstance(workspace, int) or workspace < 0):
+        raise LayoutError(f"workspace should be a positive index, not {workspace!r}")
+    select = layout.get("select", 0)
+    if not isinstance(select, int) or not 0 <= select < len(tabs):
+        raise LayoutError(f"select should be the index of one of the tabs, not {select!r}")
+    return {"workspace": workspace, "select": select, "tabs": parsed_tabs}
+
+
+def iter_terminal_panes(pane):
+    if "split" in pane:
+        for child in pane["panes"]:
+            yield from iter_terminal_panes(child)
+    else:
+        yield pane
@@ -35,6 +35,8 @@ import uuid
 
 from locale import gettext
 
+from guake.startup import PROFILER
+
 builtins.__dict__["_"] = gettext
 
 from argparse import ArgumentParser
@@ -51,9 +53,6 @@ if "GUAKE_ENABLE_WAYLAND" in os.environ:
 
 from guake.globals import NAME
 from guake.globals import bindtextdomain
-from guake.support import print_support
-from guake.utils import restore_preferences
-from guake.utils import save_preferences
 
 # When we are in the document generation on readthedocs,
 # we do not have paths.py generated
@@ -360,6 +359,18 @@ def main():
         help=_('Rename the current tab. Reset to default if TITLE is a single dash "-".'),
     )
 
+    parser.add_argument(
+        "--apply-layout",
+        dest="layout_file",
+        metavar="LAYOUT_FILE",
+        action="store",
+        default="",
+        help=_(
+            "Create all the tabs, splits and commands described in the JSON file LAYOUT_FILE, "
+            "and print the UUIDs of their terminals"
+        ),
+    )
+
     parser.add_argument(
         "-q",
         "--quit",
@@ -402,6 +413,14 @@ def main():
         help=_("Show support information"),
     )
 
+    parser.add_argument(
+        "--profile-startup",
+        dest="profile_startup",
+        action="store_true",
+        default=False,
+        help=_("Print how long each phase of the startup takes"),
+    )
+
     # checking mandatory dependencies
 
     missing_deps = False
@@ -448,6 +467,8 @@ def main():
         sys.exit(1)
 
     options = parser.parse_args()
+    PROFILER.enabled = options.profile_startup
+    PROFILER.mark("options parsed")
     if options.version:
         from guake import gtk_version
         from guake import guake_version
@@ -463,22 +484,29 @@ def main():
     if options.save_preferences and options.restore_preferences:
         parser.error("options --save-preferences and --restore-preferences are mutually exclusive")
     if options.save_preferences:
+        from guake.utils import save_preferences
+
         save_preferences(options.save_preferences)
         sys.exit(0)
     elif options.restore_preferences:
+        from guake.utils import restore_preferences
+
         restore_preferences(options.restore_preferences)
         sys.exit(0)
 
     if options.support:
+        from guake.support import print_support
+
         print_support()
         sys.exit(0)
 
-    import dbus
+    with PROFILER.phase("import dbus"):
+        import dbus
 
-    from guake.dbusiface import DBUS_NAME
-    from guake.dbusiface import DBUS_PATH
-    from guake.dbusiface import DbusManager
-    from guake.guake_logging import setupLogging
+        from guake.dbusiface import DBUS_NAME
+        from guake.dbusiface import DBUS_PATH
+        from guake.dbusiface import DbusManager
+        from guake.guake_logging import setupLogging
 
     instance = None
 
@@ -486,8 +514,9 @@ def main():
     # possible, lets create a new instance. This function will return
     # a boolean value depending on this decision.
     try:
-        bus = dbus.SessionBus()
-        remote_object = bus.get_object(DBUS_NAME, DBUS_PATH)
+        with PROFILER.phase("look for a running Guake"):
+            bus = dbus.SessionBus()
+            remote_object = bus.get_object(DBUS_NAME, DBUS_PATH)
         already_running = True
     except dbus.DBusException:
         # can now configure the logging
@@ -501,10 +530,13 @@ def main():
 
         log.info("Guake not running, starting it")
         # late loading of the Guake object, to speed up dbus comm
-        from guake.guake_app import Guake
+        with PROFILER.phase("import guake_app"):
+            from guake.guake_app import Guake
 
-        instance = Guake()
-        remote_object = DbusManager(instance)
+        with PROFILER.phase("Guake()"):
+            instance = Guake()
+        with PROFILER.phase("D-Bus service"):
+            remote_object = DbusManager(instance)
         already_running = False
 
     only_show_hide = True
@@ -637,6 +669,13 @@ def main():
         remote_object.rename_current_tab(options.rename_current_tab)
         only_show_hide = options.show
 
+    if options.layout_file:
+        with open(options.layout_file, encoding="utf-8") as f:
+            layout = f.read()
+        for terminal_uuid in remote_object.apply_layout(layout):
+            sys.stdout.write(f"{terminal_uuid}\n")
+        only_show_hide = options.show
+
     if options.show_about:
         remote_object.show_about()
         only_show_hide = options.show
@@ -676,6 +715,18 @@ def main():
 
 
 def exec_main():
+    # `guake`, `guake -t`... with Guake already running: call it directly,
+    # without loading GTK nor parsing the whole command line. The `guake`
+    # command does it in guake.client.main, before this module is imported.
+    from guake.client import run_fast_command
+
+    if run_fast_command(sys.argv[1:]):
+        return
+    run_main()
+
+
+def run_main():
+    """Run the command line, starting Guake if it is not running yet"""
     if not main():
         log.debug("Running main gtk loop")
         signal.signal(signal.SIGINT, signal.SIG_DFL)
@@ -104,6 +104,12 @@ def mk_terminal_context_menu(terminal, window, settings, callback_object):
     mi = Gtk.MenuItem(_("Save content..."))
     mi.connect("activate", callback_object.on_save_to_file)
     menu.add(mi)
+    mi = Gtk.CheckMenuItem(_("Log output to file"))
+    mi.set_active(terminal.is_logging())
+    if terminal.is_logging():
+        mi.set_tooltip_text(str(terminal.logger.path))
+    mi.connect("toggled", callback_object.on_toggle_logging)
+    menu.add(mi)
     mi = Gtk.MenuItem(_("Reset terminal"))
     mi.connect("activate", callback_object.on_reset_terminal)
     menu.add(mi)
@@ -19,6 +19,7 @@ Boston, MA 02110-1301 USA
 """
 
 from guake.about import AboutDialog
+from guake.activity import TabActivityMonitor
 from guake.boxes import RootTerminalBox
 from guake.boxes import TabLabelEventBox
 from guake.boxes import TerminalBox
@@ -28,7 +29,6 @@ from guake.dialogs import PromptQuitDialog
 from guake.globals import PROMPT_ALWAYS
 from guake.globals import PROMPT_PROCESSES
 from guake.menus import mk_notebook_context_menu
-from guake.prefs import PrefsDialog
 from guake.utils import HidePrevention
 from guake.utils import gdk_is_x11_display
 from guake.utils import get_process_name
@@ -38,16 +38,17 @@ import gi
 import os
 import time
 
+from contextlib import contextmanager
+
 gi.require_version("Gtk", "3.0")
-gi.require_version("Wnck", "3.0")
 from gi.repository import GObject
 from gi.repository import Gdk
 from gi.repository import Gtk
-from gi.repository import Wnck
 from guake.terminal import GuakeTerminal
 
 import logging
 import posix
+import weakref
 
 log = logging.getLogger(__name__)
 
@@ -56,6 +57,8 @@ class TerminalNotebook(Gtk.Notebook):
     def __init__(self, *args, **kwargs):
         Gtk.Notebook.__init__(self, *args, **kwargs)
         self.last_terminal_focused = None
+        # See bulk_creation
+        self._bulk_depth = 0
 
         self.set_name("notebook-teminals")
         self.set_tab_pos(Gtk.PositionType.BOTTOM)
@@ -93,6 +96,7 @@ class TerminalNotebook(Gtk.Notebook):
         )
         # Clear the activity highlight from a tab once it becomes the current one.
         self._activity_last_page = None
+        self.activity_monitor = None
         self.connect("switch-page", self.on_switch_page)
 
         # Action box
@@ -123,6 +127,9 @@ class TerminalNotebook(Gtk.Notebook):
 
     def attach_guake(self, guake):
         self.guake = guake
+        self.activity_monitor = TabActivityMonitor(
+            self, guake.settings.general.get_boolean("display-tab-activity")
+        )
 
         self.guake.settings.general.onChangedValue("window-losefocus", self.on_lose_focus_toggled)
         self.pin_button.set_visible(self.guake.settings.general.get_boolean("window-losefocus"))
@@ -266,6 +273,8 @@ class TerminalNotebook(Gtk.Notebook):
 
     def get_terminals_for_page(self, index):
         page = self.get_nth_page(index)
+        # A lazily restored tab gets its terminals when they are asked for
+        self.guake.restore_queue.restore_page(page)
         return page.get_terminals()
 
     def get_terminals(self):
@@ -334,6 +343,7 @@ class TerminalNotebook(Gtk.Notebook):
         for terminal in page.get_terminals():
             if kill:
                 terminal.kill()
+            self.guake.notebook_manager.unregister_terminal(terminal)
             terminal.destroy()
 
         if self.get_nth_page(page_num) is page:
@@ -351,6 +361,8 @@ class TerminalNotebook(Gtk.Notebook):
     @save_tabs_when_changed
     def remove_page(self, page_num):
         super().remove_page(page_num)
+        self.guake.session_model.notebook_changed(self)
+        self.emit_event("tab-closed", page_num)
         # focusing the first terminal on the previous page
         if self.get_current_page() > -1:
             page = self.get_nth_page(self.get_current_page())
@@ -379,46 +391,52 @@ class TerminalNotebook(Gtk.Notebook):
         # initial shell prompt (especially on session restore) does not light up
         # every background tab at once.
         if self.guake:
-            grace = self.guake.settings.general.get_double("tab-activity-new-tab-grace")
+            grace = self.guake.settings.general.cached.tab_activity_new_tab_grace
             root_terminal_box.activity_ignore_until = time.monotonic() + grace
         page_num = self.insert_page(
             root_terminal_box, None, position if position is not None else -1
         )
         self.set_tab_reorderable(root_terminal_box, True)
-        self.show_all()  # needed to show newly added tabs and pages
-        # this is needed because self.window.show_all() results in showing every
-        # thing which includes the scrollbar too
-        self.guake.settings.general.triggerOnChangedValue(
-            self.guake.settings.general, "use-scrollbar"
-        )
+        self.guake.session_model.notebook_changed(self)
+        self.emit_event("tab-added", page_num)
+        # Only the new page: the scrollbars are not shown by show_all, their
+        # visibility is set when they are created (see TerminalBox.add_scroll_bar)
+        root_terminal_box.show_all()
         # this is needed to initially set the last_terminal_focused,
         # one could also call terminal.get_parent().on_terminal_focus()
         if not empty:
             self.terminal_attached(terminal)
-        self.hide_tabbar_if_one_tab()
+        if not self._bulk_depth:
+            self.hide_tabbar_if_one_tab()
 
         if self.guake:
             # Attack background image draw callback to root terminal box
+            root_terminal_box.connect("draw", self.guake.background_image_manager.on_draw_start)
             root_terminal_box.connect_after("draw", self.guake.background_image_manager.draw)
         return root_terminal_box, page_num, terminal
 
+    @contextmanager
+    def bulk_creation(self):
+        """Add many pages at once: what is done for the whole notebook after
+        each new page (the tab bar visibility) is only done at the end"""
+        self._bulk_depth += 1
+        try:
+            yield
+        finally:
+            self._bulk_depth -= 1
+            if not self._bulk_depth:
+                self.hide_tabbar_if_one_tab()
+
     def hide_tabbar_if_one_tab(self):
         """Hide the tab bar if hide-tabs-if-one-tab is true and there is only one
         notebook page"""
-        if self.guake.settings.general.get_boolean("window-tabbar"):
-            if self.guake.settings.general.get_boolean("hide-tabs-if-one-tab"):
+        if self.guake.settings.general.cached.window_tabbar:
+            if self.guake.settings.general.cached.hide_tabs_if_one_tab:
                 self.set_property("show-tabs", self.get_n_pages() != 1)
             else:
                 self.set_property("show-tabs", True)
 
     def terminal_spawn(self, directory=None, open_tab_cwd=False):
-        terminal = GuakeTerminal(self.guake)
-        terminal.grab_focus()
-        terminal.connect(
-            "key-press-event",
-            lambda x, y: self.guake.accel_group.activate(x, y) if self.guake.accel_group else False,
-        )
-        terminal.connect("contents-changed", self.on_terminal_activity)
         if not isinstance(directory, str):
             directory = os.environ["HOME"]
             try:
@@ -434,26 +452,20 @@ class TerminalNotebook(Gtk.Notebook):
                         directory = active_terminal.get_current_directory()
             except BaseException:
                 pass
-        log.info("Spawning new terminal at %s", directory)
-        terminal.spawn_sync_pid(directory)
+        terminal = self.guake.terminal_pool.take(directory)
+        if terminal is None:
+            log.info("Spawning new terminal at %s", directory)
+            terminal = GuakeTerminal(self.guake)
+            terminal.spawn_async_pid(directory)
+        else:
+            log.info("Using a pooled terminal at %s", directory)
+        terminal.grab_focus()
+        terminal.connect(
+            "key-press-event",
+            lambda x, y: self.guake.accel_group.activate(x, y) if self.guake.accel_group else False,
+        )
         return terminal
 
-    def on_terminal_activity(self, terminal):
-        """Highlight a background tab's title when its terminal produces output."""
-        if not getattr(self, "guake", None):
-            return
-        if not self.guake.settings.general.get_boolean("display-tab-activity"):
-            return
-        page_index = self.find_page_index_by_terminal(terminal)
-        if page_index < 0 or page_index == self.get_current_page():
-            return
-        page = self.get_nth_page(page_index)
-        if time.monotonic() < getattr(page, "activity_ignore_until", 0):
-            return
-        label = self.get_tab_label(page)
-        if hasattr(label, "set_activity"):
-            label.set_activity(True)
-
     def on_switch_page(self, notebook, page, page_num):
         """Clear the highlight from the tab being switched to, and start a short
         grace period on the tab that just lost focus."""
@@ -468,20 +480,58 @@ class TerminalNotebook(Gtk.Notebook):
                 getattr(previous_page, "activity_ignore_until", 0),
                 time.monotonic() + grace,
             )
-        label = self.get_tab_label(page)
-        if hasattr(label, "set_activity"):
-            label.set_activity(False)
+        if self.activity_monitor is not None:
+            self.activity_monitor.on_switch_page(previous_page, page)
+        if getattr(self, "guake", None):
+            self.guake.restore_queue.restore_page(page)
+            # Saved in the session, to know which tabs to restore first
+            page.last_used = time.time()
+            self.guake.session_model.page_changed(page)
+
+    def on_terminal_activity(self, terminal):
+        """Highlight a background tab's title when its terminal produces output.
+
+        Kept for compatibility, the terminals are watched by the activity monitor.
+        """
+        if self.activity_monitor is not None and self.activity_monitor.enabled:
+            self.activity_monitor.on_contents_changed(terminal)
 
     def clear_all_tab_activity(self):
         """Remove activity highlights from every tab (e.g. when the feature is
         disabled)."""
-        for label in self.iter_tabs():
-            if hasattr(label, "set_activity"):
-                label.set_activity(False)
+        if self.activity_monitor is not None:
+            self.activity_monitor.clear_all()
+
+    def get_tab_activity_rate(self, page):
+        """How much the (background) tab `page` produced output recently, from
+        0 to 1, e.g. to adjust the intensity of its highlight."""
+        if self.activity_monitor is None:
+            return 0.0
+        return self.activity_monitor.get_activity_rate(page)
 
     def terminal_attached(self, terminal):
+        self.guake.notebook_manager.register_terminal(terminal)
+        self.guake.session_model.terminal_changed(terminal)
+        self.activity_monitor.terminal_attached(terminal)
         terminal.emit("focus", Gtk.DirectionType.TAB_FORWARD)
-        self.emit("terminal-spawned", terminal, terminal.pid)
+        # Configured right away, even if its shell is still being spawned
+        # (the pid is then -1), or could not be
+        self.emit("terminal-spawned", terminal, terminal.pid if terminal.is_spawned() else -1)
+        # What needs the pid waits for it
+        terminal.when_spawned(self.on_terminal_spawned)
+
+    def on_terminal_spawned(self, terminal):
+        if terminal.get_parent() is None:
+            # Closed before its shell was even running
+            return
+        self.guake.check_if_terminal_directory_changed(terminal)
+        self.guake.events.emit("terminal-spawned", str(terminal.uuid), terminal.pid)
+
+    def emit_event(self, name, *args):
+        """Emit the event `name` of Guake (see guake.events) about a tab of this notebook"""
+        if self.guake is not None:
+            workspace = self.guake.notebook_manager.get_workspace_index(self)
+            self.guake.events.emit(name, workspace, *args)
 
     def new_page_with_focus(
         self,
@@ -513,6 +563,9 @@ class TerminalNotebook(Gtk.Notebook):
         if not getattr(page, "custom_label_set", False) or user_set:
             old_label = self.get_tab_label(page)
             if isinstance(old_label, TabLabelEventBox):
+                if not user_set and old_label.get_text() == new_text:
+                    # Nothing to render again, nor to save
+                    return
                 old_label.set_text(new_text)
             else:
                 label = TabLabelEventBox(self, new_text, self.guake.settings)
@@ -522,6 +575,8 @@ class TerminalNotebook(Gtk.Notebook):
                 self.set_tab_label(page, label)
             if user_set:
                 setattr(page, "custom_label_set", new_text != "-")
+            self.guake.session_model.page_changed(page)
+            self.emit_event("tab-renamed", page_index, new_text)
 
     def find_tab_index_by_label(self, eventbox):
         for index, tab_eventbox in enumerate(self.iter_tabs()):
@@ -530,11 +585,10 @@ class TerminalNotebook(Gtk.Notebook):
         return -1
 
     def find_page_index_by_terminal(self, terminal):
-        for index, page in enumerate(self.iter_pages()):
-            for t in page.iter_terminals():
-                if t is terminal:
-                    return index
-        return -1
+        root = self.guake.notebook_manager.get_root_box_by_terminal(terminal)
+        if root is None or root.get_notebook() is not self:
+            return -1
+        return self.page_num(root)
 
     def get_tab_text_index(self, index):
         return self.get_tab_label(self.get_nth_page(index)).get_text()
@@ -544,6 +598,8 @@ class TerminalNotebook(Gtk.Notebook):
 
     def on_show_preferences(self, user_data):
         self.guake.hide()
+        from guake.prefs import PrefsDialog  # pylint: disable=import-outside-toplevel
+
         PrefsDialog(self.guake.settings).show()
 
     def on_show_about(self, user_data):
@@ -599,6 +655,9 @@ class NotebookManager(GObject.Object):
             )
         self.current_notebook = 0
         self.notebooks = {}
+        # Indexes of the terminals in the notebooks, see register_terminal
+        self._terminals_by_uuid = weakref.WeakValueDictionary()
+        self._root_boxes = weakref.WeakKeyDictionary()  # GuakeTerminal -> RootTerminalBox
         self.window = window
         self.notebook_parent = notebook_parent
         self.terminal_spawned_cb = terminal_spawned_cb
@@ -608,6 +667,9 @@ class NotebookManager(GObject.Object):
             #       is X11 or not, if not, it will not able to enable workspace-specific-tab-sets
             #
             # TODO: Is there anyway to support this in non-X11 display backend?
+            gi.require_version("Wnck", "3.0")
+            from gi.repository import Wnck  # pylint: disable=import-outside-toplevel
+
             self.screen = Wnck.Screen.get_default()
             self.screen.connect("active-workspace-changed", self.__workspace_changed_cb)
 
@@ -634,6 +696,13 @@ class NotebookManager(GObject.Object):
     def has_notebook_for_workspace(self, workspace_index):
         return workspace_index in self.notebooks
 
+    def get_workspace_index(self, notebook):
+        """Returns the workspace of `notebook`, -1 if it has none (yet)"""
+        for index, nb in self.notebooks.items():
+            if nb is notebook:
+                return index
+        return -1
+
     def set_workspace(self, index: int):
         self.notebook_parent.remove(self.get_current_notebook())
         self.current_notebook = index
@@ -643,11 +712,9 @@ class NotebookManager(GObject.Object):
         if self.window.get_property("visible") and notebook.last_terminal_focused is not None:
             notebook.last_terminal_focused.grab_focus()
 
-        # Restore pending page terminal split
-        notebook.guake.restore_pending_terminal_split()
-
         # Restore config to workspace
         notebook.guake.load_config()
+        notebook.guake.events.emit("workspace-switched", index)
 
     def set_notebooks_tabbar_visible(self, v):
         for nb in self.iter_notebooks():
@@ -666,11 +733,65 @@ class NotebookManager(GObject.Object):
         for k in self.notebooks:
             yield from self.notebooks[k].iter_terminals()
 
+    def register_terminal(self, terminal):
+        """Index `terminal`, which has just been attached to a page.
+
+        The root box of a terminal never changes (splits happen inside it),
+        and the notebook of a root box neither, so the indexes only need to
+        be updated when terminals are attached or removed.
+        """
+        self._terminals_by_uuid[terminal.uuid] = terminal
+        self._root_boxes[terminal] = terminal.get_parent().get_root_box()
+
+    def unregister_terminal(self, terminal):
+        self._terminals_by_uuid.pop(terminal.uuid, None)
+        self._root_boxes.pop(terminal, None)
+
+    def get_root_box_by_terminal(self, terminal):
+        """Returns the page (RootTerminalBox) holding `terminal`, or None"""
+        root = self._root_boxes.get(terminal)
+        if root is None:
+            return None
+        notebook = root.get_notebook()
+        if root.get_parent() is not notebook or not terminal.is_ancestor(root):
+            # Removed without being unregistered (e.g. destroyed)
+            self.unregister_terminal(terminal)
+            return None
+        return root
+
     def get_terminal_by_uuid(self, terminal_uuid):
-        for t in self.iter_terminals():
-            if t.uuid == terminal_uuid:
-                return t
-        return None
+        terminal = self._terminals_by_uuid.get(terminal_uuid)
+        if terminal is None or self.get_root_box_by_terminal(terminal) is None:
+            return None
+        return terminal
+
+    def find_terminal_by_uuid(self, terminal_uuid):
+        """Returns (notebook, page index, terminal) for the terminal with the
+        given uuid, or (None, -1, None)"""
+        terminal = self.get_terminal_by_uuid(terminal_uuid)
+        if terminal is None:
+            return None, -1, None
+        root = self.get_root_box_by_terminal(terminal)
+        notebook = root.get_notebook()
+        return notebook, notebook.page_num(root), terminal
+
+    def check_consistency(self):
+        """Compare the indexes with the widgets, returns the list of the
+        differences found (empty if the indexes are right)"""
+        errors = []
+        seen = set()
+        for nb in self.iter_notebooks():
+            for page in nb.iter_pages():
+                for terminal in page.iter_terminals():
+                    seen.add(terminal.uuid)
+                    if self._terminals_by_uuid.get(terminal.uuid) is not terminal:
+                        errors.append(f"terminal {terminal.uuid} is not indexed by uuid")
+                    if self.get_root_box_by_terminal(terminal) is not page:
+                        errors.append(f"terminal {terminal.uuid} is not indexed in its page")
+        for terminal_uuid, terminal in list(self._terminals_by_uuid.items()):
+            if terminal_uuid not in seen and self.get_terminal_by_uuid(terminal_uuid):
+                errors.append(f"terminal {terminal_uuid} is indexed but not in any page")
+        return errors
 
     def iter_pages(self):
         for k in self.notebooks:
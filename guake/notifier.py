@@ -20,18 +20,28 @@ Boston, MA 02110-1301 USA
 
 import gi
 
-gi.require_version("Notify", "0.7")
 from gi.repository import GLib
-from gi.repository import Notify
-
-Notify.init("Guake")
 
 __all__ = ["showMessage"]
 
+# Loaded with the first notification, it is not needed to start Guake
+Notify = None
+
+
+def _get_notify():
+    global Notify  # pylint: disable=global-statement
+    if Notify is None:
+        gi.require_version("Notify", "0.7")
+        from gi.repository import Notify as notify  # pylint: disable=import-outside-toplevel
+
+        notify.init("Guake")
+        Notify = notify
+    return Notify
+
 
 def showMessage(brief, body=None, icon=None):
     try:
-        notification = Notify.Notification.new(brief, body, icon)
+        notification = _get_notify().Notification.new(brief, body, icon)
         notification.show()
     # pylint: disable=catching-non-exception
     except GLib.GError:
@@ -17,6 +17,16 @@ License along with this program; if not, write to the
 Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
 Boston, MA 02110-1301 USA
 """
+import functools
+
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gdk
 
 # index 00: Host
 # index 01: Syntax string
@@ -1053,3 +1063,41 @@ PALETTES = {
         "#CFCFCFCFCFCF:#D9D9E6E6F2F2:#19191F1F1D1D"
     ),
 }
+
+
+class PaletteColors(NamedTuple):
+    """The colors of a palette, ready to be given to Vte.Terminal.set_colors.
+
+    The Gdk.RGBA are shared, they must not be modified.
+    """
+
+    foreground: Gdk.RGBA
+    background: Gdk.RGBA
+    palette: Tuple[Gdk.RGBA, ...]
+
+
+@functools.lru_cache(maxsize=len(PALETTES) + 64)
+def parse_palette(palette: str) -> Tuple[Gdk.RGBA, ...]:
+    """Returns the colors of a palette string ("#RRRRGGGGBBBB:..."), parsed once.
+
+    The Gdk.RGBA are shared, they must not be modified.
+    """
+    colors = []
+    for color in palette.split(":"):
+        rgba = Gdk.RGBA(0, 0, 0, 0)
+        rgba.parse(color)
+        colors.append(rgba)
+    return tuple(colors)
+
+
+@functools.lru_cache(maxsize=len(PALETTES) + 64)
+def get_palette_colors(palette: str, alpha: Optional[float] = None) -> PaletteColors:
+    """Returns the PaletteColors of a palette string, the background color
+    having the opacity `alpha` (unchanged if None)
+    """
+    colors = parse_palette(palette)
+    foreground = colors[16] if len(colors) > 16 else Gdk.RGBA(0, 0, 0, 0)
+    background = colors[17].copy() if len(colors) > 17 else Gdk.RGBA(0, 0, 0, 0.9)
+    if alpha is not None:
+        background.alpha = alpha
+    return PaletteColors(foreground, background, colors[:16])
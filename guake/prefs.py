@@ -50,6 +50,7 @@ from guake.globals import MAX_TRANSPARENCY
 from guake.globals import NAME
 from guake.globals import QUICK_OPEN_MATCHERS
 from guake.palettes import PALETTES
+from guake.palettes import get_palette_colors
 from guake.paths import AUTOSTART_FOLDER
 from guake.paths import LOCALE_DIR
 from guake.paths import LOGIN_DESTOP_PATH
@@ -929,31 +930,13 @@ class PrefsDialog(SimpleGladeApp):
             combo.set_active(self.custom_palette_index)
 
     def update_demo_palette(self, palette):
-        self.set_colors_from_settings()
+        colors = get_palette_colors(palette)
+        self.demo_terminal.set_color_foreground(colors.foreground)
+        self.demo_terminal.set_color_bold(colors.foreground)
+        self.demo_terminal.set_colors(colors.foreground, colors.background, list(colors.palette))
 
     def set_colors_from_settings(self):
-        transparency = self.settings.styleBackground.get_int("transparency")
-        colorRGBA = Gdk.RGBA(0, 0, 0, 0)
-        palette_list = []
-        for color in self.settings.styleFont.get_string("palette").split(":"):
-            colorRGBA.parse(color)
-            palette_list.append(colorRGBA.copy())
-
-        if len(palette_list) > 16:
-            bg_color = palette_list[17]
-        else:
-            bg_color = Gdk.RGBA(255, 255, 255, 0)
-
-            bg_color.alpha = 1 / 100 * transparency
-
-        if len(palette_list) > 16:
-            font_color = palette_list[16]
-        else:
-            font_color = Gdk.RGBA(0, 0, 0, 0)
-
-        self.demo_terminal.set_color_foreground(font_color)
-        self.demo_terminal.set_color_bold(font_color)
-        self.demo_terminal.set_colors(font_color, bg_color, palette_list[:16])
+        self.update_demo_palette(self.settings.styleFont.get_string("palette"))
 
     # TO HERE (see above)
     def fill_palette_names(self):
@@ -0,0 +1,421 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib
+
+from guake.globals import TABS_SESSION_SCHEMA_VERSION
+
+log = logging.getLogger(__name__)
+
+
+def write_session_file(session_file, config):
+    """Atomically write the `config` dict as JSON into `session_file`.
+
+    The content is first written into a temporary file living in the same
+    directory, then renamed over the session file, so a crash (or a
+    concurrent reader) never sees a half written session.
+    """
+    session_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{session_file.name}.", dir=str(session_file.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, str(session_file))
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+class SessionWriter:
+    """Coalesce the session save requests into a single deferred write.
+
+    Every change of the tabs only marks the session as dirty. Once no new
+    change happened during the quiet period (`save-tabs-delay`, in
+    milliseconds), the session is snapshotted on the main loop and handed to
+    a worker thread which serializes and writes it atomically.
+
+    `saves_requested` and `saves_performed` count respectively the calls to
+    `mark_dirty` and the writes that actually reached the disk.
+    """
+
+    # A never ending burst of changes will still be written after this many
+    # quiet periods.
+    MAX_DELAY_FACTOR = 5
+
+    def __init__(self, guake, filename="session.json"):
+        self.guake = guake
+        self.filename = filename
+        self.saves_requested = 0
+        self.saves_performed = 0
+        self._timeout_id = None
+        self._dirty_since = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._worker = None
+
+    def get_delay(self):
+        return max(0, self.guake.settings.general.get_int("save-tabs-delay"))
+
+    def is_dirty(self):
+        return self._dirty_since is not None
+
+    def mark_dirty(self):
+        """Request a session save, the write happens after the quiet period."""
+        self.saves_requested += 1
+        now = time.monotonic()
+        delay = self.get_delay()
+        if self._dirty_since is None:
+            self._dirty_since = now
+        elif now - self._dirty_since > delay * self.MAX_DELAY_FACTOR / 1000:
+            # Do not postpone the write forever, let the pending timeout fire
+            return
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+        self._timeout_id = GLib.timeout_add(delay, self._on_quiet_period_elapsed)
+
+    def _on_quiet_period_elapsed(self):
+        self._timeout_id = None
+        self.flush(wait=False)
+        return False
+
+    def cancel(self):
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+        self._dirty_since = None
+
+    def flush(self, wait=True):
+        """Write the session now if it is dirty.
+
+        Must be called from the main loop, since the snapshot walks the
+        widgets. With `wait`, returns only when the session is on the disk
+        (used when quitting).
+        """
+        if self.is_dirty():
+            self.cancel()
+            session_file = self.guake.get_xdg_config_directory() / self.filename
+            self._submit(session_file, self.guake.build_session())
+        if wait:
+            self.join()
+
+    def write_now(self):
+        """Write the session synchronously, superseding any deferred save.
+
+        A write already running in the worker is waited for first, so its
+        older snapshot can not replace the file written here.
+        """
+        self.cancel()
+        with self._lock:
+            self._pending = None
+        self.join()
+        session_file = self.guake.get_xdg_config_directory() / self.filename
+        write_session_file(session_file, self.guake.build_session())
+        with self._lock:
+            self.saves_performed += 1
+        log.info("Guake tabs saved to %s", session_file)
+
+    def join(self):
+        with self._lock:
+            worker = self._worker
+        if worker is not None:
+            worker.join()
+
+    def _submit(self, session_file, config):
+        with self._lock:
+            # Only the latest snapshot matters, drop any older one not yet written
+            self._pending = (session_file, config)
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._write_pending, daemon=True)
+            self._worker.start()
+
+    def _write_pending(self):
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._worker = None
+                    return
+                session_file, config = self._pending
+                self._pending = None
+            try:
+                write_session_file(session_file, config)
+            except Exception:
+                log.exception("Unable to save the tabs to %s", session_file)
+                continue
+            with self._lock:
+                self.saves_performed += 1
+            log.info("Guake tabs saved to %s", session_file)
+
+
+def make_tab(panes, label, page):
+    """Returns the entry of the tab `page` in the session"""
+    tab = {
+        "panes": panes,
+        "label": label,
+        "custom_label_set": getattr(page, "custom_label_set", False),
+    }
+    last_used = getattr(page, "last_used", None)
+    if last_used is not None:
+        tab["last_used"] = last_used
+    return tab
+
+
+class SessionModel:
+    """In-memory mirror of the tabs session, kept up to date incrementally.
+
+    The tabs, their panes and the state of every terminal are cached once
+    serialized. Widgets invalidate the entries they own on the events they
+    already handle (split, close, rename, reorder, cwd or colors change),
+    so building the session only redoes the work for what changed since the
+    last save.
+    """
+
+    def __init__(self, guake):
+        self.guake = guake
+        # All keyed by widget, entries vanish with the widgets
+        self._workspaces = weakref.WeakKeyDictionary()  # TerminalNotebook -> [tab]
+        self._tabs = weakref.WeakKeyDictionary()  # RootTerminalBox -> tab
+        self._terminals = weakref.WeakKeyDictionary()  # GuakeTerminal -> pane
+
+    def notebook_changed(self, notebook):
+        """Pages have been added, removed or reordered in `notebook`"""
+        if notebook is not None:
+            self._workspaces.pop(notebook, None)
+
+    def page_changed(self, page):
+        """The layout or the label of the `page` (a RootTerminalBox) changed"""
+        if page is None:
+            return
+        self._tabs.pop(page, None)
+        self.notebook_changed(page.get_notebook())
+
+    def terminal_changed(self, terminal):
+        """The directory or the custom colors of `terminal` changed"""
+        self._terminals.pop(terminal, None)
+        box = terminal.get_parent()
+        if box is not None and box.get_parent() is not None:
+            self.page_changed(box.get_root_box())
+
+    def refresh_directories(self):
+        """Drop the panes whose directory is outdated. Only the terminals
+        reporting their directory with OSC 7 tell when it changes, for the
+        others it has to be read again."""
+        for terminal, pane in list(self._terminals.items()):
+            if terminal.has_osc7_directory():
+                continue
+            if terminal.get_current_directory() != pane["directory"]:
+                self.terminal_changed(terminal)
+
+    def get_terminal_pane(self, terminal):
+        pane = self._terminals.get(terminal)
+        if pane is None:
+            pane = {
+                "type": "term",
+                "directory": terminal.get_current_directory(),
+                "custom_colors": terminal.get_custom_colors_dict(),
+            }
+            self._terminals[terminal] = pane
+        return pane
+
+    def get_tab(self, notebook, page):
+        tab = self._tabs.get(page)
+        if tab is None:
+            # A tab not restored yet keeps the layout it was restored from
+            panes = self.guake.restore_queue.get_pending_panes(page)
+            if panes is None:
+                panes = []
+                page.save_box_layout(page.child, panes, self.get_terminal_pane)
+            tab = make_tab(panes, notebook.get_tab_text_page(page), page)
+            self._tabs[page] = tab
+        return tab
+
+    def get_workspace_tabs(self, notebook):
+        tabs = self._workspaces.get(notebook)
+        if tabs is None:
+            tabs = []
+            for page in notebook.iter_pages():
+                try:
+                    tabs.append(self.get_tab(notebook, page))
+                except FileNotFoundError:
+                    # discard same broken tabs
+                    pass
+            self._workspaces[notebook] = tabs
+        return tabs
+
+    def build(self):
+        """Returns the tabs session of all workspaces, as saved in session.json
+
+        Cached entries are shared between the successive sessions returned and
+        are never modified in place, so a session can be serialized from
+        another thread.
+        """
+        config = {
+            "schema_version": TABS_SESSION_SCHEMA_VERSION,
+            "timestamp": int(time.time()),
+            "workspace": {},
+        }
+        self.refresh_directories()
+        for key, nb in self.guake.notebook_manager.get_notebooks().items():
+            # NOTE: Maybe we will have frame inside the workspace in future
+            #       So lets use list to store the tabs (as for each frame)
+            config["workspace"][key] = [self.get_workspace_tabs(nb)]
+        return config
+
+    def build_full(self):
+        """Same as `build`, but walks all the widgets without using the cache"""
+        config = {
+            "schema_version": TABS_SESSION_SCHEMA_VERSION,
+            "timestamp": int(time.time()),
+            "workspace": {},
+        }
+        for key, nb in self.guake.notebook_manager.get_notebooks().items():
+            tabs = []
+            for index in range(nb.get_n_pages()):
+                try:
+                    page = nb.get_nth_page(index)
+                    panes = self.guake.restore_queue.get_pending_panes(page)
+                    if panes is None:
+                        panes = []
+                        page.save_box_layout(page.child, panes)
+                    tabs.append(make_tab(panes, nb.get_tab_text_index(index), page))
+                except FileNotFoundError:
+                    # discard same broken tabs
+                    pass
+            config["workspace"][key] = [tabs]
+        return config
+
+
+class TabRestoreQueue:
+    """Restore the layout of the tabs of a session from the main loop.
+
+    Every restored tab is pushed as a pending entry, then the splits are
+    replayed by an idle callback, a few tabs per main loop iteration, so the
+    window keeps drawing and handling events while a large session is being
+    restored. A tab which is needed right now (e.g. it becomes the current
+    page) is restored immediately with `restore_page`.
+
+    A tab pushed as `lazy` is not restored by the idle callback: it stays an
+    empty page, with only its label, until it is needed (or `warm`ed).
+
+    Progress is available with `get_progress`, as `(restored, total)`, the
+    lazy tabs are not counted until they are restored.
+    """
+
+    # Maximal time spent restoring tabs in a single idle callback, in seconds
+    TIME_SLICE = 0.01
+
+    def __init__(self):
+        self._pending = {}  # RootTerminalBox -> (TerminalBox, panes), in insertion order
+        self._lazy = weakref.WeakKeyDictionary()  # RootTerminalBox -> (TerminalBox, panes)
+        self._idle_id = None
+        self.total = 0
+        self.restored = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def push(self, root, box, panes, lazy=False):
+        """Schedule the restore of `panes` into `box`, in the tab `root`"""
+        if lazy:
+            self._lazy[root] = (box, panes)
+            return
+        if not self._pending:
+            self.total = self.restored = 0
+        self._pending[root] = (box, panes)
+        self.total += 1
+        if self._idle_id is None:
+            self._idle_id = GLib.idle_add(self._on_idle)
+
+    def warm(self, root):
+        """Restore the lazy tab `root` from the idle callback, as the other tabs"""
+        entry = self._lazy.pop(root, None)
+        if entry is not None:
+            self.push(root, *entry)
+
+    def get_progress(self):
+        return self.restored, self.total
+
+    def is_pending(self, root):
+        return root in self._pending or root in self._lazy
+
+    def get_pending_panes(self, root):
+        """Returns (a copy of) the layout `root` will be restored from, None if it
+        is not pending"""
+        entry = self._pending.get(root) or self._lazy.get(root)
+        if entry is None:
+            return None
+        return list(entry[1])
+
+    def restore_page(self, root):
+        """Restore the tab `root` now, if it is still pending"""
+        entry = self._pending.pop(root, None)
+        if entry is None:
+            entry = self._lazy.pop(root, None)
+            if entry is None:
+                return False
+            self.total += 1
+        box, panes = entry
+        self.restored += 1
+        if root.get_parent() is None:
+            # The tab has been closed in the meantime
+            return False
+        try:
+            root.restore_box_layout(box, panes)
+        except Exception:
+            log.exception("Unable to restore the layout of tab %s", root)
+            return False
+        log.debug("Restored tab %d/%d", self.restored, self.total)
+        return True
+
+    def flush(self):
+        """Restore all the pending tabs now, except the lazy ones"""
+        while self._pending:
+            self.restore_page(next(iter(self._pending)))
+        self._stop()
+
+    def _stop(self):
+        if self._idle_id is not None:
+            GLib.source_remove(self._idle_id)
+            self._idle_id = None
+
+    def _on_idle(self):
+        deadline = time.monotonic() + self.TIME_SLICE
+        while self._pending and time.monotonic() < deadline:
+            self.restore_page(next(iter(self._pending)))
+        if self._pending:
+            return True
+        self._idle_id = None
+        log.info("Restored the layout of %d tabs", self.total)
+        return False
@@ -24,15 +24,120 @@ import subprocess
 import gi
 
 gi.require_version("Gtk", "3.0")
+from gi.repository import GLib
 from gi.repository import Gio
 
 log = logging.getLogger(__name__)
 
+DCONF_PATH = "/org/guake/"
+
+
+class SettingsCache:
+    """Values of the keys of a Gio.Settings, as python objects.
+
+    A key is read (and unpacked from its GVariant) the first time it is asked,
+    then served from memory until the key changes. It is meant for the code
+    reading a setting on every event (title changes, key presses...):
+
+        if settings.general.cached.use_vte_titles:
+            ...
+
+    A key can be given as an attribute (dashes replaced by underscores) or as
+    an item, `settings.general.cached["use-vte-titles"]`. Enum keys give their
+    nick, like `get_string` does.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+        self._values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        try:
+            value = self._values[key]
+        except KeyError:
+            self.misses += 1
+            value = self._values[key] = self._settings.get_value(key).unpack()
+            return value
+        self.hits += 1
+        return value
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name.replace("_", "-")]
+
+    def invalidate(self, key=None):
+        """Forget the value of `key`, or of all the keys"""
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
+
+
+def iter_settings(schema_source):
+    """Yields (section, Gio.Settings) for each Guake schema, the section being
+    the path of the schema relative to /org/guake/, as in `dconf dump`"""
+    schemas, _ = schema_source.list_schemas(True)
+    prefix_len = len(DCONF_PATH)
+    for schema_id in sorted(schemas):
+        if schema_id != "guake" and not schema_id.startswith("guake."):
+            continue
+        schema = schema_source.lookup(schema_id, True)
+        section = schema.get_path()[prefix_len:].rstrip("/") or "/"
+        yield section, Gio.Settings.new_full(schema, None, None)
+
+
+def export_settings(schema_source, ignore=()):
+    """Returns the settings changed by the user, in the format of
+    `dconf dump /org/guake/`, without running dconf. The keys in `ignore`
+    are left out."""
+    lines = []
+    for section, settings in iter_settings(schema_source):
+        values = []
+        for key in sorted(settings.props.settings_schema.list_keys()):
+            value = settings.get_user_value(key)
+            if value is not None and key not in ignore:
+                values.append(f"{key}={value.print_(True)}")
+        if values:
+            lines += [f"[{section}]"] + values + [""]
+    return "\n".join(lines)
+
+
+def import_settings(schema_source, data):
+    """Set the settings from `data`, in the format of `dconf dump /org/guake/`
+    (as `dconf load /org/guake/` would), without running dconf"""
+    keyfile = GLib.KeyFile()
+    keyfile.load_from_data(data, len(data.encode("utf-8")), GLib.KeyFileFlags.NONE)
+    all_settings = dict(iter_settings(schema_source))
+    for section in keyfile.get_groups()[0]:
+        settings = all_settings.get(section)
+        if settings is None:
+            log.warning("Unknown settings section [%s], skipped", section)
+            continue
+        schema = settings.props.settings_schema
+        settings.delay()
+        for key in keyfile.get_keys(section)[0]:
+            if not schema.has_key(key):
+                log.warning("Unknown setting %s in [%s], skipped", key, section)
+                continue
+            value_type = schema.get_key(key).get_value_type()
+            try:
+                value = GLib.Variant.parse(value_type, keyfile.get_value(section, key), None, None)
+            except GLib.Error:  # pylint: disable=catching-non-exception
+                log.warning("Invalid value for %s in [%s], skipped", key, section)
+                continue
+            settings.set_value(key, value)
+        settings.apply()
+    Gio.Settings.sync()
+
 
 class Settings:
     def __init__(self, schema_source):
-        Settings.compat()
         Settings.enhanceSetting()
+        self.schema_source = schema_source
+        self._has_user_settings = None
 
         self.guake = Gio.Settings.new_full(
             Gio.SettingsSchemaSource.lookup(schema_source, "guake", False), None, None
@@ -107,6 +212,7 @@ class Settings:
     def enhanceSetting():
         def initEnhancements(self):
             self.listeners = {}
+            self.cached = SettingsCache(self)
 
         def onChangedValue(self, key, user_func):
             if key not in self.listeners:
@@ -114,6 +220,8 @@ class Settings:
             self.listeners[key].append(user_func)
 
         def triggerOnChangedValue(self, settings, key, user_data=None):
+            # Before the listeners, they may read the new value from the cache
+            self.cached.invalidate(key)
             if key in self.listeners:
                 for func in self.listeners[key]:
                     func(settings, key, user_data)
@@ -122,17 +230,36 @@ class Settings:
         gi.repository.Gio.Settings.onChangedValue = onChangedValue
         gi.repository.Gio.Settings.triggerOnChangedValue = triggerOnChangedValue
 
-    def compat():
-        try:
-            if len(subprocess.check_output(["dconf", "dump", "/org/guake/"])) == 0:
+    def check_user_settings(self):
+        """Record whether the user has any setting of this Guake version.
+
+        Must be called before Guake writes any key at startup, `compat` (run
+        later) relies on it to know if the old settings should be copied."""
+        if self.general.get_boolean("legacy-settings-migrated"):
+            return
+        # Guake itself sets these ones before this is run
+        ignore = ("schema-version", "legacy-settings-migrated")
+        self._has_user_settings = bool(export_settings(self.schema_source, ignore))
+
+    def compat(self):
+        """Copy the settings of old Guake versions (/apps/guake/) if there were
+        no settings at startup (see `check_user_settings`). This is only done
+        once, recorded in `legacy-settings-migrated` when it succeeded, so
+        dconf is not run at every start."""
+        if self.general.get_boolean("legacy-settings-migrated"):
+            return
+        if self._has_user_settings is None:
+            self.check_user_settings()
+        if not self._has_user_settings:
+            try:
                 prefs = subprocess.check_output(["dconf", "dump", "/apps/guake/"])
-                if len(prefs) > 0:
-                    with subprocess.Popen(
-                        ["dconf", "load", "/org/guake/"], stdin=subprocess.PIPE
-                    ) as p:
-                        p.communicate(input=prefs)
-        except FileNotFoundError:
-            log.exception(
-                """First run with newer Guake version detected.
+            except FileNotFoundError:
+                log.exception(
+                    """First run with newer Guake version detected.
 dconf not installed, skipping preferences transfer."""
-            )
+                )
+            else:
+                if len(prefs) > 0:
+                    # On error, this is raised and tried again at the next start
+                    import_settings(self.schema_source, prefs.decode("utf-8"))
+        self.general.set_boolean("legacy-settings-migrated", True)
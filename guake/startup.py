@@ -0,0 +1,74 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import logging
+import sys
+import time
+
+from contextlib import contextmanager
+
+# Only the standard library here: this module is imported first, to time
+# the imports of the others
+
+log = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    """Timings of the startup phases, printed with `guake --profile-startup`"""
+
+    def __init__(self):
+        self.enabled = False
+        self.start = time.monotonic()
+        self.phases = []  # [(name, start, duration)], in seconds
+        self.depth = 0
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.monotonic()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            self.phases.append(
+                ("  " * self.depth + name, start - self.start, time.monotonic() - start)
+            )
+
+    def mark(self, name):
+        """Record that the startup reached the point `name`"""
+        if self.enabled:
+            self.phases.append((name, time.monotonic() - self.start, None))
+
+    def report(self, file=None):
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        print("Guake startup profile (ms):", file=file)
+        # Sorted by start time, the nested phases end before their parents
+        for name, start, duration in sorted(self.phases, key=lambda p: p[1]):
+            if duration is None:
+                print(f"{start * 1000:9.1f}            {name}", file=file)
+            else:
+                print(f"{start * 1000:9.1f} {duration * 1000:9.1f}  {name}", file=file)
+
+
+PROFILER = StartupProfiler()
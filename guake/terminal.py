@@ -23,9 +23,11 @@ import os
 import re
 import shlex
 import signal
+import socket
 import subprocess
 import sys
 import threading
+import time
 import uuid
 
 from enum import IntEnum
@@ -50,6 +52,9 @@ from guake.common import clamp
 from guake.globals import QUICK_OPEN_MATCHERS
 from guake.globals import TERMINAL_MATCH_EXPRS
 from guake.globals import TERMINAL_MATCH_TAGS
+from guake.terminal_log import LogWriter
+from guake.terminal_log import TerminalLogger
+from guake.terminal_log import get_default_log_directory
 
 log = logging.getLogger(__name__)
 
@@ -85,6 +90,108 @@ def halt(loc):
 
 __all__ = ["GuakeTerminal"]
 
+# Used by GuakeTerminal.is_file_on_local_server
+FILE_LINE_COLUMN_RE = re.compile(r"(.*)\:(\d+)\:(\d+)$")
+FILE_LINE_RE = re.compile(r"(.*)\:(\d+)$")
+FILE_PYTHON_FUNCTION_RE = re.compile(r"^(.*)\:\:([a-zA-Z0-9\_]+)$")
+
+
+class MatcherRegistry:
+    """Compile once the regular expressions used to match links and quick
+    open patterns, and share them between all the terminals.
+
+    It holds the built-in TERMINAL_MATCH_EXPRS and QUICK_OPEN_MATCHERS, plus
+    the user ones from the `quick-open-user-matchers` setting.
+    `compile_count` tells how many regular expressions have been compiled,
+    by kind ("vte", "glib" and "re").
+    """
+
+    # NOTE: PCRE2_UTF | PCRE2_NO_UTF_CHECK | PCRE2_MULTILINE
+    # reference from vte/bindings/vala/app.vala, flags = 0x40080400u
+    # also ref: https://mail.gnome.org/archives/commits-list/2016-September/msg06218.html
+    VTE_REGEX_FLAGS = 0x40080400
+
+    def __init__(self):
+        self.user_matchers = []
+        self.compile_count = {"vte": 0, "glib": 0, "re": 0}
+        self._vte = {}
+        self._glib = {}
+        self._re = {}
+
+    def get_quick_open_matchers(self):
+        return QUICK_OPEN_MATCHERS + self.user_matchers
+
+    def _get(self, cache, kind, expr, compile_func):
+        if expr not in cache:
+            self.compile_count[kind] += 1
+            try:
+                cache[expr] = compile_func(expr)
+            except Exception as e:
+                # Do not try again for every terminal
+                cache[expr] = e
+        value = cache[expr]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def get_vte_regex(self, expr):
+        return self._get(
+            self._vte,
+            "vte",
+            expr,
+            lambda e: Vte.Regex.new_for_match(e, len(e), self.VTE_REGEX_FLAGS),
+        )
+
+    def get_glib_regex(self, expr):
+        compile_flag = 0
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 44):
+            compile_flag = GLib.RegexCompileFlags.MULTILINE
+        return self._get(self._glib, "glib", expr, lambda e: GLib.Regex.new(e, compile_flag, 0))
+
+    def get_re(self, expr):
+        return self._get(self._re, "re", expr, re.compile)
+
+    def _compile_all(self, compile_func):
+        regexes = [compile_func(expr) for expr in TERMINAL_MATCH_EXPRS]
+        regexes += [compile_func(match) for _, match, _ in QUICK_OPEN_MATCHERS]
+        # A broken user matcher must not disable the built-in ones
+        for title, match, _ in self.user_matchers:
+            try:
+                regexes.append(compile_func(match))
+            except GLib.Error as e:  # pylint: disable=catching-non-exception
+                log.warning("Ignoring quick open matcher %r: %s", title, e)
+        return regexes
+
+    def get_vte_regexes(self):
+        return self._compile_all(self.get_vte_regex)
+
+    def get_glib_regexes(self):
+        return self._compile_all(self.get_glib_regex)
+
+    def set_user_matchers(self, matchers):
+        """Set the user quick open matchers, as (title, matcher, extractor) tuples.
+
+        Returns True if they changed. Matchers whose extractor is not a valid
+        python regular expression are ignored.
+        """
+        valid = []
+        for title, matcher, extractor in matchers:
+            try:
+                self.get_re(extractor)
+            except re.error as e:
+                log.warning("Ignoring quick open matcher %r: %s", title, e)
+                continue
+            valid.append((title, matcher, extractor))
+        changed = valid != self.user_matchers
+        self.user_matchers = valid
+        return changed
+
+    def load_user_matchers(self, settings):
+        return self.set_user_matchers(settings.get_value("quick-open-user-matchers").unpack())
+
+
+MATCHERS = MatcherRegistry()
+
 # pylint: enable=anomalous-backslash-in-string
 
 
@@ -96,6 +203,10 @@ class DropTargets(IntEnum):
 class GuakeTerminal(Vte.Terminal):
     """Just a vte.Terminal with some properties already set."""
 
+    # How long the working directory read from /proc is trusted, in seconds.
+    # Kept short: without OSC 7, nothing tells when the shell changes directory
+    CWD_CACHE_TTL = 0.25
+
     def __init__(self, guake):
         super().__init__()
         self.guake = guake
@@ -108,11 +219,26 @@ class GuakeTerminal(Vte.Terminal):
         self.handler_ids.append(self.connect("button-press-event", self.button_press))
         self.connect("child-exited", self.on_child_exited)  # Call on_child_exited, don't remove it
         self.connect("selection-changed", self.copy_on_select)
+        self.connect("current-directory-uri-changed", self.on_current_directory_uri_changed)
+        # Working directory reported by the shell (OSC 7), if it does
+        self._osc7_directory = None
+        # (directory, time.monotonic() of the readlink)
+        self._cwd_cache = None
         self.matched_value = ""
         self.font_scale_index = 0
         self._pid = None
+        self._spawned_callbacks = []
+        self._kill_on_spawn = False
+        # Message of the error if the shell could not be spawned
+        self.spawn_error = None
+        # Directory the shell is spawned in, until its pid is known
+        self.spawn_directory = None
+        self._destroyed = False
         self.found_link = None
         self.uuid = uuid.uuid4()
+        # TerminalLogger while the output is logged to a file
+        self.logger = None
+        self.connect("destroy", self.on_destroy)
 
         # Custom colors
         self.custom_bgcolor = None
@@ -169,7 +295,7 @@ class GuakeTerminal(Vte.Terminal):
             guake_clipboard.set_text(self.matched_value, len(self.matched_value))
 
     def copy_on_select(self, event):
-        if self.guake.settings.general.get_boolean("copy-on-select") and self.get_has_selection():
+        if self.guake.settings.general.cached.copy_on_select and self.get_has_selection():
             self.copy_clipboard()
 
     def configure_terminal(self):
@@ -218,39 +344,23 @@ class GuakeTerminal(Vte.Terminal):
 
     def add_matches(self):
         """Adds all regular expressions declared in
-        guake.globals.TERMINAL_MATCH_EXPRS to the terminal to make vte
-        highlight text that matches them.
+        guake.globals.TERMINAL_MATCH_EXPRS and the quick open matchers to the
+        terminal to make vte highlight text that matches them.
+
+        The regular expressions are compiled once for all the terminals, see
+        `MatcherRegistry`.
         """
         try:
-            # NOTE: PCRE2_UTF | PCRE2_NO_UTF_CHECK | PCRE2_MULTILINE
-            # reference from vte/bindings/vala/app.vala, flags = 0x40080400u
-            # also ref: https://mail.gnome.org/archives/commits-list/2016-September/msg06218.html
-            VTE_REGEX_FLAGS = 0x40080400
-            for expr in TERMINAL_MATCH_EXPRS:
-                tag = self.match_add_regex(
-                    Vte.Regex.new_for_match(expr, len(expr), VTE_REGEX_FLAGS), 0
-                )
-                self.match_set_cursor_name(tag, "hand")
-
-            for _useless, match, _otheruseless in QUICK_OPEN_MATCHERS:
-                tag = self.match_add_regex(
-                    Vte.Regex.new_for_match(match, len(match), VTE_REGEX_FLAGS), 0
-                )
+            for regex in MATCHERS.get_vte_regexes():
+                tag = self.match_add_regex(regex, 0)
                 self.match_set_cursor_name(tag, "hand")
         except (
             GLib.Error,
             AttributeError,
         ):  # pylint: disable=catching-non-exception
             try:
-                compile_flag = 0
-                if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 44):
-                    compile_flag = GLib.RegexCompileFlags.MULTILINE
-                for expr in TERMINAL_MATCH_EXPRS:
-                    tag = self.match_add_gregex(GLib.Regex.new(expr, compile_flag, 0), 0)
-                    self.match_set_cursor_type(tag, Gdk.CursorType.HAND2)
-
-                for _useless, match, _otheruseless in QUICK_OPEN_MATCHERS:
-                    tag = self.match_add_gregex(GLib.Regex.new(match, compile_flag, 0), 0)
+                for regex in MATCHERS.get_glib_regexes():
+                    tag = self.match_add_gregex(regex, 0)
                     self.match_set_cursor_type(tag, Gdk.CursorType.HAND2)
             except GLib.Error as err:  # pylint: disable=catching-non-exception
                 log.error(
@@ -262,16 +372,47 @@ class GuakeTerminal(Vte.Terminal):
                 )
 
     def get_current_directory(self):
+        """Returns the working directory of the shell.
+
+        The directory reported by the shell with the OSC 7 escape sequence is
+        used when available, otherwise the one read from /proc, cached for
+        CWD_CACHE_TTL seconds.
+        """
+        if self._osc7_directory is not None:
+            return self._osc7_directory
+        if self.pid is None:
+            # Still being spawned
+            return self.spawn_directory or os.path.expanduser("~")
         directory = os.path.expanduser("~")
-        if self.pid is not None:
-            try:
-                cwd = os.readlink(f"/proc/{self.pid}/cwd")
-            except Exception:
-                return directory
-            if os.path.exists(cwd):
-                directory = cwd
+        now = time.monotonic()
+        if self._cwd_cache is not None and now - self._cwd_cache[1] < self.CWD_CACHE_TTL:
+            return self._cwd_cache[0]
+        try:
+            cwd = os.readlink(f"/proc/{self.pid}/cwd")
+        except Exception:
+            return directory
+        if os.path.exists(cwd):
+            directory = cwd
+        self._cwd_cache = (directory, now)
         return directory
 
+    def has_osc7_directory(self):
+        return self._osc7_directory is not None
+
+    def invalidate_current_directory(self):
+        self._cwd_cache = None
+
+    def on_current_directory_uri_changed(self, terminal):
+        uri = self.get_current_directory_uri()
+        directory = None
+        if uri:
+            parsed = urlparse(uri)
+            # Only trust a directory of this machine (ssh sessions report theirs)
+            if parsed.scheme == "file" and parsed.netloc in ("", "localhost", socket.gethostname()):
+                directory = unquote(parsed.path)
+        self._osc7_directory = directory
+        self._cwd_cache = None
+
     def is_file_on_local_server(self, text) -> Tuple[Optional[Path], Optional[int], Optional[int]]:
         """Test if the provided text matches a file on local server
 
@@ -294,20 +435,20 @@ class GuakeTerminal(Vte.Terminal):
         colno = None
         py_func = None
         # "<File>:<line>:<col>"
-        m = re.compile(r"(.*)\:(\d+)\:(\d+)$").match(text)
+        m = FILE_LINE_COLUMN_RE.match(text)
         if m:
             text = m.group(1)
             lineno = m.group(2)
             colno = m.group(3)
         else:
             # "<File>:<line>"
-            m = re.compile(r"(.*)\:(\d+)$").match(text)
+            m = FILE_LINE_RE.match(text)
             if m:
                 text = m.group(1)
                 lineno = m.group(2)
             else:
                 # "<File>::<python_function>"
-                m = re.compile(r"^(.*)\:\:([a-zA-Z0-9\_]+)$").match(text)
+                m = FILE_PYTHON_FUNCTION_RE.match(text)
                 if m:
                     text = m.group(1)
                     py_func = m.group(2).strip()
@@ -350,7 +491,7 @@ class GuakeTerminal(Vte.Terminal):
         """
         self.matched_value = ""
 
-        if self.guake.settings.general.get_boolean("quick-open-enable"):
+        if self.guake.settings.general.cached.quick_open_enable:
             if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 46):
                 matched_string = self.match_check_event(event)
             else:
@@ -381,8 +522,10 @@ class GuakeTerminal(Vte.Terminal):
     def on_child_exited(self, target, status, *user_data):
         if None not in (libutempter, self.get_pty()):
             libutempter.utempter_remove_record(self.get_pty().get_fd())
+        self.stop_logging()
+        self.guake.events.emit("terminal-exited", str(self.uuid), status)
 
-    def on_drag_data_received(self, widget, drag_context, x, y, data, info, time):
+    def on_drag_data_received(self, widget, drag_context, x, y, data, info, _time):
         if info == DropTargets.URIS:
             uris = data.get_uris()
             for uri in uris:
@@ -416,8 +559,8 @@ class GuakeTerminal(Vte.Terminal):
                 self.browse_link_under_cursor()
 
     def _find_quick_matcher(self, value):
-        for _useless, _otheruseless, extractor in QUICK_OPEN_MATCHERS:
-            g = re.compile(extractor).match(value)
+        for _useless, _otheruseless, extractor in MATCHERS.get_quick_open_matchers():
+            g = MATCHERS.get_re(extractor).match(value)
             if g and g.groups():
                 filename = g.group(1).strip()
                 if len(g.groups()) >= 2:
@@ -528,6 +671,10 @@ class GuakeTerminal(Vte.Terminal):
 
     def kill(self):
         pid = self.pid
+        if pid is None:
+            # Still being spawned, kill the shell as soon as we know its pid
+            self._kill_on_spawn = True
+            return
         threading.Thread(target=self.delete_shell, args=(pid,)).start()
 
     def delete_shell(self, pid):
@@ -555,8 +702,7 @@ class GuakeTerminal(Vte.Terminal):
         except OSError:
             pass
 
-    def spawn_sync_pid(self, directory):
-
+    def get_spawn_argv(self):
         argv = []
         user_shell = self.guake.settings.general.get_string("default-shell")
         if user_shell and os.path.exists(user_shell):
@@ -570,7 +716,10 @@ class GuakeTerminal(Vte.Terminal):
         login_shell = self.guake.settings.general.get_boolean("use-login-shell")
         if login_shell:
             argv.append("--login")
+        return argv
 
+    def spawn_sync_pid(self, directory):
+        argv = self.get_spawn_argv()
         log.debug('Spawn command: "%s"', " ".join(argv))
 
         pid = self.spawn_sync(
@@ -595,10 +744,112 @@ class GuakeTerminal(Vte.Terminal):
         if not isinstance(pid, int):
             raise TypeError("pid must be an int")
 
+        self.on_spawned(pid)
+        return pid
+
+    def spawn_async_pid(self, directory):
+        """Spawn the shell without waiting for it to be forked and executed.
+
+        The pid is set, and the callbacks registered with `when_spawned` are
+        called, once the shell is running. Falls back to `spawn_sync_pid` with
+        VTE older than 0.48, which has no `spawn_async`.
+        """
+        self.spawn_directory = directory
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) < (0, 48):
+            self.spawn_sync_pid(directory)
+            return
+        argv = self.get_spawn_argv()
+        log.debug('Spawn command (async): "%s"', " ".join(argv))
+        self.spawn_async(
+            Vte.PtyFlags.DEFAULT,
+            directory,
+            argv,
+            self.envv,
+            GLib.SpawnFlags(Vte.SPAWN_NO_PARENT_ENVV),
+            None,
+            None,
+            -1,
+            None,
+            self.on_spawn_async_done,
+            None,
+        )
+
+    def on_destroy(self, terminal):
+        self._destroyed = True
+        self.stop_logging()
+
+    def on_spawn_async_done(self, terminal, pid, error, *user_data):
+        if error is not None or pid == -1:
+            self.on_spawn_failed(error.message if error is not None else "")
+            return
+        self.on_spawned(pid)
+
+    def on_spawn_failed(self, message):
+        """There is no shell: the error is shown in the terminal, left open
+        for the user to read it, unless it was killed meanwhile"""
+        log.error("Unable to spawn the shell: %s", message)
+        self.spawn_error = message
+        # They need a running shell, there will never be one
+        self._spawned_callbacks = []
+        if self._kill_on_spawn:
+            # Closed while it was spawned, remove it as if its shell exited
+            self.emit("child-exited", 1)
+            return
+        text = _("Unable to start the shell: {message}").format(message=message)
+        self.feed(f"\x1b[31m{text}\x1b[0m\r\n".encode("utf-8"))
+
+    def on_spawned(self, pid):
+        self.pid = pid
+        if self._destroyed or self.get_pty() is None:
+            # Closed while it was spawned
+            self._spawned_callbacks = []
+            self.kill()
+            return
         if libutempter is not None:
             libutempter.utempter_add_record(self.get_pty().get_fd(), os.uname()[1])
-        self.pid = pid
-        return pid
+        callbacks, self._spawned_callbacks = self._spawned_callbacks, []
+        for callback in callbacks:
+            callback(self)
+        if self._kill_on_spawn:
+            self.kill()
+
+    def start_logging(self, path=None):
+        """Log the output of the terminal to `path` (by default a new file in the
+        terminal-log-directory), returns the path of the log"""
+        self.stop_logging()
+        settings = self.guake.settings.general.cached
+        if not path:
+            directory = settings.terminal_log_directory
+            directory = Path(directory).expanduser() if directory else get_default_log_directory()
+            path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.uuid}.log"
+        writer = LogWriter(
+            path,
+            max_bytes=settings.terminal_log_max_size * 1024 * 1024,
+            backup_count=settings.terminal_log_backups,
+            compress=settings.terminal_log_compress,
+        )
+        self.logger = TerminalLogger(self, writer)
+        log.info("Logging the output of terminal %s to %s", self.uuid, writer.path)
+        return writer.path
+
+    def stop_logging(self):
+        if self.logger is not None:
+            self.logger.stop()
+            self.logger = None
+
+    def is_logging(self):
+        return self.logger is not None
+
+    def is_spawned(self):
+        return self.pid is not None
+
+    def when_spawned(self, callback):
+        """Call `callback(terminal)` once the shell is running (immediately if it
+        already is, never if it could not be spawned)"""
+        if self.is_spawned():
+            callback(self)
+        elif self.spawn_error is None:
+            self._spawned_callbacks.append(callback)
 
     def set_color_foreground(self, font_color, *args, **kwargs):
         real_fgcolor = self.custom_fgcolor if self.custom_fgcolor else font_color
@@ -622,17 +873,30 @@ class GuakeTerminal(Vte.Terminal):
         """Sets custom foreground color for this terminal"""
         print(f"set_color_foreground_custom: {self.uuid}")
         self.custom_fgcolor = fgcolor
+        self.guake.session_model.terminal_changed(self)
+        self.forget_applied_colors()
         super().set_color_foreground(self.custom_fgcolor, *args, **kwargs)
 
     def set_color_background_custom(self, bgcolor, *args, **kwargs):
         """Sets custom background color for this terminal"""
         self.custom_bgcolor = bgcolor
+        self.guake.session_model.terminal_changed(self)
+        self.forget_applied_colors()
         super().set_color_background(self.custom_bgcolor, *args, **kwargs)
 
     def reset_custom_colors(self):
         self.custom_fgcolor = None
         self.custom_bgcolor = None
         self.custom_palette = None
+        self.guake.session_model.terminal_changed(self)
+        self.forget_applied_colors()
+
+    def forget_applied_colors(self):
+        """The colors have been set without the TerminalProfileManager, so it
+        must set them again the next time it applies a profile"""
+        applied = getattr(self, "applied_profile", None)
+        if applied is not None:
+            applied.pop("colors", None)
 
     @staticmethod
     def _color_to_list(color):
@@ -684,3 +948,5 @@ class GuakeTerminal(Vte.Terminal):
             self.custom_palette = [self._color_from_list(col) for col in palette]
         else:
             self.custom_palette = None
+        self.guake.session_model.terminal_changed(self)
+        self.forget_applied_colors()
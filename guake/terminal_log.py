@@ -0,0 +1,162 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+def get_default_log_directory():
+    xdg_data_home = os.environ.get("XDG_DATA_HOME", "~/.local/share")
+    return Path(xdg_data_home, "guake", "logs").expanduser()
+
+
+class LogWriter:
+    """Append text to a file from a thread of its own.
+
+    `write` only queues the text, the thread writes everything queued at
+    once. When the file reaches `max_bytes` (0 for no limit) it is renamed
+    to `<path>.1` (gzipped to `<path>.1.gz` if `compress`), the previous
+    ones shifted, and only `backup_count` of them kept.
+    """
+
+    def __init__(self, path, max_bytes=0, backup_count=5, compress=False):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name=f"guake-log-{self.path.name}", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, text):
+        if text and self._thread.is_alive():
+            self._queue.put(text)
+
+    def close(self, wait=False):
+        """Stop the thread once everything queued has been written"""
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _backup_name(self, index):
+        suffix = ".gz" if self.compress else ""
+        return self.path.with_name(f"{self.path.name}.{index}{suffix}")
+
+    def _rotate(self):
+        if self.backup_count <= 0:
+            self.path.unlink()
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            backup = self._backup_name(index)
+            if backup.exists():
+                os.replace(backup, self._backup_name(index + 1))
+        if not self.compress:
+            os.replace(self.path, self._backup_name(1))
+            return
+        with self.path.open("rb") as src, gzip.open(self._backup_name(1), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        self.path.unlink()
+
+    def _write_queued(self, f):
+        """Write the queued text to `f` until the writer is closed or the file
+        full. Returns (closed, full)"""
+        while True:
+            chunks = [self._queue.get()]
+            while chunks[-1] is not None:
+                try:
+                    chunks.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = chunks[-1] is None
+            f.write("".join(chunk for chunk in chunks if chunk is not None))
+            f.flush()
+            full = bool(self.max_bytes) and f.tell() >= self.max_bytes
+            if closing or full:
+                return closing, full
+
+    def _run(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            closing = False
+            while not closing:
+                with self.path.open("a", encoding="utf-8") as f:
+                    closing, full = self._write_queued(f)
+                if full:
+                    self._rotate()
+                    self.path.touch()
+        except Exception:  # pylint: disable=broad-except
+            # Stop logging, write() drops the text from now on
+            log.exception("Unable to write the terminal log %s", self.path)
+
+
+class TerminalLogger:
+    """Stream the output of a terminal to a LogWriter.
+
+    The lines are written once they are complete (the cursor left them),
+    read from the terminal as they arrive, so nothing depends on the size of
+    the scrollback. The output before the logging started is not written.
+    """
+
+    def __init__(self, terminal, writer):
+        self.terminal = terminal
+        self.writer = writer
+        self.row = terminal.get_cursor_position()[1]
+        self._handler_id = terminal.connect("contents-changed", self.on_contents_changed)
+
+    @property
+    def path(self):
+        return self.writer.path
+
+    def _write_rows(self, end_row):
+        """Write the rows from self.row to `end_row` excluded"""
+        # Rows which went out of the scrollback in the meantime are lost
+        self.row = max(self.row, int(self.terminal.get_vadjustment().get_lower()))
+        if end_row <= self.row:
+            return
+        content = self.terminal.get_text_range(
+            self.row, 0, end_row - 1, self.terminal.get_column_count()
+        )
+        if content and content[0]:
+            text = content[0]
+            self.writer.write(text if text.endswith("\n") else text + "\n")
+        self.row = end_row
+
+    def on_contents_changed(self, terminal):
+        cursor_row = terminal.get_cursor_position()[1]
+        if cursor_row < self.row:
+            # Reset, or cleared scrollback
+            self.row = cursor_row
+            return
+        self._write_rows(cursor_row)
+
+    def stop(self):
+        """Write the current line too, then close the log"""
+        self.terminal.disconnect(self._handler_id)
+        self._write_rows(self.terminal.get_cursor_position()[1] + 1)
+        self.writer.close()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import collections
+import logging
+import os
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib
+
+from guake.terminal import GuakeTerminal
+
+log = logging.getLogger(__name__)
+
+
+class TerminalPool:
+    """Keep a few hidden terminals, already styled and with a running shell.
+
+    A new tab or split adopts one of them instead of constructing and
+    spawning a terminal, the pool is then refilled from an idle callback.
+    The size of the pool is the `terminal-pool-size` setting, 0 disables it.
+
+    The terminals are pooled per directory, for the last DIRECTORIES
+    directories asked to the pool ($HOME at first): only the pool of the
+    last one is refilled, the others keep their terminals until they are
+    asked again or pushed out by other directories. The pools are emptied
+    when a setting used to build the terminals (shell, font, palette...)
+    changes.
+    """
+
+    # Number of directories with pooled terminals
+    DIRECTORIES = 3
+
+    # Keys whose change makes the pooled terminals outdated, by settings name
+    INVALIDATING_KEYS = {
+        "general": ("default-shell", "use-login-shell", "use-default-font", "quick-open-enable"),
+        "styleFont": ("style", "palette"),
+    }
+
+    def __init__(self, guake):
+        self.guake = guake
+        self.hits = 0
+        self.misses = 0
+        # directory -> [(GuakeTerminal, child-exited handler id)], the most
+        # recently asked directory last
+        self._pools = collections.OrderedDict()
+        self._pools[os.path.realpath(os.environ.get("HOME", os.path.expanduser("~")))] = []
+        self._idle_id = None
+        settings = guake.settings
+        # Connect to the GSettings signal itself: the enhanced listeners are
+        # also triggered by load_config for every new terminal
+        for name, keys in self.INVALIDATING_KEYS.items():
+            for key in keys:
+                getattr(settings, name).connect(f"changed::{key}", self.on_settings_changed)
+        settings.general.connect("changed::terminal-pool-size", self.on_size_changed)
+        self.schedule_refill()
+
+    def __len__(self):
+        return sum(len(terminals) for terminals in self._pools.values())
+
+    @property
+    def directory(self):
+        """The directory where the pooled terminals are spawned"""
+        return next(reversed(self._pools))
+
+    def get_size(self):
+        return max(0, self.guake.settings.general.get_int("terminal-pool-size"))
+
+    @staticmethod
+    def _drop(terminals):
+        for terminal, handler_id in terminals:
+            terminal.disconnect(handler_id)
+            terminal.kill()
+            terminal.destroy()
+
+    def take(self, directory):
+        """Returns a pooled terminal spawned in `directory`, or None"""
+        if self.get_size() == 0:
+            return None
+        directory = os.path.realpath(directory)
+        terminals = self._pools.setdefault(directory, [])
+        # Next ones will be spawned where the terminals are now asked for
+        self._pools.move_to_end(directory)
+        while len(self._pools) > self.DIRECTORIES:
+            _, evicted = self._pools.popitem(last=False)
+            self._drop(evicted)
+        self.schedule_refill()
+        if not terminals:
+            self.misses += 1
+            return None
+        terminal, handler_id = terminals.pop(0)
+        terminal.disconnect(handler_id)
+        self.hits += 1
+        return terminal
+
+    def invalidate(self):
+        """Throw away the pooled terminals, and spawn new ones"""
+        count = len(self)
+        for directory, terminals in self._pools.items():
+            self._pools[directory] = []
+            self._drop(terminals)
+        if count:
+            log.debug("Terminal pool invalidated, %d terminals dropped", count)
+        self.schedule_refill()
+
+    def schedule_refill(self):
+        if self._idle_id is None and len(self._pools[self.directory]) < self.get_size():
+            self._idle_id = GLib.idle_add(self._refill, priority=GLib.PRIORITY_LOW)
+
+    def _refill(self):
+        directory = self.directory
+        terminals = self._pools[directory]
+        if len(terminals) >= self.get_size():
+            self._idle_id = None
+            return False
+        terminal = GuakeTerminal(self.guake)
+        # Spawned with the font of the tabs, for the size of the terminal
+        self.guake.terminal_profiles.apply(terminal)
+        terminal.spawn_async_pid(directory)
+        handler_id = terminal.connect("child-exited", self.on_pooled_child_exited)
+        terminals.append((terminal, handler_id))
+        # One terminal per idle call, to not delay any pending event
+        return True
+
+    def on_pooled_child_exited(self, terminal, status):
+        for directory, terminals in self._pools.items():
+            self._pools[directory] = [entry for entry in terminals if entry[0] is not terminal]
+        self.schedule_refill()
+
+    def on_settings_changed(self, settings, key):
+        self.invalidate()
+
+    def on_size_changed(self, settings, key):
+        size = self.get_size()
+        for terminals in self._pools.values():
+            while len(terminals) > size:
+                self._drop([terminals.pop()])
+        self.schedule_refill()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (C) 2007-2018 Guake authors
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation; either version 2 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301 USA
+"""
+import logging
+
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+gi.require_version("Vte", "2.91")  # vte-0.38
+from gi.repository import Gdk
+from gi.repository import Gio
+from gi.repository import Pango
+from gi.repository import Vte
+from guake.palettes import get_palette_colors
+
+log = logging.getLogger(__name__)
+
+ERASE_BINDINGS = {
+    "auto": Vte.EraseBinding(0),
+    "ascii-backspace": Vte.EraseBinding(1),
+    "ascii-delete": Vte.EraseBinding(2),
+    "delete-sequence": Vte.EraseBinding(3),
+    "tty": Vte.EraseBinding(4),
+}
+
+
+class TerminalProfile(NamedTuple):
+    """The settings of a terminal, ready to be applied"""
+
+    font_name: str
+    font: Optional[Pango.FontDescription]
+    # Colors, and the values they were computed from to compare them cheaply
+    colors_key: tuple
+    foreground: Gdk.RGBA
+    background: Gdk.RGBA
+    palette: Tuple[Gdk.RGBA, ...]
+    show_scrollbar: bool
+    scrollback_lines: int
+    cursor_shape: int
+    cursor_blink_mode: int
+    allow_bold: bool
+    bold_is_bright: bool
+    cell_height_scale: float
+    cell_width_scale: float
+    backspace_binding: Optional[Vte.EraseBinding]
+    delete_binding: Optional[Vte.EraseBinding]
+
+
+class TerminalProfileManager:
+    """Build the TerminalProfile from the settings, and apply it to the terminals.
+
+    The profile is rebuilt only when one of the settings it is made of
+    changed (it is read from the settings cache), and applying it to a
+    terminal only sets the properties which differ from the last profile
+    applied to that terminal.
+    """
+
+    def __init__(self, guake):
+        self.guake = guake
+        self._profile = None
+        self._profile_key = None
+        self._interface_settings = None
+        # Number of profiles built, and of terminal properties set
+        self.builds = 0
+        self.applied = 0
+
+    def _get_system_font_name(self):
+        if self._interface_settings is None:
+            self._interface_settings = Gio.Settings(schema="org.gnome.desktop.interface")
+        return self._interface_settings.get_string("monospace-font-name")
+
+    def _get_key(self):
+        settings = self.guake.settings
+        general = settings.general.cached
+        font = settings.styleFont.cached
+        style = settings.style.cached
+        if general.use_default_font:
+            font_name = self._get_system_font_name()
+        else:
+            font_name = font.style
+        return (
+            font_name,
+            font.palette,
+            settings.styleBackground.cached.transparency,
+            self.guake.transparency_toggled,
+            general.use_scrollbar,
+            -1 if general.infinite_history else general.history_size,
+            style.cursor_shape,
+            style.cursor_blink_mode,
+            font.allow_bold,
+            font.bold_is_bright,
+            font.cell_height_scale,
+            font.cell_width_scale,
+            general.compat_backspace,
+            general.compat_delete,
+        )
+
+    def get(self):
+        """Returns the profile for the current settings"""
+        key = self._get_key()
+        if key != self._profile_key:
+            self._profile = self._build(key)
+            self._profile_key = key
+            self.builds += 1
+        return self._profile
+
+    def _build(self, key):
+        (
+            font_name,
+            palette,
+            transparency,
+            transparency_toggled,
+            show_scrollbar,
+            scrollback_lines,
+            cursor_shape,
+            cursor_blink_mode,
+            allow_bold,
+            bold_is_bright,
+            cell_height_scale,
+            cell_width_scale,
+            compat_backspace,
+            compat_delete,
+        ) = key
+
+        font = None
+        if font_name:
+            font = Pango.FontDescription(font_name)
+        else:
+            log.error("Error: unable to find font name (%s)", font_name)
+
+        colors = get_palette_colors(palette, 1 if transparency_toggled else transparency / 100)
+
+        return TerminalProfile(
+            font_name=font_name,
+            font=font,
+            colors_key=(palette, transparency, transparency_toggled),
+            foreground=colors.foreground,
+            background=colors.background,
+            palette=colors.palette,
+            show_scrollbar=show_scrollbar,
+            scrollback_lines=scrollback_lines,
+            cursor_shape=cursor_shape,
+            cursor_blink_mode=cursor_blink_mode,
+            allow_bold=allow_bold,
+            bold_is_bright=bold_is_bright,
+            cell_height_scale=cell_height_scale,
+            cell_width_scale=cell_width_scale,
+            backspace_binding=ERASE_BINDINGS.get(compat_backspace),
+            delete_binding=ERASE_BINDINGS.get(compat_delete),
+        )
+
+    def apply(self, terminal, profile=None):
+        """Apply `profile` (the current one by default) to `terminal`, only
+        setting the properties that changed since the last time"""
+        if profile is None:
+            profile = self.get()
+        applied = getattr(terminal, "applied_profile", None)
+        if applied is None:
+            applied = terminal.applied_profile = {}
+
+        def changed(name, value):
+            if applied.get(name, applied) == value:
+                return False
+            applied[name] = value
+            self.applied += 1
+            return True
+
+        if profile.font is not None and changed("font", profile.font_name):
+            terminal.set_font(profile.font)
+        custom_colors = (
+            terminal.custom_fgcolor,
+            terminal.custom_bgcolor,
+            terminal.custom_palette,
+        )
+        if changed("colors", (profile.colors_key, custom_colors)):
+            terminal.set_color_foreground(profile.foreground)
+            terminal.set_color_bold(profile.foreground)
+            terminal.set_colors(profile.foreground, profile.background, list(profile.palette))
+        box = terminal.get_parent()
+        if box is not None and changed("show_scrollbar", profile.show_scrollbar):
+            # The box of a terminal contains the terminal and its scrollbar
+            scrollbar = box.get_children()[1]
+            scrollbar.set_visible(profile.show_scrollbar)
+        if changed("scrollback_lines", profile.scrollback_lines):
+            terminal.set_scrollback_lines(profile.scrollback_lines)
+        if changed("cursor_shape", profile.cursor_shape):
+            terminal.set_property("cursor-shape", profile.cursor_shape)
+        if changed("cursor_blink_mode", profile.cursor_blink_mode):
+            terminal.set_property("cursor-blink-mode", profile.cursor_blink_mode)
+        if changed("allow_bold", profile.allow_bold):
+            terminal.set_allow_bold(profile.allow_bold)
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 52):
+            if changed("cell_height_scale", profile.cell_height_scale):
+                terminal.set_cell_height_scale(profile.cell_height_scale)
+            if changed("cell_width_scale", profile.cell_width_scale):
+                terminal.set_cell_width_scale(profile.cell_width_scale)
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 56):
+            if changed("bold_is_bright", profile.bold_is_bright):
+                terminal.set_bold_is_bright(profile.bold_is_bright)
+        if profile.backspace_binding is not None and changed(
+            "backspace_binding", profile.backspace_binding
+        ):
+            terminal.set_backspace_binding(profile.backspace_binding)
+        if profile.delete_binding is not None and changed("delete_binding", profile.delete_binding):
+            terminal.set_delete_binding(profile.delete_binding)
+
+    def apply_all(self, terminals):
+        """Apply the current profile to all the `terminals`, in one pass"""
+        profile = self.get()
+        for terminal in terminals:
+            self.apply(terminal, profile)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=redefined-outer-name
+import subprocess
+import sys
+
+import pytest
+
+from gi.repository import GLib
+from gi.repository import Gio
+
+from guake import client
+
+
+@pytest.fixture
+def connection(mocker):
+    connection = mocker.Mock()
+    connection.call_sync.return_value = GLib.Variant("()", ())
+    mocker.patch.object(client.Gio, "bus_get_sync", return_value=connection)
+    return connection
+
+
+def called_methods(connection):
+    return [call.args[3] for call in connection.call_sync.call_args_list]
+
+
+def test_fast_command(connection):
+    assert client.run_fast_command(["-t"])
+    assert called_methods(connection) == ["show_hide"]
+    assert connection.call_sync.call_args.args[6] == Gio.DBusCallFlags.NO_AUTO_START
+
+
+def test_fast_command_same_calls_as_main(connection):
+    assert client.run_fast_command(["--show"])
+    assert called_methods(connection) == ["show_from_remote", "show_hide"]
+
+
+def test_fast_command_prints_visibility(connection, capsys):
+    connection.call_sync.return_value = GLib.Variant("(i)", (1,))
+    assert client.run_fast_command(["--is-visible"])
+    assert capsys.readouterr().out == "1\n"
+
+
+def test_fast_command_unknown_arguments(connection):
+    assert not client.run_fast_command(["-n", "/tmp"])
+    assert not client.run_fast_command(["-t", "-u"])
+    connection.call_sync.assert_not_called()
+
+
+def test_fast_command_guake_not_running(connection):
+    connection.call_sync.side_effect = GLib.Error.new_literal(
+        Gio.DBusError.quark(), "not running", Gio.DBusError.SERVICE_UNKNOWN
+    )
+    assert not client.run_fast_command(["-t"])
+
+
+def test_main_only_imports_the_client():
+    code = (
+        "import sys; from guake import client; client.run_fast_command = lambda args: True; "
+        "client.main(); print(sorted(m for m in sys.modules if m.startswith('guake')))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == "['guake', 'guake.client']"
+
+
+def test_main_falls_back_to_guake_main(mocker, connection):
+    mocker.patch.object(client.sys, "argv", ["guake", "-n", "/tmp"])
+    run_main = mocker.patch("guake.main.run_main")
+    client.main()
+    run_main.assert_called_once_with()
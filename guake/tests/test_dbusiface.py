@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=redefined-outer-name
+import shutil
+import subprocess
+import time
+
+import dbus
+import pytest
+
+from gi.repository import GLib
+
+from guake.dbusiface import DBUS_NAME
+from guake.dbusiface import DbusManager
+from guake.events import GuakeEvents
+
+
+@pytest.fixture
+def bus_address():
+    """Address of a private session bus, stopped at the end of the test"""
+    if shutil.which("dbus-daemon") is None:
+        pytest.skip("dbus-daemon is not installed")
+    with subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address"], stdout=subprocess.PIPE
+    ) as daemon:
+        try:
+            yield daemon.stdout.readline().decode().strip()
+        finally:
+            daemon.terminate()
+
+
+def run_main_loop_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        GLib.MainContext.default().iteration(False)
+
+
+def test_events_are_sent_as_signals(mocker, bus_address):
+    guake = mocker.Mock(events=GuakeEvents())
+    DbusManager(guake, bus=dbus.bus.BusConnection(bus_address))
+
+    received = []
+    client = dbus.bus.BusConnection(bus_address)
+    client.add_signal_receiver(
+        lambda *args, member: received.append((member, list(args))),
+        dbus_interface=DBUS_NAME,
+        member_keyword="member",
+    )
+
+    guake.events.emit("tab-added", 0, 3)
+    guake.events.emit("tab-renamed", 0, 3, "logs")
+    guake.events.emit("terminal-exited", "5d0b2ac6-0c4d-4c6f-9ec9-0fb3b6b1c0a1", 256)
+    guake.events.emit("visibility-changed", True)
+    run_main_loop_until(lambda: len(received) == 4)
+
+    assert received == [
+        ("tab_added", [0, 3]),
+        ("tab_renamed", [0, 3, "logs"]),
+        ("terminal_exited", ["5d0b2ac6-0c4d-4c6f-9ec9-0fb3b6b1c0a1", 256]),
+        ("visibility_changed", [True]),
+    ]
@@ -3,16 +3,25 @@
 
 import json
 import os
+import random
 import time
+import uuid
 
 from pathlib import Path
 
 import pytest
 
+from gi.repository import GLib
+from gi.repository import Gdk
+from gi.repository import Gtk
+
 import guake.guake_app
+import guake.settings
 
 from guake.common import pixmapfile
 from guake.guake_app import Guake
+from guake.layout import LayoutError
+from guake.terminal import GuakeTerminal
 
 
 @pytest.fixture
@@ -107,6 +116,71 @@ def test_guake_restore_tabs(g, fs):
     assert nb.get_tab_text_index(0) == "4"
 
 
+def test_guake_restore_tabs_split_layout(g, fs):
+    d = fs.create_dir("/foobar/foo")
+    panes = [
+        {"type": "dual_v", "directory": None},
+        {"type": "term", "directory": d.path},
+        {"type": "term", "directory": d.path},
+    ]
+    tabs = [
+        {"panes": [dict(p) for p in panes], "label": str(i), "custom_label_set": True}
+        for i in range(3)
+    ]
+    session = {"schema_version": 2, "timestamp": 1556092197, "workspace": {"0": [tabs]}}
+
+    fn = fs.create_file("/foobar/session.json")
+    with open(fn.path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(session))
+
+    g.restore_tabs(fn.name)
+    nb = g.notebook_manager.get_notebook(0)
+    assert nb.get_n_pages() == 3
+    # The current page is restored right away, the others on idle
+    assert len(nb.get_terminals_for_page(nb.get_current_page())) == 2
+    assert len(g.restore_queue) == 2
+    assert g.restore_queue.get_progress() == (1, 3)
+
+    g.restore_queue.flush()
+    assert len(g.restore_queue) == 0
+    assert [len(nb.get_terminals_for_page(i)) for i in range(3)] == [2, 2, 2]
+
+
+def test_guake_restore_tabs_lazy(g, fs):
+    d = fs.create_dir("/foobar/foo")
+    tabs = [
+        {
+            "panes": [{"type": "term", "directory": d.path}],
+            "label": str(i),
+            "custom_label_set": True,
+            "last_used": last_used,
+        }
+        for i, last_used in enumerate((30, 10, 40, 20))
+    ]
+    session = {"schema_version": 2, "timestamp": 1556092197, "workspace": {"0": [tabs]}}
+    fn = fs.create_file("/foobar/session.json")
+    with open(fn.path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(session))
+
+    g.settings.general.set_boolean("lazy-tab-restore", True)
+    g.settings.general.set_int("lazy-tab-warm-count", 1)
+    try:
+        g.restore_tabs(fn.name)
+    finally:
+        g.settings.general.reset("lazy-tab-restore")
+        g.settings.general.reset("lazy-tab-warm-count")
+    nb = g.notebook_manager.get_notebook(0)
+    # The current (last) tab is restored, the most recently used one (2) warmed
+    assert len(g.restore_queue) == 1
+    g.restore_queue.flush()
+    assert [len(nb.get_nth_page(i).get_terminals()) for i in range(4)] == [0, 0, 1, 1]
+    # Saved as they were restored
+    assert g.build_session()["workspace"][0][0][:2] == tabs[:2]
+
+    assert len(nb.get_terminals_for_page(0)) == 1
+    assert not g.restore_queue.is_pending(nb.get_nth_page(0))
+
+
 def test_guake_restore_tabs_json_without_schema_version(g, fs):
     guake.guake_app.notifier.showMessage.reset_mock()
 
@@ -156,6 +230,7 @@ def test_guake_restore_tabs_schema_broken_session_file(g, fs):
 def test_guake_save_tabs_and_restore(mocker, g, fs):
     # Disable auto save
     mocker.patch.object(g.settings.general, "get_boolean", return_value=False)
+    mocker.patch.dict(g.settings.general.cached._values, {"save-tabs-when-changed": False})
 
     # Save
     assert not os.path.exists("/foobar/session.json")
@@ -234,10 +309,545 @@ def test_guake_compute_tab_title(mocker, g, fs):
     # Original title.
     assert g.compute_tab_title(vte) == "Terminal"
 
-    # Change title.
+    # Change title (the missing file is cached too).
     fs.create_file("/foo/.guake.yml", contents="title: bar")
+    g.fm.clear()
     assert g.compute_tab_title(vte) == "bar"
 
     # Avoid loading the guake.yml
-    mocker.patch.object(g.settings.general, "get_boolean", return_value=False)
+    mocker.patch.dict(g.settings.general.cached._values, {"load-guake-yml": False})
     assert g.compute_tab_title(vte) == "Terminal"
+
+
+# Terminal spawn
+
+
+def test_terminal_spawn_is_async(g):
+    nb = g.get_notebook()
+    terminal = nb.terminal_spawn()
+    spawned = []
+    terminal.when_spawned(spawned.append)
+
+    deadline = time.monotonic() + 5
+    while not terminal.is_spawned() and time.monotonic() < deadline:
+        Gtk.main_iteration_do(False)
+    assert spawned == [terminal]
+    assert terminal.pid > 0
+
+    # Already spawned, called right away
+    terminal.when_spawned(spawned.append)
+    assert spawned == [terminal, terminal]
+
+
+def test_terminal_kill_before_spawn(mocker, g):
+    mocker.patch("guake.terminal.libutempter", None)
+    thread = mocker.patch("guake.terminal.threading.Thread")
+    terminal = GuakeTerminal(g)
+
+    terminal.kill()
+    assert not thread.called
+
+    terminal.on_spawned(1234)
+    thread.assert_called_once_with(target=terminal.delete_shell, args=(1234,))
+
+
+def test_terminal_spawn_failure(mocker, g):
+    terminal = GuakeTerminal(g)
+    feed = mocker.patch.object(terminal, "feed")
+    spawned = []
+    terminal.when_spawned(spawned.append)
+
+    terminal.on_spawn_async_done(terminal, -1, GLib.Error("No such file"), None)
+    assert terminal.spawn_error == "No such file"
+    assert b"No such file" in feed.call_args[0][0]
+    terminal.when_spawned(spawned.append)
+    assert not spawned
+    assert not terminal._spawned_callbacks
+
+
+def test_terminal_configured_before_spawn(mocker, g):
+    mocker.patch.object(GuakeTerminal, "spawn_async_pid")
+    spawned = mocker.Mock()
+    g.events.connect("terminal-spawned", spawned)
+    g.add_tab()
+    terminal = g.get_notebook().get_current_terminal()
+    assert not terminal.is_spawned()
+    # Styled and tracked right away
+    assert terminal.applied_profile
+    assert terminal.directory == terminal.get_current_directory()
+    # The D-Bus event needs the pid
+    spawned.assert_not_called()
+
+    terminal.on_spawn_failed("No such file")
+    assert terminal.applied_profile
+    spawned.assert_not_called()
+
+
+def test_terminal_spawned_after_destroy(mocker, g):
+    mocker.patch("guake.terminal.libutempter")
+    thread = mocker.patch("guake.terminal.threading.Thread")
+    terminal = GuakeTerminal(g)
+    callback = mocker.Mock()
+    terminal.when_spawned(callback)
+    terminal.destroy()
+    terminal.on_spawned(1234)
+    callback.assert_not_called()
+    thread.assert_called_once_with(target=terminal.delete_shell, args=(1234,))
+
+
+def test_terminal_spawn_failure_after_kill(mocker, g):
+    terminal = GuakeTerminal(g)
+    exited = mocker.Mock()
+    terminal.connect("child-exited", exited)
+    terminal.kill()
+    terminal.on_spawn_async_done(terminal, -1, GLib.Error("No such file"), None)
+    exited.assert_called_once_with(terminal, 1)
+
+
+def test_terminal_pool(mocker, g):
+    pool = g.terminal_pool
+    mocker.patch.object(pool, "get_size", return_value=2)
+    pool._refill()
+    pool._refill()
+    assert len(pool) == 2
+
+    home = pool.directory
+    pooled = pool._pools[home][0][0]
+    assert pooled.applied_profile["font"] == g.terminal_profiles.get().font_name
+    assert g.get_notebook().terminal_spawn(home) is pooled
+    assert pool.hits == 1
+    assert len(pool) == 1
+
+    # Asked elsewhere, the pool follows the new directory, and keeps the
+    # terminals of the previous one
+    assert pool.take("/tmp") is None
+    assert pool.misses == 1
+    assert len(pool) == 1
+    assert pool.directory == os.path.realpath("/tmp")
+    pool._refill()
+    assert pool.take(home) is not None
+    assert pool.take("/tmp") is not None
+    assert pool.hits == 3
+
+    # Only the last DIRECTORIES directories keep terminals
+    pool._refill()
+    dropped = pool._pools[os.path.realpath("/tmp")][0][0]
+    destroy = mocker.spy(dropped, "destroy")
+    for directory in ("/usr", "/var", "/etc"):
+        pool.take(directory)
+    assert len(pool._pools) == pool.DIRECTORIES
+    destroy.assert_called_once_with()
+    assert os.path.realpath("/tmp") not in pool._pools
+
+
+def test_terminal_current_directory_cache(mocker, g):
+    terminal = GuakeTerminal(g)
+    terminal.pid = 1234
+    readlink = mocker.patch("guake.terminal.os.readlink", return_value="/foobar")
+    monotonic = mocker.patch("guake.terminal.time.monotonic", return_value=100.0)
+
+    assert terminal.get_current_directory() == "/foobar"
+    assert terminal.get_current_directory() == "/foobar"
+    assert readlink.call_count == 1
+
+    monotonic.return_value += terminal.CWD_CACHE_TTL
+    readlink.return_value = "/"
+    assert terminal.get_current_directory() == "/"
+    assert readlink.call_count == 2
+
+
+def test_terminal_current_directory_osc7(mocker, g):
+    terminal = GuakeTerminal(g)
+    terminal.pid = 1234
+    readlink = mocker.patch("guake.terminal.os.readlink", return_value="/")
+    uri = mocker.patch.object(terminal, "get_current_directory_uri")
+
+    uri.return_value = "file:///foobar/with%20space"
+    terminal.on_current_directory_uri_changed(terminal)
+    assert terminal.get_current_directory() == "/foobar/with space"
+    assert not readlink.called
+
+    # Directory of another host (e.g. in ssh), use /proc
+    uri.return_value = "file://elsewhere/home"
+    terminal.on_current_directory_uri_changed(terminal)
+    assert terminal.get_current_directory() == "/"
+
+
+def test_terminal_title_changes_are_throttled(mocker, g):
+    mocker.patch("guake.guake_app.pytime.monotonic", return_value=1000.0)
+    timeout_add = mocker.patch("guake.guake_app.GLib.timeout_add", return_value=42)
+    update = mocker.spy(g, "update_terminal_title")
+    term = g.get_notebook().get_current_terminal()
+
+    g.on_terminal_title_changed(term, term)
+    assert update.call_count == 1
+
+    for _ in range(10):
+        g.on_terminal_title_changed(term, term)
+    assert update.call_count == 1
+    assert timeout_add.call_count == 1
+
+
+def test_rename_page_skips_unchanged_title(mocker, g):
+    nb = g.get_notebook()
+    nb.rename_page(0, "foo", False)
+    page_changed = mocker.spy(g.session_model, "page_changed")
+    nb.rename_page(0, "foo", False)
+    assert not page_changed.called
+    nb.rename_page(0, "bar", False)
+    assert page_changed.call_count == 1
+
+
+# Incremental session model
+
+
+def test_session_model_matches_full_walk(g):
+    rnd = random.Random(2024)
+    nb = g.get_notebook()
+    for step in range(40):
+        terminals = list(nb.iter_terminals())
+        action = rnd.choice(("add", "split_h", "split_v", "close", "rename", "color"))
+        if action == "add":
+            g.add_tab()
+        elif action == "split_h":
+            rnd.choice(terminals).get_parent().split_h_no_save()
+        elif action == "split_v":
+            rnd.choice(terminals).get_parent().split_v_no_save()
+        elif action == "close" and len(terminals) > 1:
+            term = rnd.choice(terminals)
+            term.get_parent().on_terminal_exited(term, 0)
+            term.kill()
+        elif action == "rename":
+            nb.rename_page(rnd.randrange(nb.get_n_pages()), f"tab {step}", True)
+        elif action == "color":
+            rnd.choice(terminals).set_color_background_custom(Gdk.RGBA(0.1, 0.2, 0.3, 1))
+
+        assert g.session_model.build()["workspace"] == g.session_model.build_full()["workspace"]
+
+
+def test_session_model_refreshes_directories(mocker, g):
+    terminal = g.get_notebook().get_current_terminal()
+    mocker.patch.object(terminal, "has_osc7_directory", return_value=False)
+    directory = mocker.patch.object(terminal, "get_current_directory", return_value="/foo")
+    assert g.session_model.build()["workspace"][0][0][0]["panes"][0]["directory"] == "/foo"
+    # A cd without any title change nor OSC 7
+    directory.return_value = "/bar"
+    assert g.session_model.build()["workspace"][0][0][0]["panes"][0]["directory"] == "/bar"
+
+
+# Terminal indexes
+
+
+def test_notebook_manager_indexes(g):
+    rnd = random.Random(2025)
+    manager = g.notebook_manager
+    nb = g.get_notebook()
+    for step in range(40):
+        terminals = list(manager.iter_terminals())
+        action = rnd.choice(("add", "split", "close", "delete", "reorder"))
+        if action == "add":
+            g.add_tab()
+        elif action == "split":
+            rnd.choice(terminals).get_parent().split_v_no_save()
+        elif action == "close" and len(terminals) > 1:
+            term = rnd.choice(terminals)
+            term.get_parent().on_terminal_exited(term, 0)
+            term.kill()
+        elif action == "delete" and nb.get_n_pages() > 1:
+            nb.delete_page(rnd.randrange(nb.get_n_pages()))
+        elif action == "reorder":
+            nb.reorder_child(nb.get_nth_page(0), -1)
+
+        assert manager.check_consistency() == []
+        for term in manager.iter_terminals():
+            page = term.get_parent().get_root_box()
+            assert manager.get_terminal_by_uuid(term.uuid) is term
+            assert manager.find_terminal_by_uuid(term.uuid) == (nb, nb.page_num(page), term)
+            assert nb.find_page_index_by_terminal(term) == nb.page_num(page)
+
+
+def test_get_index_from_uuid(g):
+    nb = g.get_notebook()
+    nb.get_nth_page(0).child.split_v_no_save()
+    g.add_tab()
+    term = nb.get_terminals_for_page(1)[0]
+    # The index of the tab, not of the terminal
+    assert g.get_index_from_uuid(str(term.uuid)) == 1
+    assert g.get_index_from_uuid(str(uuid.uuid4())) == -1
+    # Only the tabs of the current workspace are looked for
+    other = g.notebook_manager.get_notebook(1).get_terminals_for_page(0)[0]
+    assert g.get_index_from_uuid(str(other.uuid)) == -1
+    g.rename_tab_uuid(str(other.uuid), "foo")
+    assert nb.get_tab_text_index(0) != "foo"
+
+
+# Tab activity
+
+
+def test_tab_activity_monitor(g):
+    nb = g.get_notebook()
+    monitor = nb.activity_monitor
+    monitor.set_enabled(True)
+    g.add_tab()
+    nb.set_current_page(0)
+    page = nb.get_nth_page(1)
+    page.activity_ignore_until = 0
+    term = nb.get_terminals_for_page(1)[0]
+    assert term in monitor._handlers
+    assert nb.get_current_terminal() not in monitor._handlers
+
+    term.emit("contents-changed")
+    # Marked active, the tab stops listening until the next sample
+    assert term not in monitor._handlers
+    assert nb.get_tab_activity_rate(page) > 0
+    monitor._on_tick(nb, None)
+    assert nb.get_tab_label(page).get_activity()
+
+    # Seen, then background again: listening again
+    nb.set_current_page(1)
+    assert not nb.get_tab_label(page).get_activity()
+    assert nb.get_tab_activity_rate(page) == 0
+    nb.set_current_page(0)
+    assert term in monitor._handlers
+
+    monitor.set_enabled(False)
+    assert not monitor._handlers
+
+
+def test_tab_activity_compatibility(g):
+    nb = g.get_notebook()
+    nb.activity_monitor.set_enabled(True)
+    g.add_tab()
+    nb.set_current_page(0)
+    page = nb.get_nth_page(1)
+    page.activity_ignore_until = 0
+    nb.on_terminal_activity(nb.get_terminals_for_page(1)[0])
+    nb.activity_monitor._on_tick(nb, None)
+    assert nb.get_tab_label(page).get_activity()
+    nb.clear_all_tab_activity()
+    assert not nb.get_tab_label(page).get_activity()
+
+
+# Settings cache
+
+
+def test_settings_cache(g):
+    cached = g.settings.general.cached
+    cached.invalidate()
+    misses = cached.misses
+    value = g.settings.general.get_boolean("use-vte-titles")
+    assert cached.use_vte_titles is value
+    assert cached["use-vte-titles"] is value
+    assert cached.misses == misses + 1
+    assert isinstance(cached.max_tab_name_length, int)
+
+    # Invalidated by the changed signal
+    g.settings.general.triggerOnChangedValue(g.settings.general, "use-vte-titles")
+    assert cached.use_vte_titles is value
+    assert cached.misses == misses + 3
+
+
+# Terminal profile
+
+
+def test_terminal_profile_only_applies_changes(mocker, g):
+    profiles = g.terminal_profiles
+    terminal = g.get_notebook().get_current_terminal()
+    profiles.apply(terminal)
+    applied = profiles.applied
+    g.load_config()
+    g.load_config(terminal_uuid=terminal.uuid)
+    assert profiles.applied == applied
+
+    builds = profiles.builds
+    mocker.patch.dict(
+        g.settings.general.cached._values, {"history-size": 42, "infinite-history": False}
+    )
+    set_scrollback_lines = mocker.patch.object(terminal, "set_scrollback_lines")
+    g.load_config()
+    assert profiles.builds == builds + 1
+    set_scrollback_lines.assert_called_once_with(42)
+    assert profiles.applied == applied + 1
+
+
+def test_terminal_profile_colors_set_directly(mocker, g):
+    profiles = g.terminal_profiles
+    terminal = g.get_notebook().get_current_terminal()
+    profiles.apply(terminal)
+    set_colors = mocker.spy(terminal, "set_colors")
+    # Colors set without the manager are set again by the next apply
+    g.set_colors_from_settings(terminal.uuid)
+    assert set_colors.call_count == 1
+    profiles.apply(terminal)
+    assert set_colors.call_count == 2
+    profiles.apply(terminal)
+    assert set_colors.call_count == 2
+
+
+# Palette cache
+
+
+def test_palette_colors_cache(g):
+    colors = g.get_palette_colors()
+    assert g.get_palette_colors() is colors
+    assert len(colors.palette) == 16
+
+    g.transparency_toggled = not g.transparency_toggled
+    toggled = g.get_palette_colors()
+    assert toggled is not colors
+    # Same parsed colors, only the background differs
+    assert toggled.palette[0] is colors.palette[0]
+    assert 1 in (toggled.background.alpha, colors.background.alpha)
+    # Copies, the cached colors are shared
+    assert g.get_bgcolor() is not toggled.background
+
+
+# Startup
+
+
+def test_deferred_startup(mocker, g):
+    # Migration of old settings already done
+    mocker.patch.object(g.settings.general, "get_boolean", return_value=True)
+    refresh_user_start = mocker.patch("guake.prefs.refresh_user_start")
+    assert g.tray_icon is None
+    steps = 1
+    while g.run_deferred_startup():
+        steps += 1
+    assert steps == 4
+    assert g.tray_icon is not None
+    assert refresh_user_start.call_count == 1
+
+
+def test_deferred_startup_step_failure(mocker, g):
+    failing = mocker.Mock(side_effect=RuntimeError)
+    following = mocker.Mock()
+    g._deferred_startup = [("failing", failing), ("following", following)]
+    while g.run_deferred_startup():
+        pass
+    failing.assert_called_once_with()
+    following.assert_called_once_with()
+
+
+# Settings migration and export
+
+
+def test_settings_compat_runs_once(mocker, g):
+    check_output = mocker.patch("guake.settings.subprocess.check_output", return_value=b"")
+    set_boolean = mocker.patch.object(g.settings.general, "set_boolean")
+    mocker.patch.object(g.settings.general, "get_boolean", return_value=True)
+    g.settings.compat()
+    assert check_output.call_count == 0
+
+    mocker.patch.object(g.settings.general, "get_boolean", return_value=False)
+    mocker.patch("guake.settings.export_settings", return_value="")
+    g.settings.check_user_settings()
+    g.settings.compat()
+    check_output.assert_called_once_with(["dconf", "dump", "/apps/guake/"])
+    set_boolean.assert_called_once_with("legacy-settings-migrated", True)
+
+
+def test_settings_compat_checks_before_startup_writes(mocker, g):
+    check_output = mocker.patch("guake.settings.subprocess.check_output", return_value=b"x")
+    import_settings = mocker.patch("guake.settings.import_settings", side_effect=RuntimeError)
+    set_boolean = mocker.patch.object(g.settings.general, "set_boolean")
+    mocker.patch.object(g.settings.general, "get_boolean", return_value=False)
+    mocker.patch("guake.settings.export_settings", return_value="")
+    g.settings.check_user_settings()
+    # Keys written by Guake once started do not prevent the migration
+    mocker.patch("guake.settings.export_settings", return_value="[general]\nfoo=true\n")
+    with pytest.raises(RuntimeError):
+        g.settings.compat()
+    check_output.assert_called_once_with(["dconf", "dump", "/apps/guake/"])
+    import_settings.assert_called_once_with(g.settings.schema_source, "x")
+    # Failed, tried again at the next start
+    assert set_boolean.call_count == 0
+
+
+def test_export_settings(g):
+    data = guake.settings.export_settings(g.settings.schema_source)
+    keyfile = GLib.KeyFile()
+    keyfile.load_from_data(data, len(data.encode("utf-8")), GLib.KeyFileFlags.NONE)
+    sections = {section for section, _ in guake.settings.iter_settings(g.settings.schema_source)}
+    assert {"/", "general", "style/font", "keybindings/global"} <= sections
+    assert set(keyfile.get_groups()[0]) <= sections
+
+
+# Layouts
+
+
+def test_apply_layout(g):
+    nb = g.get_notebook()
+    pages = nb.get_n_pages()
+    layout = {
+        "select": 1,
+        "tabs": [
+            {"label": "one", "directory": "/tmp", "fgcolor": "#00ff00"},
+            {
+                "label": "two",
+                "split": "vertical",
+                "panes": [
+                    {"bgcolor": "202020"},
+                    {"split": "horizontal", "percentage": 30, "panes": [{}, {"command": "ls"}]},
+                ],
+            },
+        ],
+    }
+    terminals = g.apply_layout(json.dumps(layout))
+    assert len(terminals) == 4
+    assert nb.get_n_pages() == pages + 2
+    assert nb.get_current_page() == pages + 1
+    assert [len(nb.get_terminals_for_page(pages + i)) for i in range(2)] == [1, 3]
+    assert nb.get_tab_text_index(pages) == "one"
+    assert terminals[0].custom_fgcolor is not None
+    assert terminals[1].custom_bgcolor is not None
+
+
+def test_apply_layout_invalid(g):
+    nb = g.get_notebook()
+    pages = nb.get_n_pages()
+    with pytest.raises(LayoutError):
+        g.apply_layout({"tabs": [{}, {"bgcolor": "not a color"}]})
+    assert nb.get_n_pages() == pages
+
+
+# Events
+
+
+def test_tab_events(g):
+    received = []
+    for name in ("tab-added", "tab-renamed", "tab-closed"):
+        g.events.connect(name, lambda events, *args, name=name: received.append((name, args)))
+    nb = g.get_notebook()
+    g.add_tab()
+    index = nb.get_current_page()
+    nb.rename_page(index, "logs", True)
+    nb.remove_page(index)
+    assert ("tab-added", (0, index)) in received
+    assert received[-2:] == [("tab-renamed", (0, index, "logs")), ("tab-closed", (0, index))]
+
+
+# Bulk tab creation
+
+
+def test_new_page_only_configures_the_new_terminal(mocker, g):
+    mocker.patch.dict(g.settings.general.cached._values, {"use-scrollbar": False})
+    apply_all = mocker.spy(g.terminal_profiles, "apply_all")
+    nb = g.get_notebook()
+    first = nb.get_terminals_for_page(0)[0]
+    first.get_parent().scroll.set_visible(True)
+    for _ in range(3):
+        g.add_tab()
+    apply_all.assert_not_called()
+    # Neither shown by the show_all of the new pages, nor hidden again
+    assert first.get_parent().scroll.get_visible()
+    assert not nb.get_current_terminal().get_parent().scroll.get_visible()
+
+
+def test_bulk_creation_updates_the_tab_bar_once(mocker, g):
+    nb = g.get_notebook()
+    hide_tabbar = mocker.patch.object(nb, "hide_tabbar_if_one_tab")
+    with nb.bulk_creation():
+        for _ in range(3):
+            nb.new_page()
+        assert hide_tabbar.call_count == 0
+    assert hide_tabbar.call_count == 1
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from guake.layout import LayoutError
+from guake.layout import iter_terminal_panes
+from guake.layout import parse_layout
+
+
+def test_parse_layout():
+    layout = parse_layout(
+        '{"tabs": [{"label": "a", "directory": "/tmp"}, '
+        '{"split": "horizontal", "panes": [{"command": "ls"}, {}]}]}'
+    )
+    assert layout["select"] == 0
+    assert layout["workspace"] is None
+    assert len(layout["tabs"]) == 2
+    first = layout["tabs"][0]
+    second = layout["tabs"][1]
+    assert first == {
+        "label": "a",
+        "directory": "/tmp",
+        "command": None,
+        "fgcolor": None,
+        "bgcolor": None,
+    }
+    assert second["percentage"] == 50
+    assert [p["command"] for p in iter_terminal_panes(second)] == ["ls", None]
+
+
+@pytest.mark.parametrize(
+    "layout",
+    [
+        "{",
+        [],
+        {"tabs": []},
+        {"tabs": [{"split": "diagonal", "panes": [{}, {}]}]},
+        {"tabs": [{"split": "vertical", "panes": [{}]}]},
+        {"tabs": [{"split": "vertical", "percentage": 100, "panes": [{}, {}]}]},
+        {"tabs": [{"directory": 1}]},
+        {"tabs": [{}], "select": 1},
+        {"tabs": [{}], "workspace": -1},
+    ],
+)
+def test_parse_layout_errors(layout):
+    with pytest.raises(LayoutError):
+        parse_layout(layout)
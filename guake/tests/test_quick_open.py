@@ -1,6 +1,8 @@
 import re
 
 from guake.globals import QUICK_OPEN_MATCHERS
+from guake.globals import TERMINAL_MATCH_EXPRS
+from guake.terminal import MatcherRegistry
 from textwrap import dedent
 
 
@@ -27,3 +29,26 @@ def _execute_quick_open(chunk):
             if g:
                 found.append((g.group(1), g.group(2)))
     return found
+
+
+def test_matcher_registry_compiles_once():
+    registry = MatcherRegistry()
+    first = registry.get_vte_regexes()
+    count = dict(registry.compile_count)
+    assert count["vte"] == len(TERMINAL_MATCH_EXPRS) + len(QUICK_OPEN_MATCHERS)
+
+    # Every other terminal reuses the same compiled regexes
+    assert registry.get_vte_regexes() == first
+    assert registry.compile_count == count
+
+
+def test_matcher_registry_user_matchers():
+    registry = MatcherRegistry()
+    matcher = ("Rust", r"^\s*--> .*:[0-9]+", r"^\s*--> (.*):([0-9]+)")
+    assert registry.set_user_matchers([matcher, ("Broken", "(", "(")])
+    assert registry.user_matchers == [matcher]
+    assert not registry.set_user_matchers([matcher])
+    assert registry.get_quick_open_matchers()[-1] == matcher
+    assert len(registry.get_vte_regexes()) == (
+        len(TERMINAL_MATCH_EXPRS) + len(QUICK_OPEN_MATCHERS) + 1
+    )
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=redefined-outer-name
+import json
+import threading
+
+from pathlib import Path
+
+import pytest
+
+from guake.session import SessionWriter
+from guake.session import write_session_file
+
+
+@pytest.fixture
+def writer(mocker, fs):
+    mocker.patch("guake.session.GLib.timeout_add", side_effect=range(1, 1000))
+    mocker.patch("guake.session.GLib.source_remove")
+    guake = mocker.Mock()
+    guake.settings.general.get_int.return_value = 1000
+    guake.get_xdg_config_directory.return_value = Path("/foobar")
+    guake.build_session.return_value = {"schema_version": 2, "workspace": {}}
+    return SessionWriter(guake)
+
+
+def test_write_session_file(fs):
+    write_session_file(Path("/foobar/session.json"), {"foo": "bar"})
+    with open("/foobar/session.json", encoding="utf-8") as f:
+        assert json.load(f) == {"foo": "bar"}
+    # No temporary file left behind
+    assert [p.name for p in Path("/foobar").iterdir()] == ["session.json"]
+
+
+def test_session_writer_not_dirty(writer):
+    writer.flush()
+    assert writer.saves_performed == 0
+    assert not writer.guake.build_session.called
+
+
+def test_session_writer_coalesces(writer):
+    for _ in range(10):
+        writer.mark_dirty()
+    assert writer.is_dirty()
+    assert writer.saves_requested == 10
+
+    writer._on_quiet_period_elapsed()
+    writer.join()
+    assert not writer.is_dirty()
+    assert writer.saves_performed == 1
+    assert writer.guake.build_session.call_count == 1
+    with open("/foobar/session.json", encoding="utf-8") as f:
+        assert json.load(f)["schema_version"] == 2
+
+
+def test_session_writer_flush_on_quit(writer):
+    writer.mark_dirty()
+    writer.flush()
+    assert writer.saves_performed == 1
+    assert Path("/foobar/session.json").exists()
+
+
+def test_session_writer_write_now_waits_for_worker(mocker, writer):
+    started = threading.Event()
+    release = threading.Event()
+    written = []
+
+    def write(session_file, config):
+        if config == "older":
+            started.set()
+            release.wait(5)
+        written.append(config)
+
+    mocker.patch("guake.session.write_session_file", side_effect=write)
+    writer._submit(Path("/foobar/session.json"), "older")
+    assert started.wait(5)
+    writer.mark_dirty()
+    threading.Timer(0.1, release.set).start()
+    writer.write_now()
+    assert written == ["older", writer.guake.build_session.return_value]
+    assert not writer.is_dirty()
+    assert writer.saves_performed == 2
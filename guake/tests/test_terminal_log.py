@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+from guake.terminal_log import LogWriter
+from guake.terminal_log import TerminalLogger
+
+
+def test_log_writer(tmp_path):
+    path = tmp_path / "logs" / "terminal.log"
+    writer = LogWriter(path)
+    writer.write("first line\n")
+    writer.write("")
+    writer.write("second line\n")
+    writer.close(wait=True)
+    assert path.read_text(encoding="utf-8") == "first line\nsecond line\n"
+
+
+def test_log_writer_stops_on_error(mocker, tmp_path):
+    path = tmp_path / "terminal.log"
+    mocker.patch.object(LogWriter, "_write_queued", side_effect=ValueError)
+    writer = LogWriter(path)
+    writer._thread.join()
+    writer.write("dropped\n")
+    assert writer._queue.empty()
+
+
+def test_log_writer_rotation(tmp_path):
+    path = tmp_path / "terminal.log"
+    for i in range(3):
+        writer = LogWriter(path, max_bytes=10, backup_count=2, compress=True)
+        writer.write(f"{i} 10 bytes")
+        writer.close(wait=True)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "terminal.log",
+        "terminal.log.1.gz",
+        "terminal.log.2.gz",
+    ]
+    assert path.read_text(encoding="utf-8") == ""
+    with gzip.open(tmp_path / "terminal.log.1.gz", "rt", encoding="utf-8") as f:
+        assert f.read() == "2 10 bytes"
+    with gzip.open(tmp_path / "terminal.log.2.gz", "rt", encoding="utf-8") as f:
+        assert f.read() == "1 10 bytes"
+
+
+def test_terminal_logger_writes_complete_lines(mocker):
+    terminal = mocker.Mock()
+    terminal.get_vadjustment.return_value.get_lower.return_value = 0
+    terminal.get_column_count.return_value = 80
+    terminal.get_cursor_position.return_value = (0, 3)
+    writer = mocker.Mock()
+    logger = TerminalLogger(terminal, writer)
+
+    terminal.get_text_range.return_value = ("ls\na b\n", None)
+    terminal.get_cursor_position.return_value = (2, 5)
+    logger.on_contents_changed(terminal)
+    terminal.get_text_range.assert_called_once_with(3, 0, 4, 80)
+    writer.write.assert_called_once_with("ls\na b\n")
+
+    # The cursor did not leave its line
+    logger.on_contents_changed(terminal)
+    assert writer.write.call_count == 1
+
+    terminal.get_text_range.return_value = ("$ ", None)
+    logger.stop()
+    terminal.get_text_range.assert_called_with(5, 0, 5, 80)
+    writer.write.assert_called_with("$ \n")
+    writer.close.assert_called_once_with()
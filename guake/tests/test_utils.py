@@ -2,7 +2,17 @@
 # pylint: disable=redefined-outer-name
 import os
 
+import cairo
+
+import guake.utils
+
+from gi.repository import Gdk
+from gi.repository import GLib
+
+from guake.utils import BackgroundImageManager
 from guake.utils import FileManager
+from guake.utils import ImageLayoutMode
+from guake.utils import get_decode_size
 from guake.utils import get_process_name
 
 
@@ -41,5 +51,291 @@ def test_file_manager_clear(fs):
     assert fm.read("/foo/bar") == "changed"
 
 
+def test_file_manager_negative_cache(fs):
+    fm = FileManager(delta=9999)
+    assert fm.read_yaml("/foo/.guake.yml") is None
+    fs.create_file("/foo/.guake.yml", contents="title: bar")
+    assert fm.read_yaml("/foo/.guake.yml") is None
+    assert fm.misses == 1
+    assert fm.hits == 1
+
+    fm.invalidate("/foo/.guake.yml")
+    assert fm.read_yaml("/foo/.guake.yml") == {"title": "bar"}
+
+
+def test_file_manager_yaml_is_parsed_once(mocker, fs):
+    fs.create_file("/foo/.guake.yml", contents="title: bar")
+    safe_load = mocker.spy(guake.utils.yaml, "safe_load")
+    fm = FileManager(delta=9999)
+    assert fm.read_yaml("/foo/.guake.yml") == {"title": "bar"}
+    assert fm.read_yaml("/foo/.guake.yml") == {"title": "bar"}
+    assert safe_load.call_count == 1
+
+
+def test_file_manager_lru(fs):
+    for name in "abc":
+        fs.create_file(f"/foo/{name}", contents=name)
+    fm = FileManager(delta=9999, max_entries=2)
+    fm.read("/foo/a")
+    fm.read("/foo/b")
+    fm.read("/foo/a")
+    fm.read("/foo/c")
+    # b was the least recently used one
+    assert list(fm._cache) == ["/foo/a", "/foo/c"]
+
+
+def test_file_manager_eviction_keeps_other_lookups(fs):
+    fs.create_file("/a/.guake.yml", contents="a")
+    fs.create_file("/b/.guake.yml", contents="b")
+    fs.create_file("/c/other", contents="c")
+    fm = FileManager(delta=9999, max_entries=2)
+    fm.find_upwards("/a", ".guake.yml")
+    fm.find_upwards("/b", ".guake.yml")
+    # Evicts /a/.guake.yml and the lookup of /a only
+    fm.read("/c/other")
+    assert ("/b", ".guake.yml") in fm._lookups
+    assert ("/a", ".guake.yml") not in fm._lookups
+
+
+def test_file_manager_find_upwards(fs):
+    fs.create_file("/project/.guake.yml", contents="title: project")
+    fs.create_dir("/project/src/module")
+    fm = FileManager(delta=9999)
+    assert fm.find_upwards("/project/src/module", ".guake.yml") == "/project/.guake.yml"
+    assert fm.read_yaml_upwards("/project/src/module", ".guake.yml") == {"title": "project"}
+    assert fm.find_upwards("/elsewhere", ".guake.yml") is None
+
+    # Cached per directory
+    misses = fm.misses
+    assert fm.find_upwards("/project/src/module", ".guake.yml") == "/project/.guake.yml"
+    assert fm.misses == misses
+
+
+def test_file_manager_unwatched_entries_expire(mocker, fs):
+    fs.create_file("/foo", contents="bar")
+    mocker.patch.object(FileManager, "_watch", return_value=False)
+    fm = FileManager(delta=0.0, monitor=True)
+    assert fm.read("/foo") == "bar"
+    assert fm.find_upwards("/", "foo") == "/foo"
+    # Not watched, so checked again as without monitor
+    with open("/foo", "w", encoding="utf-8") as f:
+        f.write("baz")
+    assert fm.read("/foo") == "baz"
+    os.remove("/foo")
+    assert fm.find_upwards("/", "foo") is None
+
+
 def test_process_name():
     assert get_process_name(os.getpid())
+
+
+def make_background_manager(mocker, **kwargs):
+    manager = BackgroundImageManager(mocker.Mock(), **kwargs)
+    manager.bg_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 64, 32)
+    return manager
+
+
+def test_background_render_target_is_cached_per_size(mocker):
+    manager = make_background_manager(mocker)
+    normal = manager.render_target(100, 50, ImageLayoutMode.SCALE)
+    fullscreen = manager.render_target(200, 100, ImageLayoutMode.SCALE)
+    # Going back and forth between the sizes does not render again
+    assert manager.render_target(100, 50, ImageLayoutMode.SCALE) is normal
+    assert manager.render_target(200, 100, ImageLayoutMode.SCALE) is fullscreen
+    assert (manager.hits, manager.misses) == (2, 2)
+    assert manager.render_target(100, 50, ImageLayoutMode.TILE) is not normal
+    assert manager.cache_bytes == 100 * 4 * 50 * 2 + 200 * 4 * 100
+
+
+def test_background_render_target_scale_factor(mocker):
+    manager = make_background_manager(mocker)
+    surface = manager.render_target(100, 50, ImageLayoutMode.SCALE, scale=2)
+    assert (surface.get_width(), surface.get_height()) == (200, 100)
+    assert surface.get_device_scale() == (2, 2)
+    assert manager.render_target(100, 50, ImageLayoutMode.SCALE) is not surface
+
+
+def test_background_render_target_lru(mocker):
+    manager = make_background_manager(mocker, cache_entries=2)
+    for width in (10, 20, 10, 30):
+        manager.render_target(width, 10, ImageLayoutMode.SCALE)
+    # 20 was the least recently used one
+    assert [key[0] for key in manager._targets] == [10, 30]
+    assert manager.cache_bytes == (10 + 30) * 4 * 10
+
+
+def test_background_render_target_memory_limit(mocker):
+    manager = make_background_manager(mocker, cache_max_bytes=60 * 60 * 4 + 1000)
+    manager.render_target(50, 50, ImageLayoutMode.SCALE)
+    manager.render_target(60, 60, ImageLayoutMode.SCALE)
+    assert [key[0] for key in manager._targets] == [60]
+    # The last one is kept, even above the limit
+    manager.render_target(200, 200, ImageLayoutMode.SCALE)
+    assert [key[0] for key in manager._targets] == [200]
+    assert manager.cache_bytes == 200 * 4 * 200
+
+
+def test_background_clear_image_clears_cache(mocker):
+    manager = make_background_manager(mocker)
+    manager.render_target(100, 50, ImageLayoutMode.SCALE)
+    manager.load_from_file("")
+    assert manager.render_target(100, 50, ImageLayoutMode.SCALE) is None
+    assert manager.cache_bytes == 0
+
+
+def make_rectangle(x, y, width, height):
+    rect = Gdk.Rectangle()
+    rect.x, rect.y, rect.width, rect.height = x, y, width, height
+    return rect
+
+
+def make_box(mocker, search_revealer_visible=False):
+    """A RootTerminalBox at (10, 20) with a terminal and a search revealer at
+    its bottom right"""
+    box = mocker.Mock()
+    box.get_allocation.side_effect = lambda: make_rectangle(10, 20, 200, 100)
+    box.get_allocated_width.return_value = 200
+    box.get_allocated_height.return_value = 100
+    box.get_scale_factor.return_value = 1
+    box.get_child.return_value.is_drawable.return_value = True
+    box.get_child.return_value.get_allocation.side_effect = lambda: make_rectangle(10, 20, 200, 100)
+    box.search_revealer.is_drawable.return_value = search_revealer_visible
+    box.search_revealer.get_allocation.side_effect = lambda: make_rectangle(110, 90, 100, 30)
+    return box
+
+
+def make_clipped_context(x, y, width, height):
+    cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 200, 100))
+    cr.rectangle(x, y, width, height)
+    cr.clip()
+    return cr
+
+
+def test_background_draw_only_the_clip(mocker):
+    manager = make_background_manager(mocker)
+    box = make_box(mocker)
+    manager.draw(box, make_clipped_context(0, 0, 200, 10))
+    box.propagate_draw.assert_called_once()
+    child, child_cr = box.propagate_draw.call_args[0]
+    assert child is box.get_child.return_value
+    # The children are drawn in a surface of the size of the clip
+    assert Gdk.cairo_get_clip_rectangle(child_cr)[1].width == 200
+    assert Gdk.cairo_get_clip_rectangle(child_cr)[1].height == 10
+    assert manager.frame_stats["image"].count == 0
+
+
+def test_background_draw_reuses_the_scratch_surface(mocker):
+    manager = make_background_manager(mocker)
+    box = make_box(mocker)
+    manager.draw(box, make_clipped_context(0, 0, 200, 50))
+    scratch = manager._scratch
+    manager.draw(box, make_clipped_context(0, 50, 100, 10))
+    assert manager._scratch is scratch
+    manager.draw(box, make_clipped_context(0, 0, 200, 100))
+    assert manager._scratch is not scratch
+
+
+def test_background_draw_search_revealer(mocker):
+    manager = make_background_manager(mocker)
+    box = make_box(mocker, search_revealer_visible=True)
+    # Outside of the search revealer
+    manager.draw(box, make_clipped_context(0, 0, 50, 10))
+    assert [c[0][0] for c in box.propagate_draw.call_args_list] == [box.get_child.return_value]
+    box.propagate_draw.reset_mock()
+    # Both are drawn in the same context, the revealer above the terminals
+    manager.draw(box, make_clipped_context(150, 80, 50, 20))
+    children = [c[0][0] for c in box.propagate_draw.call_args_list]
+    assert children == [box.get_child.return_value, box.search_revealer]
+    assert box.propagate_draw.call_args_list[0][0][1] is box.propagate_draw.call_args_list[1][0][1]
+
+
+def test_background_draw_empty_clip(mocker):
+    manager = make_background_manager(mocker)
+    box = make_box(mocker)
+    cr = make_clipped_context(0, 0, 0, 0)
+    manager.draw(box, cr)
+    box.propagate_draw.assert_not_called()
+    assert not manager._targets
+
+
+def test_background_frame_stats(mocker):
+    manager = make_background_manager(mocker)
+    box = make_box(mocker)
+    manager.on_draw_start(box, None)
+    manager.draw(box, make_clipped_context(0, 0, 200, 100))
+    manager.bg_surface = None
+    manager.on_draw_start(box, None)
+    manager.draw(box, make_clipped_context(0, 0, 200, 100))
+    assert manager.frame_stats["image"].count == 1
+    assert manager.frame_stats["plain"].count == 1
+    assert manager.frame_stats["plain"].mean <= manager.frame_stats["plain"].longest
+
+
+def test_get_decode_size():
+    # Covers the monitor, in both directions
+    assert get_decode_size(7680, 4320, 1920, 1080) == (1920, 1080)
+    assert get_decode_size(8000, 2000, 1920, 1080) == (4320, 1080)
+    assert get_decode_size(2000, 8000, 1920, 1080) == (1920, 7680)
+    # Never enlarged
+    assert get_decode_size(1280, 720, 1920, 1080) == (1280, 720)
+    assert get_decode_size(3000, 720, 1920, 1080) == (3000, 720)
+
+
+def write_image(path, width, height):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    surface.write_to_png(str(path))
+    return str(path)
+
+
+def wait_background_loaded(manager):
+    while manager.loading:
+        GLib.MainContext.default().iteration(True)
+
+
+def test_background_load_scaled_to_monitor(mocker, tmp_path):
+    manager = BackgroundImageManager(mocker.Mock())
+    mocker.patch.object(manager, "get_max_monitor_size", return_value=(200, 100))
+    manager.load_from_file(write_image(tmp_path / "big.png", 800, 800))
+    # Loaded in the background
+    assert manager.loading
+    wait_background_loaded(manager)
+    assert (manager.bg_surface.get_width(), manager.bg_surface.get_height()) == (200, 200)
+    assert manager.get_memory_usage() == {"image": 200 * 4 * 200, "rendered": 0, "scratch": 0}
+
+    # Tiled: at its own size
+    manager.layout_mode = ImageLayoutMode.TILE
+    wait_background_loaded(manager)
+    assert manager.bg_surface.get_width() == 800
+
+
+def test_background_load_keeps_the_last_one(mocker, tmp_path):
+    manager = BackgroundImageManager(mocker.Mock())
+    mocker.patch.object(manager, "get_max_monitor_size", return_value=(200, 100))
+    manager.load_from_file(write_image(tmp_path / "first.png", 300, 300))
+    manager.load_from_file(write_image(tmp_path / "second.png", 50, 50))
+    wait_background_loaded(manager)
+    assert manager.bg_surface.get_width() == 50
+    # The first one, decoded after, is ignored too
+    while GLib.MainContext.default().iteration(False):
+        pass
+    assert manager.bg_surface.get_width() == 50
+
+
+def test_background_load_invalid_image(mocker, tmp_path):
+    manager = BackgroundImageManager(mocker.Mock())
+    mocker.patch.object(manager, "get_max_monitor_size", return_value=(200, 100))
+    path = tmp_path / "invalid.png"
+    path.write_text("not an image")
+    manager.load_from_file(str(path))
+    wait_background_loaded(manager)
+    assert manager.bg_surface is None
+    assert manager.filename == ""
+
+
+def test_background_load_unexpected_error(mocker, tmp_path):
+    manager = BackgroundImageManager(mocker.Mock())
+    mocker.patch.object(manager, "get_max_monitor_size", return_value=(200, 100))
+    mocker.patch("guake.utils.GdkPixbuf.Pixbuf.get_file_info", side_effect=ValueError)
+    manager.load_from_file(write_image(tmp_path / "image.png", 50, 50))
+    wait_background_loaded(manager)
+    assert manager.bg_surface is None
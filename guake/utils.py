@@ -19,11 +19,13 @@ License along with this program; if not, write to the
 Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
 Boston, MA 02110-1301 USA
 """
+import collections
 import enum
 import logging
+import math
 import os
 import re
-import subprocess
+import threading
 import time
 import yaml
 
@@ -33,14 +35,20 @@ import gi
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("Gdk", "3.0")
+gi.require_version("GdkPixbuf", "2.0")
 
+from gi.repository import GLib
 from gi.repository import Gdk
+from gi.repository import GdkPixbuf
+from gi.repository import Gio
 from gi.repository import Gtk
 from guake.globals import ALIGN_BOTTOM
 from guake.globals import ALIGN_CENTER
 from guake.globals import ALIGN_LEFT
 from guake.globals import ALIGN_RIGHT
 from guake.globals import ALIGN_TOP
+from guake.settings import export_settings
+from guake.settings import import_settings
 
 try:
     from gi.repository import GdkX11
@@ -90,74 +98,207 @@ def save_tabs_when_changed(func):
         log.debug("mom, I've been called: %s %s", func.__name__, func)
 
         # Tada!
-        if g and g.settings.general.get_boolean("save-tabs-when-changed"):
-            g.save_tabs()
+        if g and g.settings.general.cached.save_tabs_when_changed:
+            g.session_writer.mark_dirty()
 
     return wrapper
 
 
+def _get_schema_source():
+    from guake.paths import SCHEMA_DIR  # pylint: disable=import-outside-toplevel
+
+    return Gio.SettingsSchemaSource.new_from_directory(
+        SCHEMA_DIR, Gio.SettingsSchemaSource.get_default(), False
+    )
+
+
 def save_preferences(filename):
-    # XXX: Hardcode?
-    prefs = subprocess.check_output(["dconf", "dump", "/org/guake/"])
-    with open(filename, "wb") as f:
+    """Save the preferences in `filename`, in the format of `dconf dump`"""
+    prefs = export_settings(_get_schema_source())
+    with open(filename, "w", encoding="utf-8") as f:
         f.write(prefs)
 
 
 def restore_preferences(filename):
-    # XXX: Hardcode?
-    with open(filename, "rb") as f:
+    """Restore the preferences saved in `filename` by `save_preferences` (or
+    `dconf dump /org/guake/`)"""
+    with open(filename, encoding="utf-8") as f:
         prefs = f.read()
-    with subprocess.Popen(["dconf", "load", "/org/guake/"], stdin=subprocess.PIPE) as p:
-        p.communicate(input=prefs)
+    import_settings(_get_schema_source(), prefs)
 
 
 class FileManager:
-    def __init__(self, delta=1.0):
-        self._cache = {}
+    """Read small files (e.g. .guake.yml) through a cache.
+
+    Both the content of the files and the failures to read them (the common
+    case: no .guake.yml in the directory) are cached, as well as the parsed
+    YAML. At most `max_entries` files are kept, the least recently used ones
+    are evicted first.
+
+    An entry expires after `delta` seconds, unless `monitor` is set: the
+    files are then watched with a Gio.FileMonitor and an entry stays valid
+    until its file changes (or expires as usual if it cannot be watched).
+    """
+
+    def __init__(self, delta=1.0, max_entries=256, monitor=False):
+        self._cache = collections.OrderedDict()
         self._delta = max(0.0, delta)
+        self._max_entries = max(1, max_entries)
+        # (directory, name) -> {"time": float, "path": str or None, "watched": bool}
+        self._lookups = collections.OrderedDict()
+        self._monitors = {}
+        self._monitor = monitor
+        self.hits = 0
+        self.misses = 0
 
     def clear(self):
         self._cache.clear()
+        self._lookups.clear()
+        for monitor in self._monitors.values():
+            monitor.cancel()
+        self._monitors.clear()
+
+    def set_monitor(self, monitor):
+        """Use Gio.FileMonitor instead of the time based expiry"""
+        if monitor != self._monitor:
+            self._monitor = monitor
+            self.clear()
+
+    def invalidate(self, filename):
+        self._cache.pop(filename, None)
+        monitor = self._monitors.pop(filename, None)
+        if monitor is not None:
+            monitor.cancel()
+        # Any lookup may have gone through this file
+        self._lookups.clear()
+
+    def _evict(self, filename):
+        """Drop the entry of `filename`, and only the lookups which went
+        through it: those of the same name in its directory or below"""
+        self._cache.pop(filename, None)
+        monitor = self._monitors.pop(filename, None)
+        if monitor is not None:
+            monitor.cancel()
+        directory, name = os.path.split(filename)
+        for key in list(self._lookups):
+            lookup_directory, lookup_name = key
+            if lookup_name != name:
+                continue
+            lookup_directory = os.path.abspath(lookup_directory)
+            if lookup_directory == directory or lookup_directory.startswith(
+                directory.rstrip(os.sep) + os.sep
+            ):
+                del self._lookups[key]
+
+    def _is_fresh(self, entry):
+        return entry["watched"] or entry["time"] + self._delta >= time.monotonic()
+
+    def _watch(self, filename):
+        """Returns True if `filename` is watched"""
+        if filename in self._monitors:
+            return True
+        try:
+            monitor = Gio.File.new_for_path(filename).monitor_file(Gio.FileMonitorFlags.NONE, None)
+        except GLib.Error:  # pylint: disable=catching-non-exception
+            log.debug("Unable to monitor %s.", filename, exc_info=True)
+            return False
+        monitor.connect("changed", lambda *args: self.invalidate(filename))
+        self._monitors[filename] = monitor
+        return True
+
+    def _get_entry(self, filename):
+        entry = self._cache.get(filename)
+        if entry is not None and self._is_fresh(entry):
+            self.hits += 1
+            self._cache.move_to_end(filename)
+            return entry
+        self.misses += 1
+        entry = {"time": time.monotonic(), "watched": False}
+        try:
+            with open(filename, mode="r", encoding="utf-8") as fd:
+                entry["content"] = fd.read()
+        except (OSError, UnicodeDecodeError) as e:
+            entry["error"] = e
+        entry["watched"] = self._monitor and self._watch(filename)
+        self._cache[filename] = entry
+        self._cache.move_to_end(filename)
+        while len(self._cache) > self._max_entries:
+            self._evict(next(iter(self._cache)))
+        return entry
 
     def read_yaml(self, filename: str):
+        """Returns the parsed YAML content of `filename`, None if it cannot be
+        read or parsed. The returned value is shared, do not modify it."""
+        entry = self._get_entry(filename)
+        if "yaml" in entry:
+            return entry["yaml"]
 
         content = None
-
-        try:
-            content = self.read(filename)
-        except PermissionError:
+        error = entry.get("error")
+        if isinstance(error, PermissionError):
             log.debug("PermissionError while reading %s.", filename)
-        except FileNotFoundError:
+        elif isinstance(error, FileNotFoundError):
             log.debug("File %s does not exists.", filename)
-        except UnicodeDecodeError:
+        elif isinstance(error, UnicodeDecodeError):
             log.debug("Encoding error %s (we assume is utf-8).", filename)
-
-        if content is not None:
+        elif error is None:
             try:
-                content = yaml.safe_load(content)
+                content = yaml.safe_load(entry["content"])
             except yaml.YAMLError:
                 log.debug("YAMLError reading %s.", filename)
                 content = None
+        entry["yaml"] = content
         return content
 
     def read(self, filename: str) -> str:
         # Return the content of a file from the fs or from cache.
-        if (
-            filename not in self._cache
-            or self._cache[filename]["time"] + self._delta < time.monotonic()
-        ):
-            with open(filename, mode="r", encoding="utf-8") as fd:
-                self._cache[filename] = {"time": time.monotonic(), "content": fd.read()}
-        return self._cache[filename]["content"]
+        entry = self._get_entry(filename)
+        if "error" in entry:
+            raise entry["error"].with_traceback(None)
+        return entry["content"]
+
+    def find_upwards(self, directory: str, name: str):
+        """Returns the path of the file `name` in `directory` or the closest of
+        its parents, None if there is none. The result is cached per directory."""
+        key = (directory, name)
+        lookup = self._lookups.get(key)
+        if lookup is not None and self._is_fresh(lookup):
+            self._lookups.move_to_end(key)
+            return lookup["path"]
+        path = None
+        # Only valid until a change if all the files it went through are watched
+        watched = True
+        current = os.path.abspath(directory)
+        while True:
+            candidate = os.path.join(current, name)
+            entry = self._get_entry(candidate)
+            watched = watched and entry["watched"]
+            if "error" not in entry:
+                path = candidate
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+        self._lookups[key] = {"time": time.monotonic(), "path": path, "watched": watched}
+        while len(self._lookups) > self._max_entries:
+            self._lookups.popitem(last=False)
+        return path
+
+    def read_yaml_upwards(self, directory: str, name: str):
+        """Same as `read_yaml` for the file found by `find_upwards`"""
+        path = self.find_upwards(directory, name)
+        if path is None:
+            return None
+        return self.read_yaml(path)
 
 
 class TabNameUtils:
     @classmethod
     def shorten(cls, text, settings):
-        use_vte_titles = settings.general.get_boolean("use-vte-titles")
-        if not use_vte_titles:
+        if not settings.general.cached.use_vte_titles:
             return text
-        max_name_length = settings.general.get_int("max-tab-name-length")
+        max_name_length = settings.general.cached.max_tab_name_length
         if max_name_length != 0 and len(text) > max_name_length:
             text = "..." + text[-max_name_length:]
         return text
@@ -350,6 +491,27 @@ class RectCalculator:
         return monitor
 
 
+class FrameStats:
+    """Count and duration of drawn frames"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.longest = max(self.longest, duration)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
 class ImageLayoutMode(enum.IntEnum):
     SCALE = 0
     TILE = 1
@@ -357,14 +519,64 @@ class ImageLayoutMode(enum.IntEnum):
     STRETCH = 3
 
 
+def get_decode_size(width, height, max_width, max_height):
+    """Size to decode a `width` x `height` image at, keeping its aspect ratio,
+    so that it still covers `max_width` x `max_height` without more pixels
+    than needed. Images are never enlarged."""
+    scale = max(max_width / width, max_height / height)
+    if scale >= 1:
+        return width, height
+    return min(width, math.ceil(width * scale)), min(height, math.ceil(height * scale))
+
+
+# These layouts use the image at its own size
+FULL_SIZE_MODES = (ImageLayoutMode.TILE, ImageLayoutMode.CENTER)
+
+
 class BackgroundImageManager:
-    def __init__(self, window, filename=None, layout_mode=ImageLayoutMode.SCALE):
+    """Paint the background image behind the terminals.
+
+    The image is decoded in a thread, scaled down to cover the largest
+    monitor (unless it is tiled or centered, which use it at its own size).
+    The previous image, if any, stays until the new one is ready.
+
+    The image is rendered once per size of the RootTerminalBoxes drawing it
+    (they differ between fullscreen and not, with or without the tab bar...),
+    and the rendered surfaces kept in a cache of at most `cache_entries`
+    surfaces and `cache_max_bytes` bytes, the least recently used ones being
+    evicted first. The most recent one is always kept.
+    """
+
+    def __init__(
+        self,
+        window,
+        filename=None,
+        layout_mode=ImageLayoutMode.SCALE,
+        cache_entries=4,
+        cache_max_bytes=128 * 1024 * 1024,
+    ):
         self.window = window
         self.filename = ""
-        self.bg_surface = self.load_from_file(filename) if filename else None
-        self.target_surface = None
-        self.target_info = (-1, -1, -1)  # (width, height, model)
+        # (width, height, mode, scale factor, filter) -> rendered surface
+        self._targets = collections.OrderedDict()
+        self._cache_entries = max(1, cache_entries)
+        self._cache_max_bytes = cache_max_bytes
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._scratch = None
+        self._scratch_info = None
+        # Time of the frames of the RootTerminalBoxes, with and without image
+        self.frame_stats = {"image": FrameStats(), "plain": FrameStats()}
+        self._frame_start = None
         self._layout_mode = layout_mode
+        self.bg_surface = None
+        # Incremented at each load, to ignore the images decoded too late
+        self._generation = 0
+        self._full_size = False
+        self.loading = False
+        if filename:
+            self.load_from_file(filename)
 
     @property
     def layout_mode(self):
@@ -376,26 +588,121 @@ class BackgroundImageManager:
         if mode not in ImageLayoutMode:
             raise ValueError("Unknown layout mode")
         self._layout_mode = mode
+        if mode in FULL_SIZE_MODES and not self._full_size and os.path.exists(self.filename):
+            # The image was scaled down when decoded
+            self.load_from_file(self.filename)
         self.window.queue_draw()
 
+    def clear_cache(self):
+        self._targets.clear()
+        self.cache_bytes = 0
+        self._scratch = None
+
+    @staticmethod
+    def _surface_bytes(surface):
+        return surface.get_stride() * surface.get_height()
+
+    def _cache_target(self, key, surface):
+        self._targets[key] = surface
+        self.cache_bytes += self._surface_bytes(surface)
+        while len(self._targets) > 1 and (
+            len(self._targets) > self._cache_entries or self.cache_bytes > self._cache_max_bytes
+        ):
+            _, evicted = self._targets.popitem(last=False)
+            self.cache_bytes -= self._surface_bytes(evicted)
+
+    def get_memory_usage(self):
+        """Bytes used by the surfaces: the decoded image, the image rendered at
+        the sizes of the terminals and the scratch surface used to draw them"""
+        scratch = 0
+        if self._scratch is not None:
+            (_, scale), (width, height) = self._scratch_info
+            scratch = width * height * 4 * scale * scale
+        return {
+            "image": self._surface_bytes(self.bg_surface) if self.bg_surface else 0,
+            "rendered": self.cache_bytes,
+            "scratch": scratch,
+        }
+
+    def get_max_monitor_size(self):
+        """The largest width and height (in pixels) of the monitors.
+
+        Their whole geometry, not only their work area: in fullscreen the
+        window covers the panels too.
+        """
+        display = self.window.get_display()
+        width = height = 0
+        for index in range(display.get_n_monitors()):
+            monitor = display.get_monitor(index)
+            geometry = monitor.get_geometry()
+            width = max(width, geometry.width * monitor.get_scale_factor())
+            height = max(height, geometry.height * monitor.get_scale_factor())
+        return width, height
+
     def load_from_file(self, filename):
+        """Start loading `filename`, the image is drawn once decoded"""
         if not filename:
             # Clear the background image
+            self._generation += 1
+            self.filename = ""
+            self.loading = False
             self.bg_surface = None
+            self.clear_cache()
             self.window.queue_draw()
             return
 
         if not os.path.exists(filename):
             raise FileNotFoundError(f"Background file not found: {filename}")
 
-        if self.filename:
-            # Cached rendered surface
+        full_size = self.layout_mode in FULL_SIZE_MODES
+        if self.filename and (self._full_size or not full_size):
+            # Already loaded, or being loaded
             if os.path.samefile(self.filename, filename):
-                return self.bg_surface
+                return
 
+        self._generation += 1
         self.filename = filename
-        img = Gtk.Image.new_from_file(filename)
-        pixbuf = img.get_pixbuf()
+        self._full_size = full_size
+        self.loading = True
+        max_size = None if full_size else self.get_max_monitor_size()
+        threading.Thread(
+            target=self._decode,
+            args=(self._generation, filename, max_size),
+            name="guake-background",
+            daemon=True,
+        ).start()
+
+    def _decode(self, generation, filename, max_size):
+        """Run in a thread of its own"""
+        pixbuf = None
+        size = None
+        try:
+            _, width, height = GdkPixbuf.Pixbuf.get_file_info(filename)
+            size = (width, height)
+            if max_size and all(max_size) and width and height:
+                width, height = get_decode_size(width, height, *max_size)
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(filename, width, height, False)
+            else:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(filename)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Unable to load the background image %s", filename)
+            pixbuf = None
+        finally:
+            # Always, for `loading` to be reset
+            GLib.idle_add(self._on_decoded, generation, filename, pixbuf, size)
+
+    def _on_decoded(self, generation, filename, pixbuf, size):
+        if generation != self._generation:
+            # Another image was asked for in the meantime
+            return False
+        self.loading = False
+        if pixbuf is None:
+            self.filename = ""
+            self.bg_surface = None
+            self.clear_cache()
+            self.window.queue_draw()
+            return False
+
         surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, pixbuf.get_width(), pixbuf.get_height())
         cr = cairo.Context(surface)
         Gdk.cairo_set_source_pixbuf(cr, pixbuf, 0, 0)
@@ -403,22 +710,40 @@ class BackgroundImageManager:
         cr.paint()
 
         self.bg_surface = surface
-        self.target_info = (-1, -1, -1)
+        self.clear_cache()
+        log.info(
+            "Background image %s (%dx%d) loaded at %dx%d, %.1f MiB",
+            filename,
+            *size,
+            surface.get_width(),
+            surface.get_height(),
+            self._surface_bytes(surface) / 1024 / 1024,
+        )
         self.window.queue_draw()
-        return surface
+        return False
+
+    def render_target(self, width, height, mode, scale_mode=cairo.FILTER_BILINEAR, scale=1):
+        """Paint bacground image to the specific size target surface with different layout mode
 
-    def render_target(self, width, height, mode, scale_mode=cairo.FILTER_BILINEAR):
-        """Paint bacground image to the specific size target surface with different layout mode"""
+        `scale` is the scale factor of the monitor, the surface has `scale`
+        times more pixels in each direction than the `width` and `height` it
+        covers.
+        """
         if not self.bg_surface:
             return None
 
         # Check if target surface has been rendered
-        if self.target_info == (width, height, mode):
-            return self.target_surface
+        key = (width, height, mode, scale, scale_mode)
+        surface = self._targets.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._targets.move_to_end(key)
+            return surface
 
         # Render new target
-        self.target_info = (width, height, mode)
-        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        self.misses += 1
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width * scale, height * scale)
+        surface.set_device_scale(scale, scale)
         cr = cairo.Context(surface)
         cr.set_operator(cairo.OPERATOR_SOURCE)
 
@@ -446,11 +771,59 @@ class BackgroundImageManager:
             cr.get_source().set_filter(scale_mode)
         cr.paint()
 
-        self.target_surface = surface
+        self._cache_target(key, surface)
         return surface
 
+    def on_draw_start(self, widget, cr):
+        """Connected before the draw of the RootTerminalBoxes, to time the frames"""
+        self._frame_start = time.perf_counter()
+
     def draw(self, widget, cr):
-        if not self.bg_surface:
+        """Connected after the draw of the RootTerminalBoxes"""
+        if self.bg_surface:
+            self._draw_background(widget, cr)
+        if self._frame_start is not None:
+            stats = self.frame_stats["image" if self.bg_surface else "plain"]
+            stats.record(time.perf_counter() - self._frame_start)
+            self._frame_start = None
+
+    def _get_scratch_surface(self, cr, width, height, scale):
+        """A surface similar to the target of `cr` of at least `width` x
+        `height`, reused from one frame to the next"""
+        target = cr.get_target()
+        key = (target.get_type(), scale)
+        if self._scratch is not None:
+            scratch_key, (scratch_width, scratch_height) = self._scratch_info
+            if scratch_key == key and scratch_width >= width and scratch_height >= height:
+                return self._scratch
+            if scratch_key == key:
+                width, height = max(width, scratch_width), max(height, scratch_height)
+        self._scratch = target.create_similar(cairo.CONTENT_COLOR_ALPHA, width, height)
+        self._scratch_info = (key, (width, height))
+        return self._scratch
+
+    @staticmethod
+    def _get_damaged_children(widget, clip):
+        """The children of `widget` drawn in the `clip` rectangle"""
+        origin = widget.get_allocation()
+        children = []
+        for child in (widget.get_child(), getattr(widget, "search_revealer", None)):
+            if child is None or not child.is_drawable():
+                continue
+            # RootTerminalBox has no window of its own, the allocations of its
+            # children are relative to its parent
+            allocation = child.get_allocation()
+            allocation.x -= origin.x
+            allocation.y -= origin.y
+            if Gdk.rectangle_intersect(allocation, clip)[0]:
+                children.append(child)
+        return children
+
+    def _draw_background(self, widget, cr):
+        # Only the part being redrawn (e.g. the line of the cursor) is painted
+        # again, GTK set the clip of `cr` to it
+        visible, clip = Gdk.cairo_get_clip_rectangle(cr)
+        if not visible:
             return
 
         # Step 1. Get target surface
@@ -459,6 +832,7 @@ class BackgroundImageManager:
             widget.get_allocated_width(),
             widget.get_allocated_height(),
             self.layout_mode,
+            scale=widget.get_scale_factor(),
         )
 
         cr.save()
@@ -470,60 +844,49 @@ class BackgroundImageManager:
         cr.set_source_surface(surface, 0, 0)
         cr.paint()
 
-        # Step 3. Re-paint child draw result to a new surface
+        children = self._get_damaged_children(widget, clip)
+        if not children:
+            cr.restore()
+            return
+
+        # Step 3. Re-paint the children (the terminals, then the search revealer
+        #         above them) into a scratch surface
         #
-        #         We need to re-paint what we overlapped in previous step,
-        #         so we paint our child (again, in lifecycle view) into a similar surface.
+        #         We need to re-paint what we overlapped in previous step. Only
+        #         the clip rectangle is drawn, the scratch surface is translated
+        #         so that its origin is the corner of the clip.
         #
-        child = widget.get_child()
-        child_surface = cr.get_target().create_similar(
-            cairo.CONTENT_COLOR_ALPHA,
-            child.get_allocated_width(),
-            child.get_allocated_height(),
-        )
-        child_cr = cairo.Context(child_surface)
-
-        # Re-paint child draw into child context (which using child_surface as target)
-        widget.propagate_draw(child, child_cr)
-
-        # Step 3.1 Re-paint search revealer
-        child_sr_surface = None
-        if getattr(widget, "search_revealer", None):
-            child_sr = widget.search_revealer
-            child_sr_surface = cr.get_target().create_similar(
-                cairo.CONTENT_COLOR_ALPHA,
-                child_sr.get_allocated_width(),
-                child_sr.get_allocated_height(),
-            )
-            child_sr_cr = cairo.Context(child_surface)
-
-            # Re-paint child draw into child context (which using child_surface as target)
-            widget.propagate_draw(child_sr, child_sr_cr)
-
-        # Step 4. Paint child surface into our context (RootTerminalBox)
+        scratch = self._get_scratch_surface(cr, clip.width, clip.height, widget.get_scale_factor())
+        scratch_cr = cairo.Context(scratch)
+        scratch_cr.rectangle(0, 0, clip.width, clip.height)
+        scratch_cr.clip()
+        # Reused: clear what the previous frame left
+        scratch_cr.set_operator(cairo.OPERATOR_CLEAR)
+        scratch_cr.paint()
+        scratch_cr.set_operator(cairo.OPERATOR_OVER)
+        scratch_cr.translate(-clip.x, -clip.y)
+        for child in children:
+            widget.propagate_draw(child, scratch_cr)
+
+        # Step 4. Paint the scratch surface into our context (RootTerminalBox)
         #
         #         Before this step, we have two important context/surface
-        #             1. cr       / RootTerminalBox
-        #             2. child_cr / child (RootTerminalBox's child)
+        #             1. cr         / RootTerminalBox
+        #             2. scratch_cr / children of the RootTerminalBox
         #         And current context have these draw:
-        #             1. cr       - background image
-        #             2. child_cr - child re-paint (split terminal, VTE draw ...etc)
-        #         In this step, we are going to paint child_cr result back to cr,
+        #             1. cr         - background image
+        #             2. scratch_cr - children re-paint (split terminal, VTE draw ...etc)
+        #         In this step, we are going to paint scratch_cr result back to cr,
         #         so in the end, we will get background image + other child stuff
         #
         # DEBUG: If you don't believe, use cairo.Surface.wrte_to_png(filename) to check what is
         #        inside the surface.
         #
-        cr.set_source_surface(child_surface, 0, 0)
+        cr.rectangle(clip.x, clip.y, clip.width, clip.height)
+        cr.clip()
+        cr.set_source_surface(scratch, clip.x, clip.y)
         cr.set_operator(cairo.OPERATOR_OVER)
         cr.paint()
-
-        # Paint search revealer
-        if child_sr_surface:
-            cr.set_source_surface(child_sr_surface, 0, 0)
-            cr.set_operator(cairo.OPERATOR_OVER)
-            cr.paint()
-
         cr.restore()
 
 
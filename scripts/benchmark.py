@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""Micro benchmarks of Guake, run against a real (but never shown) Guake window.
+
+Usage:
+
+    PYTHONPATH=. python3 scripts/benchmark.py [name ...]
+
+Without names, all the benchmarks are run. Run it on two trees to compare the
+numbers before and after a change.
+"""
+import json
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib
+from gi.repository import Gtk
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.replace("bench_", "")] = func
+    return func
+
+
+class StallMonitor:
+    """Measure the longest time the main loop did not run a high priority tick"""
+
+    def __init__(self):
+        self.longest = 0.0
+        self._last = time.monotonic()
+        self._id = GLib.timeout_add(1, self._tick, priority=GLib.PRIORITY_HIGH)
+
+    def _tick(self):
+        now = time.monotonic()
+        self.longest = max(self.longest, now - self._last)
+        self._last = now
+        return True
+
+    def stop(self):
+        GLib.source_remove(self._id)
+
+
+def run_main_loop_until(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        Gtk.main_iteration_do(False)
+
+
+def make_guake(config_dir):
+    from guake.guake_app import Guake
+
+    Guake.get_xdg_config_directory = lambda self: config_dir
+    return Guake()
+
+
+@benchmark
+def bench_restore(n_tabs=50, n_panes=4):
+    """Restore a session of `n_tabs` tabs split into `n_panes` terminals each"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+
+    # Full binary tree of terminals, in pre-order
+    def layout(n):
+        if n == 1:
+            return [{"type": "term", "directory": str(config_dir)}]
+        return [{"type": "dual_v", "directory": None}] + layout(n // 2) + layout(n - n // 2)
+
+    tabs = [
+        {"panes": layout(n_panes), "label": f"tab {i}", "custom_label_set": True}
+        for i in range(n_tabs)
+    ]
+    session = {"schema_version": 2, "timestamp": int(time.time()), "workspace": {"0": [tabs]}}
+    (config_dir / "bench.json").write_text(json.dumps(session), encoding="utf-8")
+
+    monitor = StallMonitor()
+    start = time.monotonic()
+    g.restore_tabs("bench.json", suppress_notify=True)
+    returned = time.monotonic() - start
+    restore_queue = getattr(g, "restore_queue", None)
+    run_main_loop_until(lambda: restore_queue is None or not len(restore_queue))
+    done = time.monotonic() - start
+    monitor.stop()
+
+    n_terminals = len(g.notebook_manager.get_terminals())
+    print(f"restore: {n_tabs} tabs x {n_panes} panes, {n_terminals} terminals")
+    print(f"  restore_tabs returned in {returned * 1000:.1f} ms")
+    print(f"  all tabs restored in     {done * 1000:.1f} ms")
+    print(f"  longest main loop stall  {monitor.longest * 1000:.1f} ms")
+
+
+@benchmark
+def bench_startup(n_tabs=20):
+    """Time to the first paint of the current terminal when restoring `n_tabs` tabs"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    tabs = [
+        {"directory": str(config_dir), "label": f"tab {i}", "custom_label_set": True}
+        for i in range(n_tabs)
+    ]
+    session = {"schema_version": 2, "timestamp": int(time.time()), "workspace": {"0": [tabs]}}
+    (config_dir / "bench.json").write_text(json.dumps(session), encoding="utf-8")
+
+    first_paint = []
+    start = time.monotonic()
+    g.restore_tabs("bench.json", suppress_notify=True)
+    terminal = g.get_notebook().get_current_terminal()
+    terminal.connect_after("draw", lambda *args: first_paint.append(time.monotonic()) and False)
+    g.show()
+    run_main_loop_until(lambda: first_paint)
+    painted = (first_paint or [time.monotonic()])[0] - start
+
+    def all_spawned():
+        return all(t.pid is not None for t in g.notebook_manager.iter_terminals())
+
+    run_main_loop_until(all_spawned)
+    spawned = time.monotonic() - start
+
+    print(f"startup: {n_tabs} restored tabs")
+    print(f"  first paint of the current terminal {painted * 1000:.1f} ms")
+    print(f"  all shells spawned                  {spawned * 1000:.1f} ms")
+
+
+@benchmark
+def bench_lazy_restore(n_tabs=60, n_panes=2):
+    """Restore `n_tabs` tabs with and without lazy-tab-restore"""
+    for lazy in (False, True):
+        config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+        g = make_guake(config_dir)
+        panes = [{"type": "dual_v", "directory": None}] + [
+            {"type": "term", "directory": str(config_dir)}
+        ] * n_panes
+        tabs = [
+            {"panes": panes[: n_panes + 1], "label": f"tab {i}", "custom_label_set": True}
+            for i in range(n_tabs)
+        ]
+        session = {"schema_version": 2, "timestamp": int(time.time()), "workspace": {"0": [tabs]}}
+        (config_dir / "bench.json").write_text(json.dumps(session), encoding="utf-8")
+
+        g.settings.general.set_boolean("lazy-tab-restore", lazy)
+        start = time.monotonic()
+        g.restore_tabs("bench.json", suppress_notify=True)
+        run_main_loop_until(lambda: not len(g.restore_queue))
+        done = time.monotonic() - start
+        g.settings.general.reset("lazy-tab-restore")
+
+        print(f"restore: {n_tabs} tabs x {n_panes} panes, lazy={lazy}")
+        print(f"  terminals created {len(g.notebook_manager.get_terminals())}")
+        print(f"  restored in       {done * 1000:.1f} ms")
+
+
+@benchmark
+def bench_many_tabs(n_tabs=200, n_batches=4):
+    """Open `n_tabs` tabs one by one, the last ones should not take longer than the first ones"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    batch = n_tabs // n_batches
+    durations = []
+    for _ in range(n_batches):
+        start = time.perf_counter()
+        for _ in range(batch):
+            g.add_tab(str(config_dir))
+        durations.append(time.perf_counter() - start)
+    run_main_loop_until(lambda: not Gtk.events_pending(), timeout=5)
+
+    print(f"many tabs: {n_batches * batch} tabs")
+    for index, duration in enumerate(durations):
+        first, last = index * batch, (index + 1) * batch - 1
+        print(f"  tabs {first:4d}-{last:4d}  {duration / batch * 1000:.2f} ms/tab")
+    # Linear: a tab costs about the same whatever the number of tabs already open
+    ratio = durations[-1] / durations[0]
+    print(f"  last/first batch     {ratio:.2f}")
+    assert ratio < 2, f"opening a tab gets slower with the number of tabs ({ratio:.2f}x)"
+
+
+@benchmark
+def bench_titles(n_titles=5000):
+    """Feed `n_titles` title escape sequences into a terminal"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    nb = g.get_notebook()
+    nb.new_page_with_focus()
+    terminal = nb.get_current_terminal()
+    run_main_loop_until(lambda: terminal.pid is not None)
+
+    start = time.monotonic()
+    for i in range(n_titles):
+        terminal.feed(f"\x1b]0;progress {i}/{n_titles}\x07".encode())
+        Gtk.main_iteration_do(False)
+    fed = time.monotonic() - start
+    last_title = f"progress {n_titles - 1}/{n_titles}"
+    run_main_loop_until(lambda: nb.get_tab_text_index(nb.get_current_page()) == last_title, 5)
+    done = time.monotonic() - start
+
+    print(f"titles: {n_titles} title changes")
+    print(f"  fed in               {fed * 1000:.1f} ms")
+    print(f"  last title shown in  {done * 1000:.1f} ms")
+    print(f"  tab title updates    {getattr(g, 'title_updates', 'n/a')}")
+
+
+@benchmark
+def bench_settings(n_reads=100000):
+    """Read a boolean setting `n_reads` times, from GSettings and from the cache"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    general = g.settings.general
+
+    start = time.perf_counter()
+    for _ in range(n_reads):
+        general.get_boolean("use-vte-titles")
+    gsettings = time.perf_counter() - start
+
+    cached = getattr(general, "cached", None)
+    start = time.perf_counter()
+    if cached is not None:
+        for _ in range(n_reads):
+            cached.use_vte_titles  # pylint: disable=pointless-statement
+    cache = time.perf_counter() - start
+
+    print(f"settings: {n_reads} reads of a boolean")
+    print(f"  get_boolean  {gsettings / n_reads * 1e9:.0f} ns per read")
+    if cached is not None:
+        print(f"  cached       {cache / n_reads * 1e9:.0f} ns per read")
+
+
+@benchmark
+def bench_workspace(n_terminals=100, n_switches=20):
+    """Switch between a workspace of `n_terminals` tabs and an empty one"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    manager = g.notebook_manager
+    nb = g.get_notebook()
+    while nb.get_n_pages() < n_terminals:
+        nb.new_page()
+    manager.get_notebook(1)
+
+    start = time.monotonic()
+    for i in range(n_switches):
+        manager.set_workspace((i + 1) % 2)
+    switched = time.monotonic() - start
+    profiles = getattr(g, "terminal_profiles", None)
+
+    start = time.monotonic()
+    g.load_config()
+    loaded = time.monotonic() - start
+
+    print(f"workspace: {n_switches} switches, {len(manager.get_terminals())} terminals")
+    print(f"  per switch            {switched / n_switches * 1000:.1f} ms")
+    print(f"  load_config           {loaded * 1000:.1f} ms")
+    if profiles is not None:
+        print(f"  profiles built        {profiles.builds}")
+        print(f"  properties applied    {profiles.applied}")
+
+
+@benchmark
+def bench_compat(n_runs=20):
+    """Cost of the check for settings of old Guake versions, run at every start"""
+    import subprocess  # pylint: disable=import-outside-toplevel
+
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        # What every start used to do
+        subprocess.check_output(["dconf", "dump", "/org/guake/"])
+    dconf = time.perf_counter() - start
+
+    g.settings.compat()
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        g.settings.compat()
+    compat = time.perf_counter() - start
+
+    from guake.settings import export_settings  # pylint: disable=import-outside-toplevel
+
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        export_settings(g.settings.schema_source)
+    export = time.perf_counter() - start
+
+    print(f"compat: {n_runs} runs")
+    print(f"  dconf dump /org/guake/        {dconf / n_runs * 1000:.2f} ms")
+    print(f"  Settings.compat, once done    {compat / n_runs * 1000:.2f} ms")
+    print(f"  in-process export             {export / n_runs * 1000:.2f} ms")
+
+
+@benchmark
+def bench_toggle(n_runs=10):
+    """Latency of `guake -t` sent to a running Guake, with and without the fast client"""
+    import os  # pylint: disable=import-outside-toplevel
+    import subprocess  # pylint: disable=import-outside-toplevel
+
+    from guake.dbusiface import DbusManager  # pylint: disable=import-outside-toplevel
+
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    DbusManager(g)
+
+    def run(argv):
+        # The running Guake must keep serving D-Bus while the command waits
+        start = time.monotonic()
+        process = subprocess.Popen(argv, env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        run_main_loop_until(lambda: process.poll() is not None)
+        return time.monotonic() - start
+
+    fast = sum(run([sys.executable, "-m", "guake.client", "-t"]) for _ in range(n_runs))
+    # guake.main.main() is what `guake -t` always ran before
+    full_path = "import sys, guake.main; sys.argv = ['guake', '-t']; guake.main.main()"
+    full = sum(run([sys.executable, "-c", full_path]) for _ in range(n_runs))
+
+    print(f"toggle: {n_runs} runs")
+    print(f"  fast client       {fast / n_runs * 1000:.1f} ms")
+    print(f"  full command line {full / n_runs * 1000:.1f} ms")
+
+
+@benchmark
+def bench_layout(n_tabs=20):
+    """Create `n_tabs` tabs split in two, one call at a time or with apply_layout"""
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    directory = str(config_dir)
+
+    start = time.monotonic()
+    for i in range(n_tabs):
+        # What a script calling the D-Bus methods one by one does
+        g.add_tab(directory)
+        g.rename_current_tab(f"tab {i}", True)
+        g.get_notebook().get_current_terminal().get_parent().split_v(50)
+        g.execute_command("true")
+    run_main_loop_until(lambda: not Gtk.events_pending(), timeout=5)
+    one_by_one = time.monotonic() - start
+
+    layout = {
+        "tabs": [
+            {
+                "label": f"tab {i}",
+                "split": "vertical",
+                "panes": [{"directory": directory}, {"directory": directory, "command": "true"}],
+            }
+            for i in range(n_tabs)
+        ]
+    }
+    start = time.monotonic()
+    g.apply_layout(json.dumps(layout))
+    run_main_loop_until(lambda: not Gtk.events_pending(), timeout=5)
+    batch = time.monotonic() - start
+
+    print(f"layout: {n_tabs} tabs split in two")
+    print(f"  one call at a time  {one_by_one * 1000:.1f} ms")
+    print(f"  apply_layout        {batch * 1000:.1f} ms")
+
+
+def make_background_image(width=3840, height=2160):
+    import cairo  # pylint: disable=import-outside-toplevel
+
+    image = Path(tempfile.mkdtemp(prefix="guake-bench-")) / "background.png"
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(0.2, 0.4, 0.6)
+    cr.paint()
+    surface.write_to_png(str(image))
+    return image
+
+
+@benchmark
+def bench_background(n_frames=60):
+    """Draw frames alternating between two box sizes with a 4K background image"""
+    import cairo  # pylint: disable=import-outside-toplevel
+
+    from guake.utils import BackgroundImageManager  # pylint: disable=import-outside-toplevel
+    from guake.utils import ImageLayoutMode  # pylint: disable=import-outside-toplevel
+
+    image = make_background_image()
+
+    # Normal and fullscreen window, on the same monitor
+    sizes = [(1920, 540), (1920, 1080)]
+    print(f"background: {n_frames} frames, 4K image, box sizes {sizes}")
+    for label, entries in (("one rendered size", 1), ("cache", 4)):
+        manager = BackgroundImageManager(Gtk.Window(), cache_entries=entries)
+        manager.load_from_file(str(image))
+        run_main_loop_until(lambda: not manager.loading)
+        start = time.monotonic()
+        for frame in range(n_frames):
+            width, height = sizes[frame % len(sizes)]
+            target = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            cr = cairo.Context(target)
+            cr.set_source_surface(manager.render_target(width, height, ImageLayoutMode.SCALE))
+            cr.paint()
+        duration = time.monotonic() - start
+        print(
+            f"  {label:18s} {duration / n_frames * 1000:.2f} ms/frame, "
+            f"{manager.cache_bytes / 1024 / 1024:.1f} MiB cached"
+        )
+
+
+@benchmark
+def bench_background_draw(n_frames=200):
+    """Draw a tab without and with a background image, a whole frame or one line"""
+    import cairo  # pylint: disable=import-outside-toplevel
+
+    config_dir = Path(tempfile.mkdtemp(prefix="guake-bench-"))
+    g = make_guake(config_dir)
+    g.show()
+    run_main_loop_until(lambda: not Gtk.events_pending(), timeout=5)
+    box = g.get_notebook().get_nth_page(0)
+    line_height = box.get_terminals()[0].get_char_height()
+    width, height = box.get_allocated_width(), box.get_allocated_height()
+    manager = g.background_image_manager
+    image = make_background_image()
+
+    print(f"background draw: {n_frames} frames of {width}x{height}, 4K image")
+    for label, filename, clip_height in (
+        ("no image, frame", "", height),
+        ("no image, line", "", line_height),
+        ("image, frame", str(image), height),
+        ("image, line", str(image), line_height),
+    ):
+        manager.load_from_file(filename)
+        run_main_loop_until(lambda: not manager.loading)
+        stats = manager.frame_stats["image" if filename else "plain"]
+        stats.reset()
+        for _ in range(n_frames):
+            cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height))
+            cr.rectangle(0, height - clip_height, width, clip_height)
+            cr.clip()
+            box.draw(cr)
+        print(
+            f"  {label:16s} {stats.mean * 1000:.3f} ms/frame "
+            f"(longest {stats.longest * 1000:.3f} ms)"
+        )
+
+
+@benchmark
+def bench_background_load():
+    """Load an 8K background image while the main loop runs"""
+    from guake.utils import BackgroundImageManager  # pylint: disable=import-outside-toplevel
+
+    image = make_background_image(7680, 4320)
+    manager = BackgroundImageManager(Gtk.Window())
+    monitor = StallMonitor()
+    start = time.monotonic()
+    manager.load_from_file(str(image))
+    run_main_loop_until(lambda: not manager.loading)
+    duration = time.monotonic() - start
+    monitor.stop()
+
+    surface = manager.bg_surface
+    memory = manager.get_memory_usage()["image"] / 1024 / 1024
+    print("background load: 7680x4320 image")
+    print(f"  loaded in {duration * 1000:.1f} ms, longest stall {monitor.longest * 1000:.1f} ms")
+    print(f"  decoded at {surface.get_width()}x{surface.get_height()}, {memory:.1f} MiB")
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name}, choose from: {', '.join(BENCHMARKS)}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])